@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -29,11 +30,51 @@ METRICS_SERVICE_HOST = os.getenv("METRICS_SERVICE_HOST", "localhost:8080")
 METRICS_SERVICE_API_KEY = os.getenv("METRICS_SERVICE_API_KEY", "")
 DPS_TEAM_NAME = os.getenv("DPS_TEAM_NAME", "AIM")
 
+# Query execution settings
+QUERY_EXECUTOR_MAX_WORKERS = int(os.getenv("QUERY_EXECUTOR_MAX_WORKERS", 8))
+
+# Selector settings
+SELECTOR_DEBOUNCE_MILLISECONDS = int(os.getenv("SELECTOR_DEBOUNCE_MILLISECONDS", 300))
+SELECTOR_MAX_OPTIONS = int(os.getenv("SELECTOR_MAX_OPTIONS", 1000))
+DISTINCT_FIELDS_VERSION_CHECK_SECONDS = int(os.getenv("DISTINCT_FIELDS_VERSION_CHECK_SECONDS", 300))
+
 # Redis settings
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = os.getenv("REDIS_PORT", 6379)
+REDIS_NAMESPACE = os.getenv("REDIS_NAMESPACE", "tp4")
+REDIS_DELETE_BATCH_SIZE = 1000
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 20))
+REDIS_POOL_TIMEOUT_SECONDS = int(os.getenv("REDIS_POOL_TIMEOUT_SECONDS", 5))
+REDIS_HEALTH_CHECK_INTERVAL_SECONDS = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL_SECONDS", 30))
 DATAFRAME_EXPIRY_SECONDS = 604800 # 7 Days
 FILTERS_EXPIRY_SECONDS = 86400 # 1 Day
+DATAFRAME_CACHE_COMPRESSION = os.getenv("DATAFRAME_CACHE_COMPRESSION", "lz4")
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+RESULT_CACHE_EXPIRY_SECONDS = int(os.getenv("RESULT_CACHE_EXPIRY_SECONDS", DATAFRAME_EXPIRY_SECONDS))
+DATAFRAME_CACHE_CHUNK_BYTES = int(os.getenv("DATAFRAME_CACHE_CHUNK_BYTES", 4 * 1024 * 1024))
+
+# Plot settings
+DOWNSAMPLING_METHOD = os.getenv("DOWNSAMPLING_METHOD", "lttb")
+RASTERIZE_THRESHOLD = int(os.getenv("RASTERIZE_THRESHOLD", 20000))
+DATATABLE_PAGE_SIZE = int(os.getenv("DATATABLE_PAGE_SIZE", 100))
+TABULATOR_PAGE_CACHE_SIZE = int(os.getenv("TABULATOR_PAGE_CACHE_SIZE", 32))
+
+# Projection settings
+PROJECTION_CACHE_MAX_ENTRIES = int(os.getenv("PROJECTION_CACHE_MAX_ENTRIES", 64))
+PROJECTION_MODEL_CACHE_MAX_ENTRIES = int(os.getenv("PROJECTION_MODEL_CACHE_MAX_ENTRIES", 8))
+PROJECTION_PRECOMPUTE = os.getenv("PROJECTION_PRECOMPUTE", "0") == "1"
+PROJECTION_PROCESS_POOL_MAX_WORKERS = int(os.getenv("PROJECTION_PROCESS_POOL_MAX_WORKERS", 2))
+PROJECTION_REFIT_APPENDED_RATIO = float(os.getenv("PROJECTION_REFIT_APPENDED_RATIO", 0.2))
+PROJECTION_REFIT_DRIFT = float(os.getenv("PROJECTION_REFIT_DRIFT", 0.5))
+
+# Baseline settings
+BASELINE_PROCESS_POOL_MAX_WORKERS = int(os.getenv("BASELINE_PROCESS_POOL_MAX_WORKERS", 4))
+BASELINE_SERIES_PER_TASK = int(os.getenv("BASELINE_SERIES_PER_TASK", 500))
+BASELINE_CACHE_MAX_ENTRIES = int(os.getenv("BASELINE_CACHE_MAX_ENTRIES", 10000))
+
+# Shared datasets settings
+DATASET_CACHE_DIR = os.getenv("DATASET_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tp4_datasets"))
+DATASET_USE_FEATHER = os.getenv("DATASET_USE_FEATHER", "1") == "1"
 
 # COLORS
 palette = ["#084594", "#2171b5"]
@@ -21,8 +21,8 @@ from TP4.utils.formatters import (
     SIMPLE_BARPLOT_FORMATTER,
     STACKED_BARPLOT_FORMATTER,
     currency_mapper,
-    format_label,
-    format_label_euro,
+    format_labels,
+    format_labels_euro,
 )
 
 
@@ -116,11 +116,9 @@ class BasicBarPlot(BarPlot):
 
     def init_formatted_y(self):
         """
-        Format y axis of the BasicBarPlot using format_label() function
+        Format y axis of the BasicBarPlot using format_labels() function
         """
-        self.source.data["formatted_y"] = [
-            format_label(float(x)) for x in self.source.data["y"]
-        ]
+        self.source.data["formatted_y"] = format_labels(self.source.data["y"])
 
     def make_figure(self):
         """
@@ -350,11 +348,9 @@ class OverlappingBarplot(BarPlot):
 
     def init_formatted_y(self):
         """
-        Format y axis of the OverlappingBarplot using format_label() function
+        Format y axis of the OverlappingBarplot using format_labels() function
         """
-        self.source.data["formatted_y"] = [
-            format_label(x) + "€" for x in self.source.data["front"]
-        ]
+        self.source.data["formatted_y"] = format_labels(self.source.data["front"]) + "€"
 
     def make_figure(self):
         """
@@ -567,9 +563,7 @@ class DYABarPlot(BarPlot):
             (i2021 - i2020)
             for i2021, i2020 in zip(self.source.data["current"], self.source.data["yag"])
         ]
-        self.source.data["formatted_dya"] = [
-            format_label_euro(x) for x in self.source.data["dya_value"]
-        ]
+        self.source.data["formatted_dya"] = format_labels_euro(self.source.data["dya_value"])
         self.source.data["color"] = self.init_color_list(threshold=0)
 
     def init_color_list(self, threshold):
@@ -4,7 +4,7 @@ from bokeh.models import ColumnDataSource, HoverTool, LabelSet, Rect
 from bokeh.plotting import figure
 
 from TP4.modules.barplots.base_barplot import BarPlot
-from TP4.utils.formatters import NEW_Y_AXIS_FORMATTER, format_label
+from TP4.utils.formatters import NEW_Y_AXIS_FORMATTER, format_labels
 
 
 class OverlappingBarplot(BarPlot):
@@ -54,11 +54,9 @@ class OverlappingBarplot(BarPlot):
 
     def init_formatted_y(self):
         """
-        Format y axis of the OverlappingBarplot using format_label() function
+        Format y axis of the OverlappingBarplot using format_labels() function
         """
-        self.source.data["formatted_y"] = [
-            format_label(x) + "€" for x in self.source.data["front"]
-        ]
+        self.source.data["formatted_y"] = format_labels(self.source.data["front"]) + "€"
 
     def make_figure(self):
         """
@@ -4,7 +4,7 @@ from bokeh.models import ColumnDataSource, HoverTool, LabelSet
 from bokeh.plotting import figure
 
 from TP4.modules.barplots.base_barplot import BarPlot
-from TP4.utils.formatters import NEW_Y_AXIS_FORMATTER, format_label
+from TP4.utils.formatters import NEW_Y_AXIS_FORMATTER, format_labels
 
 
 class SimpleBarPlot(BarPlot):
@@ -36,11 +36,9 @@ class SimpleBarPlot(BarPlot):
 
     def init_formatted_y(self):
         """
-        Format y axis of the BasicBarPlot using format_label() function
+        Format y axis of the BasicBarPlot using format_labels() function
         """
-        self.source.data["formatted_y"] = [
-            format_label(float(x)) for x in self.source.data["y"]
-        ]
+        self.source.data["formatted_y"] = format_labels(self.source.data["y"])
 
     def make_figure(self):
         """
@@ -4,7 +4,7 @@ from bokeh.models import ColumnDataSource, HoverTool, LabelSet, Span
 from bokeh.plotting import figure
 
 from TP4.modules.barplots.base_barplot import BarPlot
-from TP4.utils.formatters import NEW_Y_AXIS_FORMATTER, format_label_euro
+from TP4.utils.formatters import NEW_Y_AXIS_FORMATTER, format_labels_euro
 
 
 class WaterfallComparisonBarPlot(BarPlot):
@@ -40,9 +40,7 @@ class WaterfallComparisonBarPlot(BarPlot):
             (front - back)
             for front, back in zip(self.source.data["front"], self.source.data["back"])
         ]
-        self.source.data["formatted_y2"] = [
-            format_label_euro(x) for x in self.source.data["comparison_value"]
-        ]
+        self.source.data["formatted_y2"] = format_labels_euro(self.source.data["comparison_value"])
         self.source.data["label_pos"] = [x if x > 0 else 0 for x in self.source.data["comparison_value"]]
         self.source.data["color"] = self.init_color_list(threshold=0)
 
@@ -1,5 +1,7 @@
+import asyncio
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import partial
 
 import pandas as pd
 import panel as pn
@@ -20,9 +22,11 @@ from TP4.utils.config_spinner import LoadingStyler
 from TP4.utils.formatters import currency_mapper, currency_y_axis_formatter
 from TP4.utils.gcp import (
     get_dashboard_identifier_from_session,
-    get_redis
+    get_redis,
+    set_values_to_redis,
 )
 from TP4.utils.notifications import success_notification, warning_notification
+from TP4.utils.result_cache import get_result_cache_key, result_cache
 
 
 class BaseDashboard(param.Parameterized):
@@ -37,6 +41,13 @@ class BaseDashboard(param.Parameterized):
     save_filters = param.Action(label="SAVE FILTERS", doc="Saves the filters")
     reset_filters = param.Action(label="RESET FILTERS AND RELOAD PAGE", doc="Resets the filters")
 
+    # Set to False in dashboards whose get_data has side effects, to always run the queries
+    cache_results = True
+    # Set to True to update the panels of the query plan independently, without blocking the event loop
+    progressive_refresh = False
+    # Set to True to get the data without blocking the event loop, a new refresh cancels the running one
+    async_refresh = False
+
     def __init__(self, **params):
         """
         Constructor of the BaseDashboard
@@ -45,6 +56,8 @@ class BaseDashboard(param.Parameterized):
         super().__init__(**params)
         self.first = True
         self.no_data_warning = False
+        self._refresh_task = None
+        self._refresh_generation = 0
         self.init_currency()
 
         self.refresh_data = self._refresh_data
@@ -69,6 +82,142 @@ class BaseDashboard(param.Parameterized):
         """
         raise
 
+    def get_query_plan(self):
+        """
+        Function to be overrided to declare the queries of each panel, instead of get_data() and update_plot()
+        :return: QueryPlan, or None to use get_data() and update_plot()
+        """
+        return None
+
+    def on_panel_update_error(self, panel, e):
+        if ENV == ENV_LOCAL:
+            raise e
+        warning_notification("No data is available for this selection")
+
+    async def _execute_query_plan_progressively(self, query_plan, filters):
+        """
+        Incremental refresh : the queries are awaited and every panel is updated as soon as its own data arrives,
+        so the time to the first chart is the one of the fastest query
+        """
+        self._refresh_task = asyncio.current_task()
+        try:
+            results = await query_plan.execute_async(filters, on_error=self.on_panel_update_error,
+                                                     run=self.run_cached_query)
+        except asyncio.CancelledError:
+            logger.info("refresh superseded by a newer one")
+            return
+        except Exception as e:
+            logger.error(f"Error refreshing the data: {str(e)}")
+            self._refresh_task = None
+            pn.state.execute(partial(self.on_panel_update_error, None, e), schedule=True)
+            return
+        self._refresh_task = None
+        pn.state.execute(partial(self.show_hide_no_data_warning_pop_up, list(results.values()),
+                                 self.one_dashboard_error), schedule=True)
+
+    def cancel_refresh(self):
+        """
+        Cancel the running asynchronous refresh, its results will not be shown
+        """
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+        self._refresh_task = None
+
+    async def _refresh_data_async(self, generation, filters):
+        """
+        Asynchronous refresh : the data is awaited without blocking the event loop and the plots are updated on
+        the next tick, unless a newer refresh was launched or the filters changed in the meantime
+        """
+        self._refresh_task = asyncio.current_task()
+        pn.state.execute(partial(setattr, self, "loading", True), schedule=True)
+        try:
+            data = await self.get_data_async(filters)
+            if generation != self._refresh_generation:
+                logger.info("refresh superseded by a newer one")
+            elif self.selector.get_filters() != filters:
+                logger.info("refresh superseded by a filter change")
+            else:
+                pn.state.execute(partial(self.update_plot_with_data, data), schedule=True)
+        except asyncio.CancelledError:
+            logger.info("refresh superseded by a newer one")
+        except Exception as e:
+            logger.error(f"Error refreshing the data: {str(e)}")
+            pn.state.execute(partial(self.on_panel_update_error, None, e), schedule=True)
+        finally:
+            # A newer refresh owns the spinner
+            if generation == self._refresh_generation:
+                pn.state.execute(partial(setattr, self, "loading", False), schedule=True)
+                self._refresh_task = None
+
+    def get_result_cache_key(self, filters):
+        """
+        :param filters: filters given to get_data
+        :return: key identifying the result of get_data for these filters, the tenant, the currency and the
+            current version of the table
+        """
+        cpg_class = getattr(self, "cpg_class", None)
+        return get_result_cache_key(
+            dashboard=f"{type(self).__module__}.{type(self).__qualname__}",
+            tenant_id=getattr(cpg_class, "tenant_id", None),
+            project_id=getattr(cpg_class, "project_id", None),
+            cpg_company=getattr(cpg_class, "cpg_company", None),
+            cpg_country=getattr(cpg_class, "cpg_country", None),
+            cpg_table=getattr(cpg_class, "cpg_table", None),
+            taxonomy=getattr(self.BQHandler, "taxonomy", None),
+            currency=self.currency_query,
+            last_modification=getattr(self.BQHandler, "last_modification", None),
+            filters=filters,
+        )
+
+    def get_result_cache_tags(self):
+        """
+        :return: tags of the cached results of this dashboard, used for targeted invalidation
+        """
+        cpg_class = getattr(self, "cpg_class", None)
+        return {
+            "tenant": getattr(cpg_class, "tenant_id", None),
+            "table": getattr(cpg_class, "cpg_table", None),
+            "country": getattr(cpg_class, "cpg_country", None),
+            "dashboard": f"{type(self).__module__}.{type(self).__qualname__}",
+        }
+
+    def get_cached_data(self, filters):
+        """
+        Get the data from the result cache, or using get_data() on a miss
+        :param filters: filters given to get_data
+        :return: the result of get_data
+        """
+        if not self.cache_results:
+            return self.get_data(filters)
+        key = self.get_result_cache_key(filters)
+        data = result_cache.get(key)
+        if data is None:
+            data = self.get_data(filters)
+            result_cache.set(key, data, tags=self.get_result_cache_tags())
+        else:
+            logger.info("data retrieved from the result cache")
+        return data
+
+    def run_cached_query(self, node, filters, dependency_results):
+        """
+        Run a query of the query plan through the result cache, like get_cached_data for get_data()
+        :param node: QueryNode
+        :param filters: filters given to the query
+        :param dependency_results: results of the queries it depends on
+        :return: the result of the query
+        """
+        query_key = node.get_cache_key()
+        if not self.cache_results or query_key is None:
+            return node.run(filters, dependency_results)
+        key = get_result_cache_key(data=self.get_result_cache_key(filters), query=query_key)
+        data = result_cache.get(key)
+        if data is None:
+            data = node.run(filters, dependency_results)
+            result_cache.set(key, data, tags=self.get_result_cache_tags())
+        else:
+            logger.info("query result retrieved from the result cache")
+        return data
+
     def get_settings_panel(self):
         """
         :return: settings of the current dashboard panel
@@ -120,8 +269,7 @@ class BaseDashboard(param.Parameterized):
         print(f"Here are the filters before save {filters}")
         key = self.get_filter_redis_key()
         string_json = json.dumps(filters)
-        r = get_redis()
-        r.set(key, string_json, ex=timedelta(FILTERS_EXPIRY_SECONDS))
+        set_values_to_redis({key: string_json}, get_redis(), FILTERS_EXPIRY_SECONDS, tags={"filters": "user"})
         success_notification("Filters have been saved")
 
     def flush_redis_choice_and_reset_filters(self, *_):
@@ -154,8 +302,7 @@ class BaseDashboard(param.Parameterized):
     def set_user_filters(self, filters):
         key = self.get_filter_redis_key()
         string_json = json.dumps(filters)
-        r = get_redis()
-        r.set(key, string_json, ex=timedelta(FILTERS_EXPIRY_SECONDS))
+        set_values_to_redis({key: string_json}, get_redis(), FILTERS_EXPIRY_SECONDS, tags={"filters": "user"})
 
     def no_data_notification_initialisation(self):
         if self.no_data_warning:
@@ -210,17 +357,26 @@ class BaseDashboard(param.Parameterized):
 
         # timestamp() returns time in nanos
         start_time_in_millis = int(datetime.utcnow().timestamp() * 1000)
-        data = self.get_data(self.filters)
-        data_load_time = int(datetime.utcnow().timestamp() * 1000) - start_time_in_millis
-
-        do_update = self.show_hide_no_data_warning_pop_up(data, self.one_dashboard_error)
-        try:
-            if do_update or self.all_valid:
-                self.update_plot(data)
-        except Exception as e:
-            if ENV == ENV_LOCAL:
-                raise e
-            warning_notification("No data is available for this selection")
+        query_plan = self.get_query_plan()
+        if query_plan is not None and self.progressive_refresh:
+            # Does not block the event loop, each panel is shown with its own spinner until its data arrives
+            self.cancel_refresh()
+            pn.state.execute(partial(self._execute_query_plan_progressively, query_plan, self.filters))
+        elif query_plan is not None:
+            # The panels are updated as soon as their own queries are done
+            data = list(query_plan.execute(self.filters, on_error=self.on_panel_update_error,
+                                           run=self.run_cached_query).values())
+            data_load_time = int(datetime.utcnow().timestamp() * 1000) - start_time_in_millis
+            self.show_hide_no_data_warning_pop_up(data, self.one_dashboard_error)
+        elif self.async_refresh:
+            # The queries run on the query executor, a new refresh supersedes this one
+            self.cancel_refresh()
+            self._refresh_generation += 1
+            pn.state.execute(partial(self._refresh_data_async, self._refresh_generation, self.filters))
+        else:
+            data = self.get_cached_data(self.filters)
+            data_load_time = int(datetime.utcnow().timestamp() * 1000) - start_time_in_millis
+            self.update_plot_with_data(data)
 
         # --------------------------------------------------------------------------
         # IMPORTANT:
@@ -241,6 +397,22 @@ class BaseDashboard(param.Parameterized):
 
         return True
 
+    def update_plot_with_data(self, data):
+        do_update = self.show_hide_no_data_warning_pop_up(data, self.one_dashboard_error)
+        try:
+            if do_update or self.all_valid:
+                self.update_plot(data)
+        except Exception as e:
+            self.on_panel_update_error(None, e)
+
+    async def get_data_async(self, filters):
+        """
+        Function which can be overrided with a coroutine getting the data without blocking the event loop,
+        by default get_data() is run on the default executor of the event loop. Not on the query executor :
+        get_data() submits its own queries there and would wait on them from one of its threads
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_cached_data, filters)
+
     def show_hide_no_data_warning_pop_up(self, data, one_dashboard_error=False):
         do_update = True
         if isinstance(data, dict):
@@ -302,6 +474,11 @@ class BaseMeasurementDashboard(param.Parameterized):
     loading = param.Boolean(default=False, doc="Whether or not to show the spinner")
     refresh_data = param.Action(label="REFRESH DATA", doc="Refreshes the data")
 
+    # Set to True to update the panels of the query plan independently, without blocking the event loop
+    progressive_refresh = False
+    # Set to True to get the data without blocking the event loop, a new refresh cancels the running one
+    async_refresh = False
+
     def __init__(self, data_init=True, **params):
         """
         Constructor of the BaseDashboard
@@ -310,6 +487,8 @@ class BaseMeasurementDashboard(param.Parameterized):
         super().__init__(**params)
         self.first = True
         self.no_data_warning = False
+        self._refresh_task = None
+        self._refresh_generation = 0
         self.data_init = data_init
 
         self.refresh_data = self._refresh_data
@@ -326,6 +505,71 @@ class BaseMeasurementDashboard(param.Parameterized):
         """
         raise
 
+    def get_query_plan(self):
+        """
+        Function to be overrided to declare the queries of each panel, instead of get_data() and update_plot()
+        :return: QueryPlan, or None to use get_data() and update_plot()
+        """
+        return None
+
+    def on_panel_update_error(self, panel, e):
+        if ENV == ENV_LOCAL:
+            raise e
+        warning_notification("No data is available for this selection")
+
+    async def _execute_query_plan_progressively(self, query_plan, filters):
+        """
+        Incremental refresh : the queries are awaited and every panel is updated as soon as its own data arrives,
+        so the time to the first chart is the one of the fastest query
+        """
+        self._refresh_task = asyncio.current_task()
+        try:
+            results = await query_plan.execute_async(filters, on_error=self.on_panel_update_error)
+        except asyncio.CancelledError:
+            logger.info("refresh superseded by a newer one")
+            return
+        except Exception as e:
+            logger.error(f"Error refreshing the data: {str(e)}")
+            self._refresh_task = None
+            pn.state.execute(partial(self.on_panel_update_error, None, e), schedule=True)
+            return
+        self._refresh_task = None
+        pn.state.execute(partial(self.show_hide_no_data_warning_pop_up, list(results.values())), schedule=True)
+
+    def cancel_refresh(self):
+        """
+        Cancel the running asynchronous refresh, its results will not be shown
+        """
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+        self._refresh_task = None
+
+    async def _refresh_data_async(self, generation, filters):
+        """
+        Asynchronous refresh : the data is awaited without blocking the event loop and the plots are updated on
+        the next tick, unless a newer refresh was launched or the filters changed in the meantime
+        """
+        self._refresh_task = asyncio.current_task()
+        pn.state.execute(partial(setattr, self, "loading", True), schedule=True)
+        try:
+            data = await self.get_data_async(filters)
+            if generation != self._refresh_generation:
+                logger.info("refresh superseded by a newer one")
+            elif self.selector.get_filters() != filters:
+                logger.info("refresh superseded by a filter change")
+            else:
+                pn.state.execute(partial(self.update_plot_with_data, data), schedule=True)
+        except asyncio.CancelledError:
+            logger.info("refresh superseded by a newer one")
+        except Exception as e:
+            logger.error(f"Error refreshing the data: {str(e)}")
+            pn.state.execute(partial(self.on_panel_update_error, None, e), schedule=True)
+        finally:
+            # A newer refresh owns the spinner
+            if generation == self._refresh_generation:
+                pn.state.execute(partial(setattr, self, "loading", False), schedule=True)
+                self._refresh_task = None
+
     def get_settings_panel(self):
         """
 
@@ -401,13 +645,25 @@ class BaseMeasurementDashboard(param.Parameterized):
 
         # timestamp() returns time in nanos
         start_time_in_millis = int(datetime.utcnow().timestamp() * 1000)
-        data = self.get_data(self.filters)
-        data_load_time = int(datetime.utcnow().timestamp() * 1000) - start_time_in_millis
-
-        do_update = self.show_hide_no_data_warning_pop_up(data)
-        if do_update:
-            # self.get_currency_symbol(self.BQHandler)
-            self.update_plot(data)
+        query_plan = self.get_query_plan()
+        if query_plan is not None and self.progressive_refresh:
+            # Does not block the event loop, each panel is shown with its own spinner until its data arrives
+            self.cancel_refresh()
+            pn.state.execute(partial(self._execute_query_plan_progressively, query_plan, self.filters))
+        elif query_plan is not None:
+            # The panels are updated as soon as their own queries are done
+            data = list(query_plan.execute(self.filters, on_error=self.on_panel_update_error).values())
+            data_load_time = int(datetime.utcnow().timestamp() * 1000) - start_time_in_millis
+            self.show_hide_no_data_warning_pop_up(data)
+        elif self.async_refresh:
+            # The queries run on the query executor, a new refresh supersedes this one
+            self.cancel_refresh()
+            self._refresh_generation += 1
+            pn.state.execute(partial(self._refresh_data_async, self._refresh_generation, self.filters))
+        else:
+            data = self.get_data(self.filters)
+            data_load_time = int(datetime.utcnow().timestamp() * 1000) - start_time_in_millis
+            self.update_plot_with_data(data)
 
         # --------------------------------------------------------------------------
         # IMPORTANT:
@@ -427,6 +683,20 @@ class BaseMeasurementDashboard(param.Parameterized):
 
         return True
 
+    def update_plot_with_data(self, data):
+        do_update = self.show_hide_no_data_warning_pop_up(data)
+        if do_update:
+            # self.get_currency_symbol(self.BQHandler)
+            self.update_plot(data)
+
+    async def get_data_async(self, filters):
+        """
+        Function which can be overrided with a coroutine getting the data without blocking the event loop,
+        by default get_data() is run on the default executor of the event loop. Not on the query executor :
+        get_data() submits its own queries there and would wait on them from one of its threads
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_data, filters)
+
     def show_hide_no_data_warning_pop_up(self, data):
         do_update = True
         if isinstance(data, dict):
@@ -1,8 +1,11 @@
+import numpy as np
+import pandas as pd
 import panel as pn
 import param
 from bokeh.models import ColumnDataSource
 
 from TP4.modules.panel_text import PanelText
+from TP4.utils.debounce import Debouncer
 
 
 class BasePlot(param.Parameterized):
@@ -29,3 +32,81 @@ class BasePlot(param.Parameterized):
         else:
             panel = pn.Column(self.figure, sizing_mode="stretch_both")
         return panel
+
+    @staticmethod
+    def to_array(values):
+        """
+        :param values: pandas series, list or numpy array
+        :return: numpy array, sent with the binary array encoding of Bokeh when it is numerical
+        """
+        if isinstance(values, (pd.Series, pd.Index)):
+            values = values.to_numpy()
+        values = np.asarray(values)
+        if values.ndim > 1:
+            # e.g. a single column selected from a dataframe with multi-level columns
+            values = values.reshape(len(values), -1)[:, 0]
+        return values
+
+    def set_source_data(self, **columns):
+        """
+        Replace the data of the source, the columns are given as numpy arrays rather than lists
+        :param columns: name of the column in the source = values
+        """
+        self.source.data = {key: self.to_array(values) for key, values in columns.items()}
+
+    def stream_source_data(self, rollover=None, **columns):
+        """
+        Append rows to the source, only the new rows are sent to the browser
+        :param rollover: maximum number of rows kept in the source
+        :param columns: name of the column in the source = values of the new rows
+        """
+        self.source.stream({key: self.to_array(values) for key, values in columns.items()}, rollover=rollover)
+
+    @staticmethod
+    def get_constant_array(value, length):
+        return np.full(length, value)
+
+    @staticmethod
+    def get_label_array(values):
+        """
+        :return: numpy array of the values as strings
+        """
+        return BasePlot.to_array(values).astype(str).astype(object)
+
+    @staticmethod
+    def get_threshold_colors(values, threshold, color_below, color_above):
+        """
+        :return: numpy array of colors, color_below for the values under threshold, else color_above
+        """
+        return np.where(BasePlot.to_array(values) < threshold, color_below, color_above).astype(object)
+
+    @staticmethod
+    def get_categorical_colors(values, palette):
+        """
+        :param values: categories of the points
+        :param palette: list of colors, given to the categories in sorted order
+        :return: numpy array of colors, one per value
+        """
+        codes, _ = pd.factorize(BasePlot.to_array(values), sort=True)
+        return np.asarray(palette, dtype=object)[codes % len(palette)]
+
+    @staticmethod
+    def map_unique(values, function):
+        """
+        Apply a scalar function, e.g. a label formatter, once per distinct value instead of once per value
+        :return: numpy array of the results
+        """
+        uniques, inverse = np.unique(BasePlot.to_array(values), return_inverse=True)
+        return np.asarray([function(value) for value in uniques], dtype=object)[inverse]
+
+    def watch_visible_range(self, callback, ranges=None):
+        """
+        Call callback once the user stopped panning or zooming, e.g. to recompute the data at the new resolution
+        :param callback: function without argument, reading the start and end of the ranges itself
+        :param ranges: bokeh ranges to watch, the x range of the figure by default
+        """
+        ranges = [self.figure.x_range] if ranges is None else ranges
+        self.range_debouncer = Debouncer(lambda events: callback())
+        for bokeh_range in ranges:
+            bokeh_range.on_change("start", lambda attr, old, new: self.range_debouncer.trigger(new))
+            bokeh_range.on_change("end", lambda attr, old, new: self.range_debouncer.trigger(new))
@@ -1,7 +1,9 @@
 import datetime
 import os
 import re
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 
 import pandas as pd
 import panel as pn
@@ -9,9 +11,14 @@ import param
 from bokeh.models import ColumnDataSource
 from panel.io.loading import start_loading_spinner, stop_loading_spinner
 
+from TP4.constants.constants import SELECTOR_MAX_OPTIONS
 from TP4.modules.base.cpg import CPG
+from TP4.modules.base.facet_index import FACET_INDEX_CACHE_SIZE, FacetIndex
 from TP4.modules.panel_text import PanelText
 from TP4.utils.config_spinner import LoadingStyler
+from TP4.utils.debounce import Debouncer
+from TP4.utils.distinct_fields_cache import distinct_fields_cache
+from TP4.utils.gcp import get_table_version_from_redis
 from TP4.utils.notifications import error_notification
 
 
@@ -144,6 +151,12 @@ class BaseDynamicSelector(BaseSelector):
     list_taxonomy_channel_field = ["supplier", "global_channel", "specific_channel", "sector", "department",
                                    "classes", "category", "sub_category", "brand", "unit_need"]
     list_intersect_channel_taxo = ["supplier", "global_channel", "specific_channel", "classes"]
+    # Fields with too many values to ship all of them to the browser : only the first SELECTOR_MAX_OPTIONS options
+    # are sent, the others are found with the search box of the field
+    list_search_field = ["item", "barcode"]
+    # Hierarchies of selection fields, e.g. [list_taxonomy_field] : a change of a field updates the options of the
+    # fields after it with update_field, once the user has stopped changing the fields of the hierarchy
+    cascade_fields = []
 
     def __init__(self, cpg_class: CPG = None, selection_fields=None, global_local_currency=True, **params):
         super().__init__(**params)
@@ -153,6 +166,18 @@ class BaseDynamicSelector(BaseSelector):
 
         self.global_local_currency = global_local_currency
 
+        # Facet indexes of the last distinct fields dataframes, built once per dataframe
+        self._facet_indexes = OrderedDict()
+        # Full list of the options of the search fields, kept on the server
+        self._search_field_options = {}
+        # Search fields whose search box is watched, set_selector_fields is called again by reset_fields
+        self._watched_search_fields = set()
+        # Debouncer of each watched hierarchy of cascade_fields
+        self._cascade_debouncers = {}
+        self._cascading = False
+        self.active_store_debouncer = Debouncer(lambda events: self.update_with_active_store())
+        self.param.watch(self.active_store_debouncer.trigger, ["is_active_store"])
+
         ### change AB
         self.time_selection_fields = {key: value for key, value in selection_fields.items() if "time" in key}
         self.selection_fields = self.format_selection_field(selection_fields)
@@ -312,13 +337,28 @@ class BaseDynamicSelector(BaseSelector):
 
         # labels have to be str:str or BigQuery complains
         labels = {"tenant_id": str(tenant_id)}
-        fields = read_gbq_gcp(query, labels=labels)
-        fields = fields.dropna()
+
+        def load():
+            return read_gbq_gcp(query, labels=labels).dropna()
+
+        # The distinct fields only depend on the query, they are shared by all the sessions until the table changes
+        key = distinct_fields_cache.get_key(cpg_table, self.cpg_country, partition_string, global_local, keys)
+        fields = distinct_fields_cache.get(key, load, lambda: self.get_table_version(cpg_table),
+                                           tags={"table": cpg_table, "country": self.cpg_country})
         return fields
 
+    def get_table_version(self, cpg_table):
+        """
+        :param cpg_table: table queried by get_distinct_fields
+        :return: version of the cached data of the table, changed when the cached entries of the table are
+            invalidated, None if it is unavailable
+        """
+        return get_table_version_from_redis(cpg_table)
+
     def init_fields_settings_panel(self):
         self.get_default_values()
         self.set_selector_fields()
+        self.watch_cascades()
         self.list_selector_fields = self.get_list_selector_fields()
         self.widget_selector_fields = self.get_widget_selector_fields()
 
@@ -371,6 +411,11 @@ class BaseDynamicSelector(BaseSelector):
                 self._add_parameter(key, param.ListSelector())
         for key in self.mono:
             self._add_parameter(key, param.ObjectSelector())
+        for key in self.get_search_fields():
+            self._add_parameter(self.get_search_parameter(key), param.String(default="", label=f"Search {key}"))
+            if key not in self._watched_search_fields:
+                self.param.watch(self.search_field_options, [self.get_search_parameter(key)])
+                self._watched_search_fields.add(key)
 
     def get_filters(self):
         filters = {}
@@ -390,6 +435,8 @@ class BaseDynamicSelector(BaseSelector):
         list_selector_fields = []
         for key, value in self.selection_fields.items():
             if "is_active_store" not in key:
+                if key in self.get_search_fields():
+                    list_selector_fields.append(self.get_search_parameter(key))
                 list_selector_fields.append(key)
         if self.only_mono:
             list_selector_fields.insert(0, "reset_button")
@@ -397,6 +444,24 @@ class BaseDynamicSelector(BaseSelector):
         return list_selector_fields
 
     def update_filters(self, df, filters):
+        # The mono selection fields without value are set one by one to their first available value,
+        # and the filters are checked again against the narrowed dataframe
+        while True:
+            right_filters, df = self.get_right_filters(df, filters)
+            missing_mono_key = None
+            for key, value in self.selection_fields.items():
+                if "time" not in key and "country" != key:
+                    if key in df.columns:
+                        if key not in right_filters.keys() and self.get_type_selection(key) == "mono":
+                            missing_mono_key = key
+                            break
+            if missing_mono_key is None:
+                return right_filters
+            right_filters[missing_mono_key] = df[missing_mono_key].iloc[0]
+            df = df[df[missing_mono_key] == right_filters[missing_mono_key]]
+            filters = right_filters
+
+    def get_right_filters(self, df, filters):
         right_filters = {}
         for key, value in filters.items():
             if key in self.selection_fields.keys():
@@ -404,10 +469,8 @@ class BaseDynamicSelector(BaseSelector):
                     param_selector_element = getattr(self.param, key)
                     if isinstance(value, list):
                         if len(value) > 0:
-                            new_value = []
-                            for i in value:
-                                if i in df[key].unique():
-                                    new_value.append(i)
+                            available_values = set(df[key].unique())
+                            new_value = [i for i in value if i in available_values]
                             df = df[df[key].isin(new_value)]
                             if self.get_type_selection(key) == "multi":
                                 right_filters[key] = new_value
@@ -424,7 +487,7 @@ class BaseDynamicSelector(BaseSelector):
                                     right_filters[key] = value
 
                     elif isinstance(value, str):
-                        if value in df[key].unique():
+                        if (df[key] == value).any():
                             if self.get_type_selection(key) == "multi":
                                 right_filters[key] = [value]
                                 df = df[df[key] == value]
@@ -432,15 +495,7 @@ class BaseDynamicSelector(BaseSelector):
                                 right_filters[key] = value
                                 df = df[df[key] == right_filters[key]]
 
-        for key, value in self.selection_fields.items():
-            if "time" not in key and "country" != key:
-                if key in df.columns:
-                    if key not in right_filters.keys() and self.get_type_selection(key) == "mono":
-                        right_filters[key] = list(df[key].unique())[0]
-                        df = df[df[key] == right_filters[key]]
-                        return self.update_filters(df, right_filters)
-
-        return right_filters
+        return right_filters, df
 
     def set_filters(self, filters):
         for key, value in filters.items():
@@ -489,6 +544,10 @@ class BaseDynamicSelector(BaseSelector):
                     widget_selector_fields[key] = {"type": button_type, "name": "Sub-sector", "sizing_mode": "fixed"}
                 else:
                     widget_selector_fields[key] = {"type": button_type, "sizing_mode": "fixed"}
+                if key in self.get_search_fields():
+                    widget_selector_fields[self.get_search_parameter(key)] = {
+                        "type": pn.widgets.TextInput, "placeholder": f"Search {key} (first {SELECTOR_MAX_OPTIONS} shown)",
+                        "sizing_mode": "fixed"}
 
         return widget_selector_fields
 
@@ -556,41 +615,126 @@ class BaseDynamicSelector(BaseSelector):
         parent_field_list = [i for i in list_field_parent if i not in list_field_to_update]
         dict_relevant_filters = {key: filters[key] for key in parent_field_list if key in filters.keys()}
 
-        df = self.get_df_from_field(list_field_parent[-1])
-        print("----- DF FROM FIELD ------")
-        print(df)
-        df = self.filter_df_with_dict(df, dict_relevant_filters)
-        print("----- DF ------")
-        print(df)
+        facet_index = self.get_facet_index(self.get_df_from_field(list_field_parent[-1]))
+        selections = {key: self.format_filter(value) for key, value in dict_relevant_filters.items()}
         for field_to_update in list_field_to_update:
             if self.check_if_item_in_selection_fields(field_to_update):
+                list_objects = facet_index.get_options(field_to_update, selections)
+                self.set_field_objects(field_to_update, list_objects)
                 try:
-                    list_objects = list(df[field_to_update].sort_values().unique())
-                    param_selector_element = getattr(self.param, field_to_update)
-                    param_selector_element.objects = list_objects
                     if self.get_type_selection(field_to_update) == "mono":
                         cur_value = getattr(self, field_to_update)
                         if cur_value not in list_objects:
                             cur_value = list_objects[0]
 
                         self.param.set_param(field_to_update, cur_value)
-                        df = df[df[field_to_update] == cur_value]
+                        selections[field_to_update] = [cur_value]
                     elif self.get_type_selection(field_to_update) == "multi":
                         if getattr(self, field_to_update) not in list_objects:
                             self.param.set_param(field_to_update, [])
                 except:
-                    list_objects = list(df[field_to_update].sort_values().unique())
-                    param_selector_element = getattr(self.param, field_to_update)
-                    param_selector_element.objects = list_objects
+                    pass
+
+    def watch_cascades(self):
+        """
+        Watch the hierarchies of cascade_fields, once : init_fields_settings_panel is called again by reset_fields
+        """
+        for fields in self.cascade_fields:
+            fields = [field for field in fields if self.check_if_item_in_selection_fields(field)]
+            if len(fields) < 2 or tuple(fields) in self._cascade_debouncers:
+                continue
+            debouncer = Debouncer(partial(self.run_cascade, fields))
+            self._cascade_debouncers[tuple(fields)] = debouncer
+            self.param.watch(partial(self.trigger_cascade, debouncer), fields[:-1])
+
+    def trigger_cascade(self, debouncer, *events):
+        # The fields set by the cascade itself do not trigger another one
+        if not self._cascading:
+            debouncer.trigger(*events)
+
+    def run_cascade(self, fields, events):
+        """
+        Update the fields after the first changed field of the hierarchy, once for all the coalesced changes
+        :param fields: hierarchy of selection fields
+        :param events: param events of the changed fields
+        """
+        changed = [fields.index(event.name) for event in events if event.name in fields]
+        if len(changed) == 0:
+            return
+        first = min(changed)
+        self._cascading = True
+        try:
+            self.update_field(fields[first + 1:], fields[:first + 1])
+        finally:
+            self._cascading = False
+
+    def get_facet_index(self, df):
+        """
+        :param df: distinct fields dataframe
+        :return: FacetIndex of the dataframe, built on the first call
+        """
+        entry = self._facet_indexes.get(id(df))
+        if entry is None or entry[0] is not df:
+            # The dataframe is kept with its index so that its id can not be reused by another dataframe
+            entry = (df, FacetIndex(df))
+            self._facet_indexes[id(df)] = entry
+            while len(self._facet_indexes) > FACET_INDEX_CACHE_SIZE:
+                self._facet_indexes.popitem(last=False)
+        self._facet_indexes.move_to_end(id(df))
+        return entry[1]
+
+    def get_search_fields(self):
+        return [key for key in self.list_search_field if key in self.selection_fields.keys()
+                and self.get_type_selection(key) == "multi"]
+
+    @staticmethod
+    def get_search_parameter(key):
+        return f"{key}_search"
+
+    def set_field_objects(self, key, list_objects, selected=None):
+        """
+        Set the options of a selection field. The options of the search fields are kept on the server and only the
+        selected values and the first SELECTOR_MAX_OPTIONS options matching the search are sent to the widget
+        :param key: selection field
+        :param list_objects: all the allowed values of the field
+        :param selected: values about to be selected, the current value of the field if None
+        """
+        param_selector_element = getattr(self.param, key)
+        if key not in self.get_search_fields():
+            param_selector_element.objects = list_objects
+            return
+        self._search_field_options[key] = pd.Series(list_objects, dtype=object)
+        param_selector_element.objects = self.get_search_page(key, getattr(self, self.get_search_parameter(key)),
+                                                              selected=selected)
+
+    def get_search_page(self, key, search, selected=None):
+        """
+        :param key: search field
+        :param search: prefix typed in the search box of the field, case insensitive
+        :param selected: values about to be selected, the current value of the field if None
+        :return: the selected values followed by the first SELECTOR_MAX_OPTIONS options starting with search
+        """
+        options = self._search_field_options.get(key, pd.Series([], dtype=object))
+        if search:
+            options = options[options.astype(str).str.lower().str.startswith(search.lower())]
+        if selected is None:
+            selected = getattr(self, key)
+        selected = self.format_filter(selected)
+        selected_set = set(selected)
+        page = [value for value in options.iloc[:SELECTOR_MAX_OPTIONS + len(selected)] if value not in selected_set]
+        return selected + page[:SELECTOR_MAX_OPTIONS]
+
+    def search_field_options(self, event):
+        key = event.name[:-len("_search")]
+        getattr(self.param, key).objects = self.get_search_page(key, event.new)
 
-    @param.depends("is_active_store", watch=True, on_init=False)
     def update_with_active_store(self):
         if "store" in self.selection_fields.keys():
-            df = self.get_df_from_field("store")
+            facet_index = self.get_facet_index(self.get_df_from_field("store"))
             if "ALL" in self.is_active_store:
-                self.param.store.objects = list(df["store"].unique())
+                self.set_field_objects("store", facet_index.get_options("store"))
             else:
-                self.param.store.objects = list(df[df["is_active_store"] == True]["store"].unique())
+                self.set_field_objects("store", facet_index.get_options("store", {"is_active_store": [True]}))
 
     @staticmethod
     def num_sort(test_string):
@@ -633,17 +777,17 @@ class BaseDynamicSelector(BaseSelector):
         return master_category
 
     def set_key_and_update_df(self, key, df):
+        # Sorted once, the distinct values are used for the default value and the options
+        list_unique = list(df[key].drop_duplicates().sort_values())
         if key in self.default_values.keys():
             try:
-                list_unique = list(df[key].sort_values().unique())
                 default_value = self.default_values[key]
                 default_value = [i for i in list_unique if default_value == i][0]
             except:
                 default_value = self.default_values[key]
         else:
-            default_value = list(df[key].sort_values().unique())[0]
-        param_selector_element = getattr(self.param, key)
-        param_selector_element.objects = list(df[key].sort_values().unique())
+            default_value = list_unique[0]
+        self.set_field_objects(key, list_unique, selected=None if default_value is False else [default_value])
         if default_value == False:
             return df
         df = df[df[key] == default_value]
@@ -688,9 +832,8 @@ class BaseDynamicSelector(BaseSelector):
                         elif self.has_default_selection(key):
                             df = self.set_key_and_update_df(key, df)
                         else:
-                            param_selector_element = getattr(self.param, key)
                             self.param.set_param(key, [])
-                            param_selector_element.objects = list(df[key].unique())
+                            self.set_field_objects(key, list(df[key].unique()))
 
         self.current_filters = self.get_filters()
 
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+FACET_OPTIONS_CACHE_SIZE = 256
+# Facet indexes kept by a selector, one per distinct fields dataframe in use
+FACET_INDEX_CACHE_SIZE = 8
+
+
+class FacetIndex(object):
+    """
+    Index of a distinct fields dataframe answering "allowed values of field X given the selections on the others"
+
+    Each field is encoded once as categorical codes over its sorted distinct values, with a posting list (the sorted
+    row numbers) per value. A selection is turned into a row mask by scattering the posting lists of the selected
+    values and intersecting the masks of the fields, and the allowed values of a field are the codes present in the
+    masked rows, which are already sorted. The option lists are cached per field and selection.
+    """
+
+    def __init__(self, df, fields=None):
+        """
+        :param df: pandas dataframe, typically the output of get_distinct_fields
+        :param fields: columns to index, all the columns if None
+        """
+        self.df = df
+        self.n_rows = len(df)
+        self.fields = list(fields) if fields is not None else list(df.columns)
+        self.codes = {}
+        self.categories = {}
+        self.category_positions = {}
+        self.postings = {}
+        for field in self.fields:
+            codes, categories = pd.factorize(df[field], sort=True)
+            codes = codes.astype(np.int32)
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(categories) + 1))
+            self.codes[field] = codes
+            self.categories[field] = np.asarray(categories, dtype=object)
+            self.category_positions[field] = {value: position for position, value in enumerate(categories)}
+            self.postings[field] = (order, bounds)
+        self._options_cache = OrderedDict()
+
+    def get_rows(self, field, values):
+        """
+        :return: sorted row numbers where field is one of the values
+        """
+        order, bounds = self.postings[field]
+        positions = self.category_positions[field]
+        rows = [order[bounds[positions[value]]:bounds[positions[value] + 1]] for value in values if value in positions]
+        if len(rows) == 0:
+            return np.array([], dtype=order.dtype)
+        return np.sort(np.concatenate(rows))
+
+    def get_mask(self, selections):
+        """
+        :param selections: dict {field: list of selected values}, empty lists and unknown fields are ignored
+        :return: boolean numpy array of the selected rows, None if nothing is selected
+        """
+        mask = None
+        for field, values in selections.items():
+            if field not in self.codes or values is None or len(values) == 0:
+                continue
+            field_mask = np.zeros(self.n_rows, dtype=bool)
+            field_mask[self.get_rows(field, values)] = True
+            mask = field_mask if mask is None else mask & field_mask
+        return mask
+
+    @staticmethod
+    def get_selection_key(field, selections):
+        return field, tuple(sorted((key, tuple(sorted(values, key=str))) for key, values in selections.items()
+                                   if key != field and values is not None and len(values) > 0))
+
+    def get_options(self, field, selections=None, exclude_own_field=True):
+        """
+        :param field: field of which the allowed values are wanted
+        :param selections: dict {field: list of selected values}
+        :param exclude_own_field: whether or not the selection on field itself is ignored
+        :return: sorted list of the values of field compatible with the selections
+        """
+        selections = dict(selections or {})
+        if exclude_own_field:
+            selections.pop(field, None)
+        key = self.get_selection_key(field, selections)
+        if not exclude_own_field and field in selections:
+            key = key + (tuple(sorted(selections[field], key=str)),)
+        if key in self._options_cache:
+            self._options_cache.move_to_end(key)
+            return list(self._options_cache[key])
+
+        mask = self.get_mask(selections)
+        codes = self.codes[field] if mask is None else self.codes[field][mask]
+        present = np.bincount(codes[codes >= 0], minlength=len(self.categories[field])) > 0
+        options = self.categories[field][present].tolist()
+
+        self._options_cache[key] = options
+        if len(self._options_cache) > FACET_OPTIONS_CACHE_SIZE:
+            self._options_cache.popitem(last=False)
+        return list(options)
+
+    def contains(self, field, value, selections=None):
+        """
+        :return: whether or not value is an allowed value of field given the selections
+        """
+        return value in set(self.get_options(field, selections))
+
+    def filter(self, selections):
+        """
+        :param selections: dict {field: list of selected values}
+        :return: rows of the indexed dataframe matching the selections
+        """
+        mask = self.get_mask(selections)
+        if mask is None:
+            return self.df
+        return self.df[mask]
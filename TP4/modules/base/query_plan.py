@@ -0,0 +1,293 @@
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import partial
+
+import panel as pn
+from logzero import logger
+from panel.io.loading import start_loading_spinner, stop_loading_spinner
+
+from TP4.utils.gcp import get_query_executor
+
+
+class QueryNode(object):
+    """
+    A query of a QueryPlan : function(filters, *results of the queries it depends on, *args, **kwargs)
+    """
+
+    def __init__(self, key, function, depends_on, args, kwargs):
+        self.key = key
+        self.function = function
+        self.depends_on = depends_on
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self, filters, dependency_results):
+        return self.function(filters, *dependency_results, *self.args, **self.kwargs)
+
+    def get_cache_key(self):
+        """
+        :return: identifier of the query which is the same in every session and process, None if there is none, e.g.
+                 for a lambda or a function defined in another function
+        """
+        function = getattr(self.function, "__func__", self.function)
+        name = getattr(function, "__qualname__", None)
+        if name is None or "<" in name:
+            return None
+        dependency_keys = tuple(node.get_cache_key() for node in self.depends_on)
+        if None in dependency_keys:
+            return None
+        return f"{function.__module__}.{name}", repr(self.args), repr(sorted(self.kwargs.items())), dependency_keys
+
+
+def run_query(node, filters, dependency_results):
+    return node.run(filters, dependency_results)
+
+
+class PanelUpdate(object):
+    """
+    A plot update of a QueryPlan : update_function(*results of its queries)
+    """
+
+    def __init__(self, update_function, queries, layout=None):
+        self.update_function = update_function
+        self.queries = queries
+        self.layout = layout
+
+    def start_loading(self):
+        if self.layout is not None:
+            start_loading_spinner(self.layout)
+
+    def stop_loading(self):
+        if self.layout is not None:
+            stop_loading_spinner(self.layout)
+
+    def update(self, results, on_error=None):
+        """
+        :param results: dict {QueryNode: result} containing the results of the queries of the panel
+        :param on_error: called with (panel, exception) when the update fails, the exception is raised if None
+        """
+        try:
+            self.update_function(*[results[query] for query in self.queries])
+        except Exception as e:
+            if on_error is None:
+                raise e
+            logger.error(f"Error updating panel {self.update_function}: {str(e)}")
+            on_error(self, e)
+        finally:
+            self.stop_loading()
+
+    def fail(self, e, on_error=None):
+        """
+        Called instead of update when one of the queries of the panel failed
+        :param e: exception raised by the query
+        :param on_error: called with (panel, exception), the exception is raised if None
+        """
+        try:
+            if on_error is None:
+                raise e
+            logger.error(f"Error getting the data of panel {self.update_function}: {str(e)}")
+            on_error(self, e)
+        finally:
+            self.stop_loading()
+
+
+def get_function_key(function):
+    # Bound methods of the same object are the same query, whatever the bound method instance
+    if hasattr(function, "__self__") and hasattr(function, "__func__"):
+        return id(function.__self__), function.__func__
+    return function
+
+
+class QueryPlan(object):
+    """
+    Declarative description of the queries needed by the panels of a dashboard
+
+    Example :
+        plan = QueryPlan()
+        sales = plan.query(self.BQHandler.query_sales_by_platform)
+        years = plan.query(self.BQHandler.query_sales_per_year)
+        plan.panel(self.update_sales_by_platform, sales)
+        plan.panel(self.update_sales_per_year, years)
+        results = plan.execute(filters)
+
+    Identical queries (same function, same args, same dependencies) declared by several panels are run once.
+    Independent queries run concurrently on the shared query executor, and each panel is updated, on the calling
+    thread, as soon as all of its own queries are done.
+
+    With execute_async, the plan is awaited on the server event loop instead of blocking it, and each panel update is
+    scheduled on its own tick so that it is sent to the browser without waiting for the slowest query.
+    """
+
+    def __init__(self):
+        self.queries = {}
+        self.panels = []
+
+    def query(self, function, *args, depends_on=None, **kwargs):
+        """
+        Declare a query, or get the already declared identical one
+        :param function: called with the filters, the results of depends_on, then args and kwargs
+        :param depends_on: list of QueryNode whose results are needed by this query
+        :return: QueryNode
+        """
+        depends_on = tuple(depends_on or ())
+        key = (get_function_key(function), repr(args), repr(sorted(kwargs.items())),
+               tuple(node.key for node in depends_on))
+        if key not in self.queries:
+            self.queries[key] = QueryNode(key, function, depends_on, args, kwargs)
+        return self.queries[key]
+
+    def panel(self, update_function, *queries, layout=None):
+        """
+        Declare a panel update
+        :param update_function: called with the results of the queries, in order
+        :param queries: QueryNode needed by the panel
+        :param layout: panel object showing a loading spinner until its update is done
+        """
+        self.panels.append(PanelUpdate(update_function, queries, layout=layout))
+
+    def start_loading(self):
+        for panel in self.panels:
+            panel.start_loading()
+
+    @staticmethod
+    def stop_loading(panels):
+        for panel in panels:
+            panel.stop_loading()
+
+    def get_ready_nodes(self, waiting, results, errors):
+        """
+        :return: the waiting nodes whose dependencies are all done. The ones depending on a failed query are not run,
+                 they fail with the same exception
+        """
+        ready = []
+        progress = True
+        while progress:
+            progress = False
+            for node in list(waiting):
+                failed = [dep for dep in node.depends_on if dep in errors]
+                if len(failed) > 0:
+                    errors[node] = errors[failed[0]]
+                elif not all(dep in results for dep in node.depends_on):
+                    continue
+                else:
+                    ready.append(node)
+                waiting.remove(node)
+                progress = True
+        return ready
+
+    def get_ready_panels(self, panels, results, errors):
+        ready = [panel for panel in panels if all(query in results or query in errors for query in panel.queries)]
+        for panel in ready:
+            panels.remove(panel)
+        return ready
+
+    @staticmethod
+    def get_panel_error(panel, errors):
+        return next((errors[query] for query in panel.queries if query in errors), None)
+
+    @staticmethod
+    def set_result(node, future, results, errors, on_error):
+        try:
+            results[node] = future.result()
+        except Exception as e:
+            if on_error is None:
+                raise e
+            logger.error(f"Error running query {node.function}: {str(e)}")
+            errors[node] = e
+
+    def execute(self, filters, on_error=None, run=run_query):
+        """
+        Run all the queries and update the panels as soon as their data is available
+        :param filters: filters given to every query
+        :param on_error: called with (panel, exception) when a query or a panel update fails, the exception is raised
+                         if None. The panels depending on a failed query are not updated
+        :param run: function(node, filters, dependency results) running a query, e.g. through a cache
+        :return: dict {QueryNode: result}, without the failed queries
+        """
+        executor = get_query_executor()
+        results = {}
+        errors = {}
+        running = {}
+        waiting = list(self.queries.values())
+        panels = list(self.panels)
+        self.start_loading()
+
+        try:
+            while len(waiting) > 0 or len(running) > 0:
+                for node in self.get_ready_nodes(waiting, results, errors):
+                    future = executor.submit(run, node, filters, [results[dep] for dep in node.depends_on])
+                    running[future] = node
+                if len(running) == 0:
+                    if len(waiting) == 0:
+                        break
+                    raise ValueError("The query plan has a dependency cycle")
+
+                done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.set_result(running.pop(future), future, results, errors, on_error)
+
+                self.update_ready_panels(panels, results, errors, on_error)
+            self.update_ready_panels(panels, results, errors, on_error)
+        finally:
+            for future in running:
+                future.cancel()
+            self.stop_loading(panels)
+
+        return results
+
+    async def execute_async(self, filters, on_error=None, run=run_query):
+        """
+        Same as execute, but awaits the queries instead of blocking the event loop. Each panel update is scheduled
+        with pn.state.execute, so that it holds the document lock and is sent to the browser on its own
+        :param filters: filters given to every query
+        :param on_error: called with (panel, exception) when a query or a panel update fails
+        :param run: function(node, filters, dependency results) running a query, e.g. through a cache
+        :return: dict {QueryNode: result}, without the failed queries
+        """
+        executor = get_query_executor()
+        results = {}
+        errors = {}
+        running = {}
+        waiting = list(self.queries.values())
+        panels = list(self.panels)
+        pn.state.execute(self.start_loading, schedule=True)
+
+        try:
+            while len(waiting) > 0 or len(running) > 0:
+                for node in self.get_ready_nodes(waiting, results, errors):
+                    future = executor.submit(run, node, filters, [results[dep] for dep in node.depends_on])
+                    running[asyncio.wrap_future(future)] = node
+                if len(running) == 0:
+                    if len(waiting) == 0:
+                        break
+                    raise ValueError("The query plan has a dependency cycle")
+
+                done, _ = await asyncio.wait(list(running.keys()), return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    self.set_result(running.pop(future), future, results, errors, on_error)
+
+                self.schedule_ready_panels(panels, results, errors, on_error)
+            self.schedule_ready_panels(panels, results, errors, on_error)
+        finally:
+            # Cancelled or failed : the queries not started yet are dropped and no spinner is left running
+            for future in running:
+                future.cancel()
+            pn.state.execute(partial(self.stop_loading, list(panels)), schedule=True)
+
+        return results
+
+    def update_ready_panels(self, panels, results, errors, on_error):
+        for panel in self.get_ready_panels(panels, results, errors):
+            e = self.get_panel_error(panel, errors)
+            if e is None:
+                panel.update(results, on_error=on_error)
+            else:
+                panel.fail(e, on_error=on_error)
+
+    def schedule_ready_panels(self, panels, results, errors, on_error):
+        for panel in self.get_ready_panels(panels, results, errors):
+            e = self.get_panel_error(panel, errors)
+            if e is None:
+                pn.state.execute(partial(panel.update, dict(results), on_error=on_error), schedule=True)
+            else:
+                pn.state.execute(partial(panel.fail, e, on_error=on_error), schedule=True)
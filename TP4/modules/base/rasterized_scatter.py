@@ -0,0 +1,109 @@
+import numpy as np
+from bokeh.models import ColumnDataSource
+
+from TP4.constants.constants import RASTERIZE_THRESHOLD
+from TP4.utils.rasterize import rasterize_points
+
+
+class RasterizedScatter(object):
+    """
+    Rasterized mode of the scatter plots, to be mixed with a BasePlot
+
+    Under rasterize_threshold points, update_points fills the source of the glyphs as usual. Above it, the points are
+    kept on the server and aggregated into an RGBA image of the size of the plot, which is the only thing sent to the
+    browser, and the image is recomputed for the new ranges when the user pans or zooms.
+    """
+
+    def init_rasterized(self, rasterize_threshold=RASTERIZE_THRESHOLD):
+        """
+        To call in the constructor, before make_figure
+        :param rasterize_threshold: number of points from which the plot is rasterized
+        """
+        self.rasterize_threshold = rasterize_threshold
+        self.image_source = ColumnDataSource(data=dict(image=[], x=[], y=[], dw=[], dh=[]))
+        self.raster_data = None
+        self.rendered_ranges = None
+        self.fixed_range_bounds = []
+
+    def add_raster_renderer(self):
+        """
+        To call at the end of make_figure, once the ranges of the figure are set
+        """
+        self.figure.image_rgba(image="image", x="x", y="y", dw="dw", dh="dh", source=self.image_source)
+        ranges = [self.figure.x_range, self.figure.y_range]
+        # Bounds set by make_figure, e.g. y_range.start = 0, are kept in rasterized mode
+        self.fixed_range_bounds = [(bokeh_range.start, bokeh_range.end) for bokeh_range in ranges]
+        self.watch_visible_range(self.update_raster, ranges=ranges)
+
+    def is_rasterized(self):
+        return self.raster_data is not None
+
+    def get_n_points(self):
+        """
+        :return: number of points of the plot, drawn as glyphs or rasterized
+        """
+        return len(self.raster_data["x"]) if self.is_rasterized() else len(self.source.data.get("x", []))
+
+    def update_points(self, **columns):
+        """
+        Replace the points of the plot, rasterized if there are more than rasterize_threshold of them
+        :param columns: name of the column in the source = values, with at least x, y and color
+        """
+        columns = {key: self.to_array(values) for key, values in columns.items()}
+        if len(columns["x"]) < self.rasterize_threshold:
+            if self.is_rasterized():
+                self.raster_data = None
+                self.image_source.data = dict(image=[], x=[], y=[], dw=[], dh=[])
+                self.reset_ranges()
+            self.set_source_data(**columns)
+            return
+
+        self.raster_data = columns
+        self.set_source_data(**{key: values[:0] for key, values in columns.items()})
+        # Explicit bounds, so that the browser does not auto-range on the image and send back larger ranges
+        self.rendered_ranges = None
+        self.reset_ranges(columns["x"], columns["y"])
+        self.update_raster()
+
+    def stream_points(self, **columns):
+        """
+        Append points to the plot, the plot is rasterized once the total reaches rasterize_threshold
+        :param columns: name of the column in the source = values of the new points
+        """
+        shown = self.raster_data if self.is_rasterized() else self.source.data
+        if self.is_rasterized() or len(shown["x"]) + len(columns["x"]) >= self.rasterize_threshold:
+            self.update_points(**{key: np.concatenate([self.to_array(shown[key]), self.to_array(values)])
+                                  for key, values in columns.items()})
+        else:
+            self.stream_source_data(**columns)
+
+    def reset_ranges(self, x=None, y=None):
+        """
+        Set the ranges to the extent of x and y, or back to their bounds of make_figure if None
+        """
+        for bokeh_range, (start, end), values in zip([self.figure.x_range, self.figure.y_range],
+                                                     self.fixed_range_bounds, [x, y]):
+            if values is not None and len(values) > 0:
+                start = np.nanmin(values) if start is None else start
+                end = np.nanmax(values) if end is None else end
+            bokeh_range.update(start=start, end=end)
+
+    def get_visible_ranges(self):
+        return ((self.figure.x_range.start, self.figure.x_range.end),
+                (self.figure.y_range.start, self.figure.y_range.end))
+
+    def update_raster(self):
+        """
+        Rasterize the points inside the visible ranges, at the resolution of the plot
+        """
+        if not self.is_rasterized():
+            return
+        ranges = self.get_visible_ranges()
+        if ranges == self.rendered_ranges or None in ranges[0] + ranges[1]:
+            return
+        self.rendered_ranges = ranges
+        (x_start, x_end), (y_start, y_end) = ranges
+        image = rasterize_points(self.raster_data["x"], self.raster_data["y"], self.raster_data["color"],
+                                 ranges[0], ranges[1], self.width, self.height)
+        self.image_source.data = dict(image=[image], x=[x_start], y=[y_start], dw=[x_end - x_start],
+                                      dh=[y_end - y_start])
@@ -2,57 +2,31 @@ import warnings
 
 import numpy as np
 import pandas as pd
-from scipy import sparse
-from scipy.sparse.linalg import spsolve
+
+from TP4.utils.als import baseline_als, fit_baselines, interpolate_promos
+from TP4.utils.baseline_cache import baseline_cache
 
 # Initialization
 warnings.filterwarnings('ignore')
 np.seterr(divide='ignore', invalid='ignore')
 
 
-# ----------------------------------------------------- UTILS ----------------------------------------------------------
-# Baseline correction by 2nd derivative constrained weighted regression
-def baseline_als(y, lam, p, niter=100):
-    """
-    Asymmetric least squares smoothing
-    https://pubs.rsc.org/en/content/articlehtml/2015/an/c4an01061b
-
-    Iterative algorithm applying 2nd derivative constraints,
-    Weights from previous iteration is p for positive residuals and 1-p for negative residuals
-
-    input:
-        y: data (matrix with spectra in rows)
-        lam: smoothness parameter (2nd derivative constraint)
-        p (asymmetry parameter): weighting of positive residuals (and 1-p for negative residuals)
-        niter: maximum number of iterations
-
-    output:
-        baseline
-    """
-    L = len(y)
-    D = sparse.diags([1, -2, 1], [0, -1, -2], shape=(L, L-2))
-    w = np.ones(L)
-    for i in range(niter):
-        W = sparse.spdiags(w, 0, L, L)     # return a sparse matrix from diagonals
-        Z = W + lam * D.dot(D.transpose())
-        b = spsolve(Z, w*y)                # solve(A,b) the sparse linear system Ax=b, where b may be a vector or a matrix
-        w = p * (y > b) + (1-p) * (y < b)
-    return b
-
-
 class Baseline():
     """
     Inputs:
         - df: pandas dataframe with columns 'DATE', 'SALES', 'QUANTITY', 'PROMOS'
+        - series_id: optional id of the series, its fit is then cached and warm starts the next one when weeks are
+                     appended, see BaselineCache
 
     Return:
         - df: baseline results in a pandas dataframe format with columns: 'dates', 'sales', 'quantity', 'promo',
                                                                           'baseline', 'baseline_quantity'
     """
-    def __init__(self, df=None, selected_week_nb=None, args=None):
+    def __init__(self, df=None, selected_week_nb=None, args=None, series_id=None):
         self.df = df
         self.selected_week_nb = selected_week_nb
         self.args = args
+        self.series_id = series_id
         self.result = None
         self.baselinedetection()
 
@@ -72,16 +46,20 @@ class Baseline():
             df_np.loc[df_np.PROMO_FLAG > 0, "QUANTITY"] = np.nan
             df_np['QUANTITY'] = df_np['QUANTITY'].interpolate(method='linear', limit_direction='both', axis=0)
 
-            # ALS baseline
-            baseline_als_values = baseline_als(np.asarray(df_np['SALES'].astype(float)),
-                                               lam=self.args['als_lambda'],
-                                               p=self.args['als_weighting'],
-                                               niter=100)
-
-            baseline_als_quantity_values = baseline_als(np.asarray(df_np['QUANTITY'].astype(float)),
-                                                        lam=self.args['als_lambda'],
-                                                        p=self.args['als_weighting'],
-                                                        niter=100)
+            # ALS baseline of sales and quantity, fitted together
+            values = np.vstack([df_np['SALES'].astype(float), df_np['QUANTITY'].astype(float)])
+            if self.series_id is None:
+                baseline_als_values, baseline_als_quantity_values = baseline_als(
+                    values,
+                    lam=self.args['als_lambda'],
+                    p=self.args['als_weighting'],
+                    niter=100)
+            else:
+                baseline_als_values, baseline_als_quantity_values = baseline_cache.fit(
+                    [(self.series_id, np.asarray(self.df['DATE']), values)],
+                    lam=self.args['als_lambda'],
+                    p=self.args['als_weighting'],
+                    niter=100)[0]
 
             # Result
             result = {}
@@ -105,3 +83,68 @@ class Baseline():
         self.result = result
 
         return
+
+    @classmethod
+    def baselinedetection_batch(cls, df, key, args, incremental=False):
+        """
+        Baselines of many series at once, fitted on the baseline process pool
+        Inputs:
+            - df: long format pandas dataframe with columns key, 'DATE', 'SALES', 'QUANTITY', 'PROMOS'
+            - key: column, or list of columns, identifying a series (e.g. item and store)
+            - args: dict with 'als_lambda' and 'als_weighting'
+            - incremental: whether or not the fits are cached per series, so that the unchanged series are not fitted
+                           again and the series with appended weeks are warm started, see BaselineCache
+
+        Return:
+            - df: baseline results of all the series, in a pandas dataframe with the key columns and: 'dates', 'sales',
+                  'quantity', 'promo', 'baseline', 'baseline_quantity'. Series with less than two weeks of sales are
+                  dropped, like in baselinedetection
+        """
+        keys = [key] if isinstance(key, str) else list(key)
+        df = df[df['SALES'] != 0.0].sort_values(keys, kind='stable')
+        # Series with a missing key are kept, as the single series Baseline would
+        sizes = df.groupby(keys, sort=False, dropna=False).size()
+        df = df[np.repeat(sizes.to_numpy() > 1, sizes.to_numpy())]
+        sizes = sizes[sizes > 1]
+        offsets = np.concatenate([[0], np.cumsum(sizes.to_numpy())])
+
+        values = np.vstack([df['SALES'].astype(float), df['QUANTITY'].astype(float), df['PROMOS'].astype(float)])
+        if incremental:
+            baselines = cls.fit_incremental(df, sizes, offsets, values, args)
+        else:
+            baselines = fit_baselines(values, offsets, lam=args['als_lambda'], p=args['als_weighting'])
+
+        result = {column: df[column].to_numpy() for column in keys}
+        result['dates'] = df['DATE'].to_numpy()                             # dates
+        result['sales'] = values[0]                                         # sales
+        result['quantity'] = values[1]                                      # quantity
+        result['promo'] = values[2]                                         # promo flag
+        result['baseline'] = baselines[0]                                   # baseline
+        result['baseline_quantity'] = baselines[1]                          # baseline quantity
+        return pd.DataFrame.from_dict(result)
+
+    @staticmethod
+    def fit_incremental(df, sizes, offsets, values, args):
+        """
+        Baselines of the series of baselinedetection_batch through the baseline cache, the series without a usable
+        previous fit being fitted on the baseline process pool
+        :return: float numpy array of shape (2, number of rows), sales and quantity baselines
+        """
+        dates = df['DATE'].to_numpy()
+        items = []
+        for series_id, start, stop in zip(sizes.index, offsets[:-1], offsets[1:]):
+            promo = values[2, start:stop]
+            fitted_values = np.vstack([interpolate_promos(values[0, start:stop], promo),
+                                       interpolate_promos(values[1, start:stop], promo)])
+            items.append((series_id, dates[start:stop], fitted_values))
+
+        def fit_cold(cold_values):
+            # Already interpolated, the promo flags given to the workers are all 0
+            stacked = np.hstack(cold_values)
+            cold_offsets = np.concatenate([[0], np.cumsum([len(values[0]) for values in cold_values])])
+            cold_baselines = fit_baselines(np.vstack([stacked, np.zeros((1, stacked.shape[1]))]), cold_offsets,
+                                           lam=args['als_lambda'], p=args['als_weighting'])
+            return [cold_baselines[:, start:stop] for start, stop in zip(cold_offsets[:-1], cold_offsets[1:])]
+
+        baselines = baseline_cache.fit(items, lam=args['als_lambda'], p=args['als_weighting'], fit_cold=fit_cold)
+        return np.hstack(baselines) if len(baselines) > 0 else np.zeros((2, 0))
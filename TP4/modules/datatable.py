@@ -1,4 +1,8 @@
+import operator
+
+import numpy as np
 import pandas as pd
+import panel as pn
 from bokeh.models import (
     ColumnDataSource,
     DataTable,
@@ -7,6 +11,7 @@ from bokeh.models import (
     TableColumn,
 )
 
+from TP4.constants.constants import DATATABLE_PAGE_SIZE
 from TP4.modules.base.base_plot import BasePlot
 from TP4.utils.formatters import (
     DATA_TABLE_FORMATTER,
@@ -14,13 +19,18 @@ from TP4.utils.formatters import (
     DYA_DATA_TABLE_FORMATTER_V2,
 )
 
+# Prefixes of the filters of the numerical columns, the longest ones first
+FILTER_OPERATORS = [(">=", operator.ge), ("<=", operator.le), (">", operator.gt), ("<", operator.lt),
+                    ("=", operator.eq)]
+
 
 class DataTablePlot(BasePlot):
     """
     Class implementation of the DataTablePlot primitive
     """
 
-    def __init__(self, dict_formats, title, names=None, index_visible=True, height=300, width=1200, **params):
+    def __init__(self, dict_formats, title, names=None, index_visible=True, height=300, width=1200, pagination=None,
+                 page_size=None, **params):
         """
         Constructor of the DataTablePlot
         :param dict_formats: dict
@@ -33,6 +43,12 @@ class DataTablePlot(BasePlot):
             plot height
         :param width: int
             plot width
+        :param pagination: str, optional
+            With 'remote', the table is paginated on the server : update_data keeps the dataframe on the server and
+            only the rows of the current page are sent, sorted and filtered on the server
+        :param page_size: int, optional
+            number of rows per page, DATATABLE_PAGE_SIZE by default with remote pagination. Setting it also paginates
+            the table on the server
         :param params: inherited args
         """
         super().__init__(**params)
@@ -49,6 +65,19 @@ class DataTablePlot(BasePlot):
         self.source = ColumnDataSource(data=dict_formats)
         self.init_columns()
 
+        if pagination == 'remote' and page_size is None:
+            page_size = DATATABLE_PAGE_SIZE
+        self.page_size = page_size
+        self.column_values = {}
+        self.sort_permutations = {}
+        self.sort_column = None
+        self.sort_ascending = True
+        self.filters = {}
+        self.view_order = np.array([], dtype=np.int64)
+        self.page = 0
+        if self.page_size is not None:
+            self.init_pager()
+
         self.make_figure()
         self.panel = self.get_panel()
 
@@ -58,8 +87,127 @@ class DataTablePlot(BasePlot):
         :param df: pandas dataframe
             dataframe to show in the dashboard
         """
-        self.df_dict = df.to_dict("list")
-        self.source.data = self.df_dict
+        if self.page_size is None:
+            self.set_source_data(**{column: df[column] for column in df.columns})
+            return
+
+        self.column_values = {column: self.to_array(df[column]) for column in df.columns}
+        self.sort_permutations = {}
+        self.page = 0
+        self.update_view()
+
+    def init_pager(self):
+        """
+        Initialize the widgets of the server side pagination, sort and filter
+        """
+        columns = list(self.dict_formats.keys())
+        self.previous_button = pn.widgets.Button(name="<", width=40)
+        self.next_button = pn.widgets.Button(name=">", width=40)
+        self.page_text = pn.pane.Markdown("", width=200)
+        self.sort_select = pn.widgets.Select(name="Sort by", options=[""] + columns, value="", width=150)
+        self.descending_checkbox = pn.widgets.Checkbox(name="Descending", value=False, width=100)
+        self.filter_select = pn.widgets.Select(name="Filter", options=columns, value=columns[0], width=150)
+        self.filter_input = pn.widgets.TextInput(name="Value (contains, or >, <, = for numbers)", width=250)
+
+        self.previous_button.on_click(lambda event: self.set_page(self.page - 1))
+        self.next_button.on_click(lambda event: self.set_page(self.page + 1))
+        self.sort_select.param.watch(lambda event: self.set_sort(event.new or None, self.sort_ascending), "value")
+        self.descending_checkbox.param.watch(lambda event: self.set_sort(self.sort_column, not event.new), "value")
+        self.filter_select.param.watch(
+            lambda event: self.set_filter(event.new, self.filters.pop(event.old, "")), "value")
+        self.filter_input.param.watch(lambda event: self.set_filter(self.filter_select.value, event.new), "value")
+
+        self.pager = pn.Row(self.sort_select, self.descending_checkbox, self.filter_select, self.filter_input,
+                            self.previous_button, self.page_text, self.next_button)
+
+    def get_panel(self):
+        """
+        Get the dashboard inside the panel template, with the pager below the table in server side pagination
+        """
+        panel = super().get_panel()
+        if self.page_size is not None:
+            panel.append(self.pager)
+        return panel
+
+    def get_sort_permutation(self, column, ascending=True):
+        """
+        :return: row numbers of the dataframe sorted by column, missing values last, computed once per update_data
+        """
+        key = (column, ascending)
+        if key not in self.sort_permutations:
+            values = pd.Series(self.column_values[column])
+            self.sort_permutations[key] = values.sort_values(ascending=ascending, kind="stable",
+                                                             na_position="last").index.to_numpy()
+        return self.sort_permutations[key]
+
+    def get_column_mask(self, column, value):
+        """
+        :param value: str, a substring of the values of a text column, or a comparison such as ">100" for a numerical one
+        :return: boolean numpy array of the rows matching the filter
+        """
+        values = self.column_values[column]
+        if not np.issubdtype(values.dtype, np.number):
+            return pd.Series(values).astype(str).str.contains(value, case=False, regex=False).to_numpy()
+        compare = operator.eq
+        for prefix, function in FILTER_OPERATORS:
+            if value.startswith(prefix):
+                compare = function
+                value = value[len(prefix):]
+                break
+        try:
+            return compare(values, float(value))
+        except ValueError:
+            return np.zeros(len(values), dtype=bool)
+
+    def update_view(self):
+        """
+        Compute the rows of the table, filtered then sorted, and show the current page
+        """
+        n_rows = len(next(iter(self.column_values.values()), []))
+        mask = None
+        for column, value in self.filters.items():
+            if column in self.column_values and len(value.strip()) > 0:
+                column_mask = self.get_column_mask(column, value.strip())
+                mask = column_mask if mask is None else mask & column_mask
+
+        if self.sort_column in self.column_values:
+            order = self.get_sort_permutation(self.sort_column, self.sort_ascending)
+            # Keeping the rows of the permutation which pass the filters keeps them sorted
+            self.view_order = order if mask is None else order[mask[order]]
+        else:
+            self.view_order = np.arange(n_rows) if mask is None else np.flatnonzero(mask)
+        self.set_page(self.page)
+
+    def get_n_pages(self):
+        return max((len(self.view_order) + self.page_size - 1) // self.page_size, 1)
+
+    def set_page(self, page):
+        """
+        Send the rows of a page to the browser
+        :param page: int, from 0
+        """
+        self.page = min(max(page, 0), self.get_n_pages() - 1)
+        rows = self.view_order[self.page * self.page_size:(self.page + 1) * self.page_size]
+        self.set_source_data(**{column: values[rows] for column, values in self.column_values.items()})
+        self.page_text.object = f"Page {self.page + 1} / {self.get_n_pages()} ({len(self.view_order)} rows)"
+
+    def set_sort(self, column, ascending=True):
+        """
+        :param column: column to sort by, None to keep the order of the dataframe
+        """
+        self.sort_column = column
+        self.sort_ascending = ascending
+        self.page = 0
+        self.update_view()
+
+    def set_filter(self, column, value):
+        """
+        :param column: column to filter
+        :param value: str, see get_column_mask, an empty string removes the filter of the column
+        """
+        self.filters[column] = value
+        self.page = 0
+        self.update_view()
 
     def init_columns(self):
         """
@@ -138,11 +286,14 @@ class DataTablePlot(BasePlot):
         """
         Make the figure using bokeh components and defined parameters
         """
+        # In server side pagination, a click on a header would only sort the current page
+        sortable = self.page_size is None
         if self.index_visible:
             self.figure = DataTable(
-                source=self.source, columns=self.columns, width=self.width, height=self.height
+                source=self.source, columns=self.columns, width=self.width, height=self.height, sortable=sortable
             )
         else:
             self.figure = DataTable(
-                source=self.source, columns=self.columns, width=self.width, height=self.height, index_position=None
+                source=self.source, columns=self.columns, width=self.width, height=self.height, index_position=None,
+                sortable=sortable
             )
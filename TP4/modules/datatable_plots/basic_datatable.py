@@ -53,8 +53,7 @@ class DataTablePlot(BasePlot):
         :param df: pandas dataframe
             dataframe to show in the dashboard
         """
-        self.df_dict = df.to_dict("list")
-        self.source.data = self.df_dict
+        self.set_source_data(**{column: df[column] for column in df.columns})
 
     def init_columns(self):
         """
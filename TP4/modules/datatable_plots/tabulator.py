@@ -1,7 +1,11 @@
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 import panel as pn
-from bokeh.models import HTMLTemplateFormatter, NumberFormatter, StringFormatter
+from bokeh.models import ColumnDataSource, HTMLTemplateFormatter, NumberFormatter, StringFormatter
 
+from TP4.constants.constants import DATATABLE_PAGE_SIZE, TABULATOR_PAGE_CACHE_SIZE
 from TP4.modules.base.base_plot import BasePlot
 from TP4.utils.formatters import (
     TABULATOR_FORMATTER_CODE,
@@ -12,6 +16,72 @@ from TP4.utils.formatters import (
     TABULATOR_FORMATTER_MONITORING,
 )
 
+# Above this share of changed cells, update_data replaces the whole value rather than patching it
+TABULATOR_MAX_PATCH_RATIO = 0.5
+# Filtered and sorted copies of the value kept by RemoteTabulator, e.g. to switch back to the previous sort
+TABULATOR_PROCESSED_CACHE_SIZE = 4
+
+
+class RemoteTabulator(pn.widgets.Tabulator):
+    """
+    Tabulator whose remote pagination caches its work
+
+    With remote pagination, pn.widgets.Tabulator filters (header filters included) and sorts the whole value again
+    for each page the browser asks for. Here the filtered and sorted frame is computed once per value, filters and
+    sorters, and the pages sliced from it are cached, so browsing the pages or going back to a previous sort only
+    sends data.
+    """
+
+    def __init__(self, value=None, **params):
+        self._value_version = 0
+        self._cached_value = None
+        self._processed_cache = OrderedDict()
+        self._page_cache = OrderedDict()
+        super().__init__(value=value, **params)
+
+    def _bump_value_version(self):
+        self._value_version += 1
+        self._processed_cache.clear()
+        self._page_cache.clear()
+
+    def patch(self, patch_value, as_index=True):
+        # The value is patched in place, the cached frames are stale
+        self._bump_value_version()
+        super().patch(patch_value, as_index=as_index)
+
+    def get_processing_key(self):
+        # Checked on each call rather than in a watcher on value, which would run after the one of the widget
+        # computing the new page. The value is referenced, so that its id cannot be reused by another frame
+        if self.value is not self._cached_value:
+            self._cached_value = self.value
+            self._bump_value_version()
+        return self._value_version, repr(self.filters), repr(self._filters), repr(self.sorters)
+
+    def _filter_and_sort(self):
+        key = self.get_processing_key()
+        if key in self._processed_cache:
+            self._processed_cache.move_to_end(key)
+            return self._processed_cache[key]
+        df = self._sort_df(self._filter_dataframe(self.value))
+        self._processed_cache[key] = df
+        while len(self._processed_cache) > TABULATOR_PROCESSED_CACHE_SIZE:
+            self._processed_cache.popitem(last=False)
+        return df
+
+    def _get_data(self):
+        if self.pagination != 'remote' or self.value is None or isinstance(self.value.index, pd.MultiIndex):
+            return super()._get_data()
+        df = self._filter_and_sort()
+        key = self.get_processing_key() + (self.page, self.page_size)
+        if key not in self._page_cache:
+            start = (self.page - 1) * self.page_size
+            data = ColumnDataSource.from_df(df.iloc[start:start + self.page_size])
+            self._page_cache[key] = {k if isinstance(k, str) else str(k): v for k, v in data.items()}
+            while len(self._page_cache) > TABULATOR_PAGE_CACHE_SIZE:
+                self._page_cache.popitem(last=False)
+        self._page_cache.move_to_end(key)
+        return df, dict(self._page_cache[key])
+
 
 class TabulatorPlot(BasePlot):
     """
@@ -36,8 +106,10 @@ class TabulatorPlot(BasePlot):
         :param groups : dict
             for example {'Group 1': ['A', 'B'], 'Group 2': ['C', 'D']}
         :param pagination : str 'remote' or 'local'
+            With 'remote', update_data keeps the frame on the server, which sends the pages, filters them with the
+            header_filters and aggregates them by groupby, see RemoteTabulator
         :param page_size : int
-            number of max rows per page when using pagination
+            number of max rows per page when using pagination, DATATABLE_PAGE_SIZE by default with remote pagination
         :param frozen_rows : list
             List of rows to freeze
         :param frozen_columns : list
@@ -45,7 +117,8 @@ class TabulatorPlot(BasePlot):
         :param hierarchical : bool
             Whether to render multi-indexes as hierarchical index
         :param aggregators : dict
-            A dictionary mapping from index name to an aggregator to be used for hierarchical multi-indexes
+            A dictionary mapping from index name to an aggregator to be used for hierarchical multi-indexes. With
+            remote pagination, the pandas aggregation of each column when grouping by groupby, e.g. {"sales": "sum"}
         :param titles : dict
             A dictionary mapping from column name to a title to override the name with
         :param layout : str
@@ -58,6 +131,9 @@ class TabulatorPlot(BasePlot):
         self.groupby = groupby
         self.groups = groups
         self.pagination = pagination
+        self.remote = pagination == 'remote'
+        if self.remote and page_size is None:
+            page_size = DATATABLE_PAGE_SIZE
         self.page_size = page_size
         self.frozen_rows = frozen_rows
         self.frozen_columns = frozen_columns
@@ -86,6 +162,12 @@ class TabulatorPlot(BasePlot):
                                 'header_filters': self.header_filters,
                                 'show_index': self.show_index}
 
+        if self.remote:
+            # Grouped on the server, the groupby of the widget would only group the rows of the current page
+            self.parameters_dict['groupby'] = None
+            self.parameters_dict['aggregators'] = None
+        self.master_df = None
+
         self.reformat_dict_formats()
         print(self.dict_formats)
         self.df = pd.DataFrame(columns=list(self.dict_formats))
@@ -160,13 +242,59 @@ class TabulatorPlot(BasePlot):
         :param df: pandas dataframe
             dataframe to plot in the dashboard
         """
-        self.figure.value = df
+        if not self.remote:
+            self.figure.value = df
+            return
+        self.master_df = df
+        self.set_value(self.aggregate(df))
+
+    def aggregate(self, df):
+        """
+        :return: df grouped by groupby, the numerical columns being summed unless aggregators says otherwise
+        """
+        if not self.groupby:
+            return df
+        aggregators = self.aggregators
+        if not aggregators:
+            aggregators = {column: "sum" for column in df.select_dtypes("number").columns if column not in self.groupby}
+        grouped = df.groupby(self.groupby, sort=True, dropna=False).agg(aggregators).reset_index()
+        return grouped[[column for column in df.columns if column in grouped.columns]]
+
+    def set_value(self, df):
+        """
+        Send the changes of the value to the browser : the appended rows are streamed, the changed cells are patched,
+        and the value is only replaced when its rows or columns changed otherwise. With remote pagination the value
+        is always replaced, the browser only holds the current page
+        :param df: pandas dataframe, new value of the table
+        """
+        old = self.figure.value
+        if self.remote:
+            # Tabulator.stream and patch write to the page source directly, without the page size, sorters and
+            # header filters applied by RemoteTabulator._get_data
+            self.figure.value = df.copy()
+        elif old is None or len(old) == 0 or list(old.columns) != list(df.columns):
+            # The widget owns its value, which patch modifies in place
+            self.figure.value = df.copy()
+        elif len(df) > len(old) and df.index[:len(old)].equals(old.index) and df.iloc[:len(old)].equals(old):
+            self.figure.stream(df.iloc[len(old):], reset_index=False, follow=False)
+        elif len(df) == len(old) and df.index.equals(old.index):
+            changed = (df != old) & ~(df.isna() & old.isna())
+            n_changed = int(changed.to_numpy().sum())
+            if n_changed > TABULATOR_MAX_PATCH_RATIO * changed.size:
+                self.figure.value = df.copy()
+            elif n_changed > 0:
+                patch = {column: [(int(row), df[column].iat[row]) for row in np.flatnonzero(changed[column].to_numpy())]
+                         for column in df.columns if changed[column].any()}
+                self.figure.patch(patch, as_index=False)
+        else:
+            self.figure.value = df.copy()
 
     def make_figure(self):
         """
         Make the figure using panel components and defined parameters
         """
-        self.figure = pn.widgets.Tabulator(
+        widget = RemoteTabulator if self.remote else pn.widgets.Tabulator
+        self.figure = widget(
             value=self.df, formatters=self.table_formatters, **self.additional_params
         )
         for parameter in list(self.parameters_dict):
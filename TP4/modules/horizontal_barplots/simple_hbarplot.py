@@ -35,14 +35,14 @@ class SimpleHBarPlot(BarPlot):
 
     def init_formatted_x(self, x, value_format="num"):
         """
-        Format x axis using numerize() function
+        Format x axis using numerize() function, once per distinct value
         """
         if value_format == 'percentage':
-            formatted_x = ['{:.1%}'.format(element) for element in x]
+            formatted_x = self.map_unique(x, '{:.1%}'.format)
         elif value_format == 'num':
-            formatted_x = [override_numerize(element) for element in x]
+            formatted_x = self.map_unique(x, override_numerize)
         elif value_format == 'monetary':
-            formatted_x = ["€{:,.2f}".format(element) for element in x]
+            formatted_x = self.map_unique(x, "€{:,.2f}".format)
         else:
             formatted_x = x
 
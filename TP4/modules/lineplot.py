@@ -1,9 +1,24 @@
 import math
-
-from bokeh.models import Circle, ColumnDataSource, FuncTickFormatter, HoverTool, Line
+import re
+
+import numpy as np
+import pandas as pd
+from bokeh.models import (
+    Circle,
+    ColumnDataSource,
+    DatetimeTickFormatter,
+    DatetimeTicker,
+    FactorRange,
+    FuncTickFormatter,
+    HoverTool,
+    Line,
+    Range1d,
+)
 from bokeh.plotting import figure
 
+from TP4.constants.constants import DOWNSAMPLING_METHOD
 from TP4.modules.base.base_plot import BasePlot
+from TP4.utils.downsampling import downsample, is_date_x, to_numeric_x
 
 
 # Function to format ticks, so that they do not overlap
@@ -36,6 +51,13 @@ def x_tick_formatter(plot, num=1):
                 """)
 
 
+def add_date_format(tooltip):
+    """
+    :return: tooltip with the @x fields without format shown as dates
+    """
+    return re.sub(r"@x(?![\w{])", "@x{%F}", tooltip)
+
+
 class LinePlot(BasePlot):
     """
     Class implementation of the MultiLine plot primitive
@@ -54,6 +76,8 @@ class LinePlot(BasePlot):
             tooltips="",
             height=250,
             width=1200,
+            max_points=None,
+            downsampling_method=DOWNSAMPLING_METHOD,
             **params
     ):
         """
@@ -68,11 +92,21 @@ class LinePlot(BasePlot):
             tools to be used by the plots
         :param tooltips: str, optional
             tooltips to be used by the HoverTool
+        :param max_points: int, optional
+            maximum number of points drawn by update_data, the width of the plot by default
+        :param downsampling_method: str
+            "lttb" or "minmax", see TP4.utils.downsampling
         :param params: inherited args
         """
         super().__init__(**params)
 
         self.x_axis_data = x_axis_data
+        self.max_points = max_points if max_points is not None else width
+        self.downsampling_method = downsampling_method
+        self.full_x = None
+        self.full_y = None
+        self.numeric_x = None
+        self.rendered_range = None
         self.height = height
         self.width = width
         self.tools = tools
@@ -93,6 +127,8 @@ class LinePlot(BasePlot):
         self.source = ColumnDataSource(data=dict(x=[], y=[]))
 
         self.make_figure()
+        if isinstance(self.figure.x_range, Range1d):
+            self.watch_visible_range(self.update_visible_range)
         self.panel = self.get_panel()
 
     def make_figure(self):
@@ -129,3 +165,73 @@ class LinePlot(BasePlot):
         self.figure.xaxis.major_tick_line_color = None  # turn off y-axis major ticks
         self.figure.y_range.start = 0
         self.figure.xaxis.major_label_orientation = math.radians(45)
+
+    def is_categorical(self):
+        return isinstance(self.figure.x_range, FactorRange)
+
+    def update_data(self, x, y):
+        """
+        Keep the full series on the server and only send the points that can be seen, at most max_points of them.
+        With numbers or dates, the x range becomes a Range1d and the points are recomputed at the new resolution when
+        the user pans or zooms
+        :param x: x values, the factors of a categorical x axis or numbers/dates
+        :param y: y values
+        """
+        x = self.to_array(x)
+        y = self.to_array(y).astype(np.float64)
+        if self.is_categorical():
+            self.full_x = x.astype(str).astype(object)
+            self.full_y = y
+            # The categories are drawn in order, their positions are used to pick the points
+            self.numeric_x = np.arange(len(x), dtype=np.float64)
+            self.figure.x_range.factors = self.full_x.tolist()
+        else:
+            if is_date_x(x):
+                x = pd.to_datetime(x).to_numpy(dtype="datetime64[ns]")
+                self.use_datetime_axis()
+            numeric_x = to_numeric_x(x)
+            order = np.argsort(numeric_x, kind="stable")
+            self.full_x = x[order]
+            self.full_y = y[order]
+            self.numeric_x = numeric_x[order]
+        self.rendered_range = None
+        if not self.is_categorical() and len(self.numeric_x) > 0:
+            start, end = self.numeric_x[0], self.numeric_x[-1]
+            if not isinstance(self.figure.x_range, Range1d):
+                # An explicit range, whose start and end are sent back by the browser when the user pans or zooms
+                self.figure.x_range = Range1d(start, end)
+                self.watch_visible_range(self.update_visible_range)
+            self.figure.x_range.update(start=start, end=end, reset_start=start, reset_end=end)
+        self.update_visible_range()
+
+    def use_datetime_axis(self):
+        """
+        Show the x values as dates on the axis and in the hover, the figure being created before the type of x is known
+        """
+        self.figure.xaxis.ticker = DatetimeTicker()
+        self.figure.xaxis.formatter = DatetimeTickFormatter()
+        for hover in self.figure.select(HoverTool):
+            hover.formatters = {**hover.formatters, "@x": "datetime"}
+            if isinstance(hover.tooltips, str):
+                hover.tooltips = add_date_format(hover.tooltips)
+            elif hover.tooltips is not None:
+                hover.tooltips = [(label, add_date_format(value)) for label, value in hover.tooltips]
+
+    def get_visible_range(self):
+        if isinstance(self.figure.x_range, Range1d):
+            return self.figure.x_range.start, self.figure.x_range.end
+        return None, None
+
+    def update_visible_range(self):
+        """
+        Downsample the part of the full series inside the visible x range
+        """
+        if self.full_x is None:
+            return
+        visible_range = self.get_visible_range()
+        if visible_range == self.rendered_range:
+            return
+        self.rendered_range = visible_range
+        indices = downsample(self.numeric_x, self.full_y, self.max_points, method=self.downsampling_method,
+                             start=visible_range[0], end=visible_range[1])
+        self.set_source_data(x=self.full_x[indices], y=self.full_y[indices])
@@ -1,8 +1,11 @@
-from bokeh.models import Band, ColumnDataSource, HoverTool
+import numpy as np
+from bokeh.models import Band, ColumnDataSource, HoverTool, Range1d
 from bokeh.plotting import figure
 
+from TP4.constants.constants import DOWNSAMPLING_METHOD
 from TP4.modules.base.base_plot import BasePlot
 from TP4.utils.config_spinner import LoadingStyler
+from TP4.utils.downsampling import downsample, to_numeric_x
 
 
 class MultiLine(BasePlot):
@@ -22,6 +25,8 @@ class MultiLine(BasePlot):
         height=600,
         width=1200,
         band_parameters=None,
+        max_points=None,
+        downsampling_method=DOWNSAMPLING_METHOD,
         **params
     ):
         """
@@ -47,6 +52,10 @@ class MultiLine(BasePlot):
         :param band_parameters: dict, optional
             To show a band inside the plot, has to have two keys : 'lower' and 'upper'
             Example : {"lower" : 15, "upper" : 18}
+        :param max_points: int, optional
+            maximum number of points drawn per category by update_data, the width of the plot by default
+        :param downsampling_method: str
+            "lttb" or "minmax", see TP4.utils.downsampling
         :param params: inherited args
         """
         super().__init__(**params)
@@ -67,6 +76,10 @@ class MultiLine(BasePlot):
         self.height = height
         self.width = width
         self.band_parameters = band_parameters
+        self.max_points = max_points if max_points is not None else width
+        self.downsampling_method = downsampling_method
+        self.full_data = {}
+        self.rendered_range = None
 
         self.create_dict_source()
         self.source = ColumnDataSource(self.dict_source)
@@ -97,10 +110,7 @@ class MultiLine(BasePlot):
         for cat in self.cat_to_compare:
             xs.append(self.source.data[cat + "_x"])
             ys.append(self.source.data[cat + "_y"])
-        self.source_multiline.data["xs"] = xs
-        self.source_multiline.data["ys"] = ys
-        self.source_multiline.data["color"] = self.colors
-        self.source_multiline.data["line_width"] = [2] * self.num_of_cat
+        self.source_multiline.data = dict(xs=xs, ys=ys, color=self.colors, line_width=[2] * self.num_of_cat)
 
     def make_figure(self):
         """
@@ -147,3 +157,56 @@ class MultiLine(BasePlot):
             self.figure.add_layout(band)
 
         self.figure.toolbar.logo = None
+
+    def update_data(self, category_data):
+        """
+        Keep the full series on the server and only send the points of the visible date range, at most max_points
+        per category. They are recomputed at the new resolution when the user pans or zooms
+        :param category_data: dict {category: (dates, values)}, for the categories of cat_to_compare
+        """
+        self.full_data = {}
+        for cat in self.cat_to_compare:
+            dates, values = category_data.get(cat, ([], []))
+            dates = to_numeric_x(self.to_array(dates))
+            order = np.argsort(dates, kind="stable")
+            self.full_data[cat] = (dates[order], self.to_array(values).astype(np.float64)[order])
+
+        non_empty = [dates for dates, _ in self.full_data.values() if len(dates) > 0]
+        if len(non_empty) > 0:
+            start = min(dates[0] for dates in non_empty)
+            end = max(dates[-1] for dates in non_empty)
+            if not isinstance(self.figure.x_range, Range1d):
+                self.figure.x_range = Range1d(start, end)
+                self.watch_visible_range(self.update_visible_range)
+            self.figure.x_range.update(start=start, end=end, reset_start=start, reset_end=end)
+        self.rendered_range = None
+        self.update_visible_range()
+
+    def get_visible_range(self):
+        if isinstance(self.figure.x_range, Range1d):
+            return self.figure.x_range.start, self.figure.x_range.end
+        return None, None
+
+    def update_visible_range(self):
+        """
+        Downsample each category inside the visible date range. The columns of the categories share the source, the
+        shorter ones are padded with NaN which Bokeh does not draw
+        """
+        if len(self.full_data) == 0:
+            return
+        visible_range = self.get_visible_range()
+        if visible_range == self.rendered_range:
+            return
+        self.rendered_range = visible_range
+
+        columns = {}
+        for cat, (dates, values) in self.full_data.items():
+            indices = downsample(dates, values, self.max_points, method=self.downsampling_method,
+                                 start=visible_range[0], end=visible_range[1])
+            columns[cat + "_x"] = dates[indices]
+            columns[cat + "_y"] = values[indices]
+        length = max(len(column) for column in columns.values())
+        for key, column in columns.items():
+            columns[key] = np.concatenate([column, self.get_constant_array(np.nan, length - len(column))])
+        self.set_source_data(**columns)
+        self.init_multiline_data()
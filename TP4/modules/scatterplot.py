@@ -2,10 +2,12 @@ import numpy as np
 from bokeh.models import ColumnDataSource, HoverTool, LabelSet, Span
 from bokeh.plotting import figure
 
+from TP4.constants.constants import RASTERIZE_THRESHOLD
 from TP4.modules.base.base_plot import BasePlot
+from TP4.modules.base.rasterized_scatter import RasterizedScatter
 
 
-class ScatterPlot(BasePlot):
+class ScatterPlot(BasePlot, RasterizedScatter):
     """
     Class implementation of the ScatterPlot primitive
     """
@@ -19,6 +21,7 @@ class ScatterPlot(BasePlot):
         tooltips="",
         height=600,
         width=1200,
+        rasterize_threshold=RASTERIZE_THRESHOLD,
         **params
     ):
         """
@@ -37,6 +40,8 @@ class ScatterPlot(BasePlot):
             plot height
         :param width: int
             plot width
+        :param rasterize_threshold: int
+            number of points from which update_points draws the plot as an image, see RasterizedScatter
         :param params: inherited args
         """
         super().__init__(**params)
@@ -48,6 +53,7 @@ class ScatterPlot(BasePlot):
         self.height = height
         self.width = width
         self.source = ColumnDataSource(data=dict(x=[], y=[], size=[], color=[]))
+        self.init_rasterized(rasterize_threshold)
 
 
 class VersusScatterPlot(ScatterPlot):
@@ -149,3 +155,4 @@ class VersusScatterPlot(ScatterPlot):
         )
 
         self.figure.toolbar.logo = None
+        self.add_raster_renderer()
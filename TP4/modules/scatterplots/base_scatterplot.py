@@ -1,9 +1,11 @@
 from bokeh.models import ColumnDataSource
 
+from TP4.constants.constants import RASTERIZE_THRESHOLD
 from TP4.modules.base.base_plot import BasePlot
+from TP4.modules.base.rasterized_scatter import RasterizedScatter
 
 
-class BaseScatterPlot(BasePlot):
+class BaseScatterPlot(BasePlot, RasterizedScatter):
     """
     Class implementation of the ScatterPlot primitive
     """
@@ -17,6 +19,7 @@ class BaseScatterPlot(BasePlot):
         tooltips="",
         height=600,
         width=1200,
+        rasterize_threshold=RASTERIZE_THRESHOLD,
         **params
     ):
         """
@@ -35,6 +38,8 @@ class BaseScatterPlot(BasePlot):
             plot height
         :param width: int
             plot width
+        :param rasterize_threshold: int
+            number of points from which update_points draws the plot as an image, see RasterizedScatter
         :param params: inherited args
         """
         super().__init__(**params)
@@ -46,3 +51,4 @@ class BaseScatterPlot(BasePlot):
         self.height = height
         self.width = width
         self.source = ColumnDataSource(data=dict(x=[], y=[], size=[], color=[]))
+        self.init_rasterized(rasterize_threshold)
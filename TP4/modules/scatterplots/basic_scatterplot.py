@@ -64,3 +64,4 @@ class BasicScatterPlot(BaseScatterPlot):
         self.figure.outline_line_color = None
 
         self.figure.yaxis.formatter = NEW_Y_AXIS_FORMATTER
+        self.add_raster_renderer()
@@ -1,13 +1,18 @@
+import threading
+from functools import partial
+
 import holoviews as hv
+import numpy as np
 import panel as pn
 import param
 import pandas as pd
-import umap
 from bokeh.models import BoxSelectTool, BoxZoomTool, ResetTool, TapTool, SaveTool, PanTool, WheelZoomTool
-from sklearn import decomposition, manifold
+from logzero import logger
 from sklearn.preprocessing import MinMaxScaler
 
-from TP4.constants.constants import LR_SINGULAR_COLOR, LR_DIVERGING_COLORS_LONG, RED, GREEN, LR_QUALITATIVE_COLORS_LONG
+from TP4.awesome_panel.application.services.progress_service import ProgressService
+from TP4.constants.constants import LR_SINGULAR_COLOR, LR_DIVERGING_COLORS_LONG, RED, GREEN, \
+    LR_QUALITATIVE_COLORS_LONG, PROJECTION_PRECOMPUTE
 from TP4.modules.barplots.simple_barplot import SimpleBarPlot
 from TP4.modules.base.base_dashboard import BaseExampleDashboard
 from TP4.modules.datatable import DataTablePlot
@@ -19,6 +24,7 @@ from TP4.pages.example_dashboards.plotting_high_dimensional_data.queries import
 from TP4.pages.example_dashboards.plotting_high_dimensional_data.selector import (
     VGSelector,
 )
+from TP4.utils.projections import get_projection_params, projection_cache
 from TP4.utils.view import get_template
 from TP4.awesome_panel_extensions.site import site
 
@@ -49,8 +55,19 @@ class Dashboard(BaseExampleDashboard):
         # Create a selector
         self.selector = VGSelector(self.BQHandler)
 
-        df_data = pd.read_csv("TP4/pages/example_dashboards/new_beverage_chemistry.csv")
-        df_data = df_data.drop("Id", axis=1)
+        df_data = self.BQHandler.get_beverage_data()
+
+        # Projections running on the process pool, replaced when the method changes
+        self.progress_service = ProgressService()
+        self.progress_service.param.watch(self.update_projection_progress, ["progress"])
+        self.projection_progress = pn.indicators.Progress(value=0, max=100, visible=False, max_width=310,
+                                                          align='center')
+        self.projection_progress_text = pn.pane.Markdown("", visible=False, align='center')
+        self._projection_jobs = []
+        self._projection_generation = 0
+        self._projections_total = self._projections_remaining = 0
+        # id of the scatter plot -> projection shown by the plot
+        self._shown_projections = {}
 
         self.switch_button_panel = pn.Param(
             self,
@@ -157,6 +174,7 @@ class Dashboard(BaseExampleDashboard):
             pn.Row(pn.Column(self.switch_button_panel, margin=(0, 10, 0, 10)),
                    pn.Column('', max_width=100)),
             pn.Row(self.n_neighbors_panel, self.min_distance_panel),
+            pn.Row(self.projection_progress, self.projection_progress_text),
             self.projection_scatter_plot.panel,
             self.iris_projection_scatter_plot.panel
         ]
@@ -180,13 +198,9 @@ class Dashboard(BaseExampleDashboard):
             elif self.switch_button != "UMAP":
                 self.n_neighbors_panel.widgets["n_neighbors"].visible = False
                 self.min_distance_panel.widgets["min_distance"].visible = False
-                self.loading = True
-                self.update_plot(self.loaded_data)
-                self.loading = False
+                self.launch_projections(self.loaded_data)
             else:
-                self.loading = True
-                self.update_plot(self.loaded_data)
-                self.loading = False
+                self.launch_projections(self.loaded_data)
 
     def normalize_data(self, df):
         scaler = MinMaxScaler()
@@ -208,43 +222,110 @@ class Dashboard(BaseExampleDashboard):
             df = pd.concat([df, df_col], ignore_index=True)
         return df
 
-    def reduce_dimension(self, data, column):
-        data_no_class = data.drop(column, axis=1)
-        if self.switch_button == "PCA":
-            results = self.launch_PCA(data_no_class, column=column)
-        elif self.switch_button == "T-SNE":
-            results = self.launch_TSNE(data_no_class, column=column)
+    def launch_projections(self, data):
+        """
+        Compute the projections of both datasets with the selected method, the slow methods on the process pool.
+        The projections still running for a previous method are cancelled, and each scatter plot is updated as soon
+        as its projection is done
+        :param data: [beverages dataframe, iris dataframe]
+        """
+        self.cancel_projections()
+        self._projection_generation += 1
+        generation = self._projection_generation
+        method = self.switch_button
+        params = get_projection_params(method, n_neighbors=self.n_neighbors, min_dist=self.min_distance)
+        doc = pn.state.curdoc
+
+        plots = [
+            ("beverage", data[0], "quality", self.projection_scatter_plot, self.create_color_list),
+            ("iris", data[1], "Species", self.iris_projection_scatter_plot, self.create_color_list_multiclass),
+        ]
+        self._projections_total = self._projections_remaining = len(plots)
+        self.progress_service.update(value=0, message=f"Computing {method} projections", active_count=1)
+        for dataset_id, df, column, plot, color_function in plots:
+            # The projections are shared by all the sessions, they are only computed once per dataset and parameters
+            key, future = projection_cache.submit_projection(df.drop(column, axis=1), method, params,
+                                                             dataset_id=dataset_id)
+            self._projection_jobs.append(key)
+            callback = partial(self.update_projection_plot, generation, plot, df, column, color_function, future)
+            future.add_done_callback(lambda _, callback=callback: self.schedule(doc, callback))
+
+    def schedule(self, doc, callback):
+        # The projections complete on a thread of the process pool, the plots are updated with the document lock
+        if doc is not None and doc.session_context:
+            doc.add_next_tick_callback(callback)
+        else:
+            callback()
+
+    def cancel_projections(self):
+        """
+        Stop waiting for the running projections, the ones no other session waits for are cancelled
+        """
+        for key in self._projection_jobs:
+            projection_cache.release(key)
+        self._projection_jobs = []
+        self._projection_generation += 1
+        self.progress_service.reset()
+
+    def update_projection_plot(self, generation, plot, data, column, color_function, future):
+        if generation != self._projection_generation or future.cancelled():
+            # Superseded by another method
+            return
+        try:
+            projection = future.result()
+        except Exception as e:
+            logger.error(f"projection failed: {str(e)}")
+            self.cancel_projections()
+            return
+
+        labels = data[column].to_numpy()
+        new_data = dict(
+            labels=plot.get_label_array(labels),
+            x=projection[:, 0],
+            y=projection[:, 1],
+            size=plot.get_constant_array(20, len(labels)),
+            color=color_function(labels),
+        )
+
+        n_shown = self.get_n_rows_to_keep(plot, projection)
+        if n_shown is not None:
+            # Rows appended to the dataset and transformed in the existing projection, only they are sent
+            plot.stream_points(**{key: value[n_shown:] for key, value in new_data.items()})
+        else:
+            plot.update_points(**new_data)
+        self._shown_projections[id(plot)] = projection
+
+        self._projections_remaining -= 1
+        if self._projections_remaining == 0:
+            self._projection_jobs = []
+            self.progress_service.reset()
         else:
-            results = self.launch_UMAP(data_no_class, column=column)
-        results[column] = data[column]
-        return results
-
-    def launch_PCA(self, data, column):
-        pca = decomposition.PCA(n_components=2)
-        X_pca = pca.fit_transform(data)
-        results = pd.DataFrame(X_pca, columns=[["0", "1"]])
-        return results
-
-    def launch_TSNE(self, data, column):
-        tsne = manifold.TSNE(n_components=2, init='random', random_state=42, perplexity=30)
-        X_tsne = tsne.fit_transform(data)
-        results = pd.DataFrame(X_tsne, columns=[["0", "1"]])
-        return results
-
-    def launch_UMAP(self, data, column):
-        um = umap.UMAP(n_neighbors=self.n_neighbors, min_dist=self.min_distance, metric="euclidean")
-        X_umap = um.fit_transform(data)
-        results = pd.DataFrame(X_umap, columns=[["0", "1"]])
-        return results
+            done = self._projections_total - self._projections_remaining
+            self.progress_service.update(value=100 * done // self._projections_total)
+
+    def get_n_rows_to_keep(self, plot, projection):
+        """
+        :return: number of rows of the plot to keep if the projection only appends rows to the shown one, else None
+        """
+        shown = self._shown_projections.get(id(plot))
+        if shown is None or len(projection) <= len(shown) or plot.get_n_points() != len(shown):
+            return None
+        if not np.array_equal(projection[:len(shown)], shown):
+            return None
+        return len(shown)
+
+    def update_projection_progress(self, *_):
+        progress = self.progress_service.progress
+        self.projection_progress.value = progress.value
+        self.projection_progress.visible = progress.active
+        self.projection_progress_text.object = progress.message
+        self.projection_progress_text.visible = progress.active
 
     def get_data(self):
         print("getting data")
 
-        df_data = pd.read_csv("TP4/pages/example_dashboards/new_beverage_chemistry.csv")
-        df_data = df_data.drop("Id", axis=1)
-
-        iris_data = pd.read_csv("TP4/pages/example_dashboards/iris.csv")
-        iris_data = iris_data.drop("Id", axis=1)
+        df_data = self.BQHandler.get_beverage_data()
+        iris_data = self.BQHandler.get_iris_data()
 
         self.loaded_data = [df_data, iris_data]
 
@@ -263,69 +344,18 @@ class Dashboard(BaseExampleDashboard):
         print(quality_distrib)
 
         self.quality_grades_distribution.figure.x_range.factors = list(quality_distrib["quality"].astype(str))
-        self.quality_grades_distribution.source.data = dict(
-            x=list(quality_distrib["quality"].astype(str)),
-            y=list(quality_distrib["count"].astype(str)),
-        )
-
-        # Beverages dataset
-
-        projection_results = self.reduce_dimension(data, "quality")
-        qualities = self.get_flat_list(projection_results, "quality")
-        qualities_strings = [str(x) for x in qualities]
-
-        first_axis = self.get_flat_list(projection_results, "0")
-        second_axis = self.get_flat_list(projection_results, "1")
-
-        color_list = self.create_color_list(qualities)
-
-        self.projection_scatter_plot.source.data = dict(
-            labels=qualities_strings,
-            x=first_axis,
-            y=second_axis,
-            size=[20] * len(qualities),
-            color=color_list,
+        self.quality_grades_distribution.set_source_data(
+            x=quality_distrib["quality"].astype(str),
+            y=quality_distrib["count"],
         )
 
-        # Iris dataset
-
-        projection_results = self.reduce_dimension(iris_data, column="Species")
-        species = self.get_flat_list(projection_results, "Species")
-        species_strings = [str(x) for x in species]
-
-        first_axis = self.get_flat_list(projection_results, "0")
-        second_axis = self.get_flat_list(projection_results, "1")
-
-        iris_color_list = self.create_color_list_multiclass(species)
-
-        self.iris_projection_scatter_plot.source.data = dict(
-            labels=species_strings,
-            x=first_axis,
-            y=second_axis,
-            size=[20] * len(species),
-            color=iris_color_list,
-        )
+        self.launch_projections([data, iris_data])
 
     def create_color_list(self, elements):
-        color_list = []
-        for elem in elements:
-            if elem < 7:
-                color_list.append(RED)
-            else:
-                color_list.append(GREEN)
-        return color_list
+        return BasicScatterPlot.get_threshold_colors(elements, 7, RED, GREEN)
 
     def create_color_list_multiclass(self, elements):
-        color_list = []
-        distincts_elements = list(set(elements))
-        for elem in elements:
-            color_list.append(LR_QUALITATIVE_COLORS_LONG[distincts_elements.index(elem)])
-        return color_list
-
-    def get_flat_list(self, data, col):
-        res = data[col].values.tolist()
-        flat_res = [item for sublist in res for item in sublist]
-        return flat_res
+        return BasicScatterPlot.get_categorical_colors(elements, LR_QUALITATIVE_COLORS_LONG)
 
     def get_user_filters(self):
         return False
@@ -347,8 +377,41 @@ class Dashboard(BaseExampleDashboard):
         return settings_panel
 
 
+def precompute_default_projections():
+    """
+    Compute the projections of the datasets with the default parameters, so that the first sessions do not wait
+    """
+    client = BQClient(None)
+    datasets = []
+    for get_data, column in [(client.get_beverage_data, "quality"), (client.get_iris_data, "Species")]:
+        try:
+            datasets.append(get_data().drop(column, axis=1))
+        except Exception as e:
+            logger.warning(f"could not load dataset to precompute projections: {str(e)}")
+    projection_cache.precompute(datasets)
+
+
+_precompute_started = False
+_precompute_lock = threading.Lock()
+
+
+def start_precompute_default_projections():
+    """
+    Start precompute_default_projections in the background, once per server process
+    """
+    global _precompute_started
+    with _precompute_lock:
+        if _precompute_started:
+            return
+        _precompute_started = True
+    threading.Thread(target=precompute_default_projections, name="projection-precompute", daemon=True).start()
+
+
 @site.add(APPLICATION)
 def view():
+    if PROJECTION_PRECOMPUTE:
+        # Started by the server once a session is loaded, not when the module is imported
+        pn.state.onload(start_precompute_default_projections)
     return get_template(BQClient, Dashboard, name_tab="Plotting high dimensional data")
 
 
@@ -1,10 +1,18 @@
-import pandas as pd
-
 from TP4.queries.base import BQBase
+from TP4.utils.datasets import get_dataset
+
+BEVERAGE_DATA_PATH = "TP4/pages/example_dashboards/new_beverage_chemistry.csv"
+IRIS_DATA_PATH = "TP4/pages/example_dashboards/iris.csv"
 
 
 class BQClient(BQBase):
 
     def __init__(self, tenant_id):
         super().__init__("101015", retrieve_date=False)
-        self.df_data = pd.read_csv("TP4/pages/example_dashboards/new_beverage_chemistry.csv")
+        self.df_data = get_dataset(BEVERAGE_DATA_PATH)
+
+    def get_beverage_data(self):
+        return get_dataset(BEVERAGE_DATA_PATH, drop_columns=["Id"])
+
+    def get_iris_data(self):
+        return get_dataset(IRIS_DATA_PATH, drop_columns=["Id"])
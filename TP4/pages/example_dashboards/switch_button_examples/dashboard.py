@@ -6,6 +6,7 @@ from bokeh.models import BoxSelectTool, BoxZoomTool, ResetTool, TapTool
 from TP4.constants.constants import LR_SINGULAR_COLOR
 from TP4.modules.barplots.simple_barplot import SimpleBarPlot
 from TP4.modules.base.base_dashboard import BaseExampleDashboard
+from TP4.modules.base.query_plan import QueryPlan
 from TP4.modules.panel_text import PanelText
 from TP4.pages.example_dashboards.switch_button_examples.queries import BQClient
 from TP4.pages.example_dashboards.switch_button_examples.selector import (
@@ -32,14 +33,17 @@ class Dashboard(BaseExampleDashboard):
     # Doesn't change, used to instantiate all the plots to render using Panel
     panels = param.List()
 
+    progressive_refresh = True
+
     @param.depends("switch_region_button", watch=True, on_init=False)
     def widget_event_handler(self):
-        if not self.first:
-            self.update_plot(self.loaded_data)
+        if not self.first and self.sales_by_platform_data is not None:
+            self.update_sales_by_platform(self.sales_by_platform_data)
 
     def __init__(self, BQHandler: BQClient, **params):
         super().__init__(**params)
         self.BQHandler = BQHandler
+        self.sales_by_platform_data = None
 
         # Create a selector
         self.selector = VGSelector(self.BQHandler)
@@ -86,42 +90,30 @@ class Dashboard(BaseExampleDashboard):
 
         self.view = pn.Row(self.main, self.settings_panel)
 
-    def get_data(self, filters):
-        print("getting data")
-
-        data = self.BQHandler.query_sales_by_platform(filters)
-        data2 = self.BQHandler.query_sales_per_year(filters)
+    def get_query_plan(self):
+        # Declare the queries of each panel, independent queries are run concurrently
+        plan = QueryPlan()
+        sales_by_platform = plan.query(self.BQHandler.query_sales_by_platform)
+        sales_per_year = plan.query(self.BQHandler.query_sales_per_year)
 
-        self.loaded_data = [data, data2]
+        plan.panel(self.update_sales_by_platform, sales_by_platform, layout=self.sales_by_platform_region.panel)
+        plan.panel(self.set_sales_per_year, sales_per_year)
+        return plan
 
-        return [data, data2]
+    def set_sales_per_year(self, data):
+        self.sales_per_year_data = data
 
-    def update_plot(self, data):
+    def update_sales_by_platform(self, data):
         print("update")
-        data2 = data[1]
-        data = data[0]
+        self.sales_by_platform_data = data
 
         self.sales_by_platform_region.figure.x_range.factors = list(data["platform"])
 
-        if self.switch_region_button == 'Global':
-            self.sales_by_platform_region.source.data = dict(
-                x=list(data["platform"]),
-                y=list(data["sales"]),
-            )
-        if self.switch_region_button == 'Japan':
-            self.sales_by_platform_region.source.data = dict(
-                x=list(data["platform"]),
-                y=list(data["jp_sales"]),
-            )
-        if self.switch_region_button == 'Europe':
-            self.sales_by_platform_region.source.data = dict(
-                x=list(data["platform"]),
-                y=list(data["eu_sales"]),
-            )
-        if self.switch_region_button == 'North America':
-            self.sales_by_platform_region.source.data = dict(
-                x=list(data["platform"]),
-                y=list(data["na_sales"]),
+        sales_columns = {"Global": "sales", "Japan": "jp_sales", "Europe": "eu_sales", "North America": "na_sales"}
+        if self.switch_region_button in sales_columns:
+            self.sales_by_platform_region.set_source_data(
+                x=data["platform"],
+                y=data[sales_columns[self.switch_region_button]],
             )
 
     def get_user_filters(self):
@@ -1,98 +1,54 @@
-import pandas as pd
-import pandasql as ps
+from TP4.queries.dataframe import BQDataFrameBase, DataFrameQuery
+from TP4.utils.datasets import get_dataset
 
-from TP4.queries.base import BQBase
+SALES_AGGREGATIONS = {
+    "sales": ("global_sales", "sum"),
+    "eu_sales": ("eu_sales", "sum"),
+    "na_sales": ("na_sales", "sum"),
+    "jp_sales": ("jp_sales", "sum"),
+}
 
 
-class BQClient(BQBase):
+class BQClient(BQDataFrameBase):
 
     def __init__(self, tenant_id):
-        super().__init__("101015", retrieve_date=False)
-        self.vgsales_df = pd.read_csv("TP4/pages/example_dashboards/vgsales_positive.csv")
-
-    def get_where_condition(self, filters, unwanted_fields=[None]):
-        where_condition = """"""
-        for key, item in filters.items():
-            if key not in unwanted_fields:
-                if isinstance(item, list):
-                    if item != ["ALL"] and len(item) > 0:
-                        if len(item) == 1:
-                            cond = """('""" + str(item[0]) + """')"""
-                        else:
-                            cond = tuple(item)
-                        where_condition += f" AND {key} IN {cond}"
-                elif isinstance(item, str):
-                    if item not in ["ALL", "RESET..."] and item is not None:
-                        where_condition += f""" AND {key}="{item}" """
-        return where_condition
+        super().__init__("101015", get_dataset("TP4/pages/example_dashboards/vgsales_positive.csv"))
+        self.vgsales_df = self.df
 
     def query_sales_by_platform(self, filters):
-        # Get where conditions from selector filters
-        conditions = self.get_where_condition(filters)
-        df = self.vgsales_df
-
-        # Write the query that retrieved the data at each new data refresh
-        query = f"""
-        SELECT
-            platform,
-            SUM(global_sales) AS sales,
-            SUM(eu_sales) AS eu_sales,
-            SUM(na_sales) AS na_sales,
-            SUM(jp_sales) AS jp_sales
-        FROM
-            df
-        WHERE
-            1=1
-            {conditions}
-        GROUP BY
-            platform
-        ORDER BY
-            sales DESC
-        """
-        # Run query and store results in a pandas dataframe`
-        query = query.replace("\n", "")
-        data = ps.sqldf(query)
+        # Equivalent of :
+        # SELECT platform, SUM(global_sales) AS sales, SUM(eu_sales) AS eu_sales, SUM(na_sales) AS na_sales,
+        #        SUM(jp_sales) AS jp_sales
+        # FROM df WHERE 1=1 {conditions} GROUP BY platform ORDER BY sales DESC
+        query = DataFrameQuery(
+            group_by=["platform"],
+            aggregations=SALES_AGGREGATIONS,
+            order_by=["sales"],
+            ascending=False,
+        )
+        # Run query on the in memory dataframe and store results in a pandas dataframe
+        data = self.run_query(query, filters)
         return data
 
     def query_sales_per_year(self, filters):
-        # Get where conditions from selector filters
-        conditions = self.get_where_condition(filters)
-        df = self.vgsales_df
-
-        # Write the query that retrieved the data at each new data refresh
-        query = f"""
-        SELECT
-            CAST(year AS text) AS year,
-            SUM(global_sales) AS sales,
-            SUM(eu_sales) AS eu_sales,
-            SUM(na_sales) AS na_sales,
-            SUM(jp_sales) AS jp_sales
-        FROM
-            df
-        WHERE
-            1=1 AND
-            year IS NOT NULL
-            {conditions}
-        GROUP BY
-            year
-        ORDER BY
-            year
-        """
-        # Run query and store results in a pandas dataframe
-        query = query.replace("\n", "")
-        data = ps.sqldf(query)
+        # Equivalent of :
+        # SELECT CAST(year AS text) AS year, SUM(global_sales) AS sales, SUM(eu_sales) AS eu_sales,
+        #        SUM(na_sales) AS na_sales, SUM(jp_sales) AS jp_sales
+        # FROM df WHERE 1=1 AND year IS NOT NULL {conditions} GROUP BY year ORDER BY year
+        query = DataFrameQuery(
+            group_by=["year"],
+            aggregations=SALES_AGGREGATIONS,
+            not_null=["year"],
+            order_by=["year"],
+            cast={"year": str},
+        )
+        # Run query on the in memory dataframe and store results in a pandas dataframe
+        data = self.run_query(query, filters)
         return data
 
     def get_selector_fields(self):
-        df = self.vgsales_df
-        query = f"""
-        SELECT DISTINCT platform,
-                        genre,
-                        publisher
-
-        FROM df
-        """
-        query = query.replace("\n", "")
-        fields = ps.sqldf(query)
+        # Equivalent of : SELECT DISTINCT platform, genre, publisher FROM df
+        query = DataFrameQuery(group_by=["platform", "genre", "publisher"])
+        fields = self.run_query(query)
 
         return fields
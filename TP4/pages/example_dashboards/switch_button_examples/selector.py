@@ -2,7 +2,9 @@ import panel as pn
 import param
 
 from TP4.modules.base.base_selector import BaseSelector
+from TP4.modules.base.facet_index import FacetIndex
 from TP4.pages.example_dashboards.switch_button_examples.queries import BQClient
+from TP4.utils.debounce import Debouncer
 
 
 class VGSelector(BaseSelector):
@@ -15,9 +17,14 @@ class VGSelector(BaseSelector):
         
         self.distinct_fields = self.BQHandler.get_selector_fields()
         print(f"The fileds are {self.distinct_fields}")
-        self.build_distinct_fields(self.distinct_fields)
+        self.facet_index = FacetIndex(self.distinct_fields, fields=["platform", "genre", "publisher"])
+        self.build_distinct_fields()
         super().__init__(**params)
 
+        # Rapid multi-selections are coalesced in a single cascade
+        self.update_fields_debouncer = Debouncer(lambda events: self.update_fields())
+        self.param.watch(self.update_fields_debouncer.trigger, ["platform", "genre", "publisher"])
+
         self.settings_panel = pn.Param(
             self,
             name="",
@@ -48,25 +55,13 @@ class VGSelector(BaseSelector):
                 filters[key] = val
         return filters
 
-    @param.depends(
-        "platform",
-        "genre",
-        "publisher",
-        watch=True,
-    )
     def update_fields(self):
         self.loading = True
-        filters = self.get_filters()
-        df = self.distinct_fields
-        for key, input in filters.items():
-            if input != "ALL":
-                df = df[df[key].isin(input)]
-
-        self.build_distinct_fields(df)
+        self.build_distinct_fields(self.get_filters())
         self.loading = False
         return True
 
-    def build_distinct_fields(self, df):
-        self.param.platform.objects = ["ALL"] + list(df["platform"].unique())
-        self.param.genre.objects = ["ALL"] + list(df["genre"].unique())
-        self.param.publisher.objects = ["ALL"] + list(df["publisher"].unique())
+    def build_distinct_fields(self, filters=None):
+        for key in ["platform", "genre", "publisher"]:
+            options = self.facet_index.get_options(key, filters, exclude_own_field=False)
+            self.param[key].objects = ["ALL"] + options
@@ -0,0 +1,143 @@
+import pandas as pd
+
+from TP4.queries.base import BQBase
+
+
+class DataFrameQuery(object):
+    """
+    Declarative equivalent of a SELECT / WHERE / GROUP BY / ORDER BY query, executed directly on a DataFrame
+
+    Example, equivalent of
+        SELECT platform, SUM(global_sales) AS sales FROM df WHERE 1=1 {conditions} GROUP BY platform ORDER BY sales DESC
+
+        DataFrameQuery(group_by=["platform"], aggregations={"sales": ("global_sales", "sum")},
+                       order_by=["sales"], ascending=False)
+    """
+
+    def __init__(self, group_by=None, aggregations=None, select=None, not_null=None, order_by=None, ascending=True,
+                 cast=None, limit=None):
+        """
+        :param group_by: list of columns to group by
+        :param aggregations: dict {output column: (input column, aggregation function)} applied per group
+        :param select: list of columns to keep when the query has no aggregation
+        :param not_null: list of columns on which rows with null values are dropped ("col IS NOT NULL")
+        :param order_by: list of output columns to sort the result by
+        :param ascending: sort order, bool or list of bool matching order_by
+        :param cast: dict {output column: dtype} applied on the result ("CAST(col AS dtype)")
+        :param limit: maximum number of rows returned
+        """
+        self.group_by = group_by or []
+        self.aggregations = aggregations or {}
+        self.select = select
+        self.not_null = not_null or []
+        self.order_by = order_by or []
+        self.ascending = ascending
+        self.cast = cast or {}
+        self.limit = limit
+
+    def get_used_columns(self):
+        """
+        :return: the input columns needed to run the query, so that only them are sliced out of the source frame
+        """
+        columns = list(self.group_by)
+        columns += [column for column, _ in self.aggregations.values()]
+        if self.select is not None:
+            columns += list(self.select)
+        return list(dict.fromkeys(columns))
+
+
+def filter_dataframe(df, filters, unwanted_fields=None):
+    """
+    Vectorized equivalent of the WHERE conditions built by BQBase.update_where_with_fields
+
+    :param df: pandas dataframe to filter
+    :param filters: dict of selector filters, lists are translated to IN, strings to equality and booleans to a
+        truthiness test, "ALL" and "RESET..." values are ignored
+    :param unwanted_fields: keys of the filters which are not applied
+    :return: the filtered dataframe
+    """
+    if unwanted_fields is None:
+        unwanted_fields = []
+    mask = None
+    for key, item in filters.items():
+        if key in unwanted_fields or key not in df.columns:
+            continue
+        condition = None
+        if isinstance(item, list):
+            if item != ["ALL"] and len(item) > 0:
+                condition = df[key].isin(item)
+        elif isinstance(item, bool):
+            if item:
+                condition = df[key].astype(bool)
+        elif isinstance(item, str):
+            if item not in ["ALL", "RESET..."]:
+                condition = df[key] == item
+        if condition is not None:
+            mask = condition if mask is None else mask & condition
+    if mask is None:
+        return df
+    return df[mask.values]
+
+
+def run_dataframe_query(df, query, filters=None, unwanted_fields=None):
+    """
+    Run a DataFrameQuery in process on a pandas dataframe
+
+    :param df: source pandas dataframe, left untouched
+    :param query: DataFrameQuery to run
+    :param filters: dict of selector filters applied as WHERE conditions
+    :param unwanted_fields: keys of the filters which are not applied
+    :return: pandas dataframe with the query result
+    """
+    used_columns = query.get_used_columns()
+    filter_columns = [key for key in (filters or {}) if key in df.columns]
+    df = df[list(dict.fromkeys(used_columns + filter_columns + query.not_null))]
+
+    if len(query.not_null) > 0:
+        df = df.dropna(subset=query.not_null)
+    if filters:
+        df = filter_dataframe(df, filters, unwanted_fields)
+
+    if len(query.aggregations) > 0:
+        if len(query.group_by) > 0:
+            data = df.groupby(query.group_by, sort=False, observed=True, dropna=False).agg(**query.aggregations)
+            data = data.reset_index()
+        else:
+            data = pd.DataFrame({output: [df[column].agg(function)]
+                                 for output, (column, function) in query.aggregations.items()})
+    elif query.select is not None:
+        data = df[query.select]
+        if len(query.group_by) > 0:
+            data = data.drop_duplicates(subset=query.group_by)
+    else:
+        data = df[query.group_by].drop_duplicates()
+
+    if len(query.cast) > 0:
+        data = data.astype(query.cast)
+
+    if len(query.order_by) > 0:
+        data = data.sort_values(by=query.order_by, ascending=query.ascending, kind="mergesort")
+    if query.limit is not None:
+        data = data.head(query.limit)
+
+    return data.reset_index(drop=True)
+
+
+class BQDataFrameBase(BQBase):
+    """
+    Query backend of the BQBase family running the queries in process on a pandas dataframe
+    instead of sending SQL to BigQuery or copying the data into SQLite
+    """
+
+    def __init__(self, tenant_id, df, retrieve_date=False):
+        super().__init__(tenant_id, retrieve_date=retrieve_date)
+        self.df = df
+
+    def run_query(self, query, filters=None, unwanted_fields=None):
+        """
+        :param query: DataFrameQuery to run on self.df
+        :param filters: dict of selector filters
+        :param unwanted_fields: keys of the filters which are not applied
+        :return: pandas dataframe with the query result
+        """
+        return run_dataframe_query(self.df, query, filters=filters, unwanted_fields=unwanted_fields)
@@ -0,0 +1,282 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from scipy import sparse
+
+from TP4.constants.constants import BASELINE_PROCESS_POOL_MAX_WORKERS, BASELINE_SERIES_PER_TASK
+
+_baseline_pool = None
+_baseline_pool_lock = threading.Lock()
+
+
+# Baseline correction by 2nd derivative constrained weighted regression
+@lru_cache(maxsize=64)
+def get_second_difference_bands(length):
+    """
+    Bands of D.dot(D.T), D being the second difference matrix, computed once per series length
+    :param length: length of the series
+    :return: (main diagonal, first upper diagonal, second upper diagonal), read-only numpy arrays of length
+             length, length - 1 and length - 2
+    """
+    D = sparse.diags([1, -2, 1], [0, -1, -2], shape=(length, length-2))
+    DDt = D.dot(D.transpose()).todia()
+    bands = tuple(np.array(DDt.diagonal(k), dtype=np.float64) for k in range(3))
+    for band in bands:
+        band.flags.writeable = False
+    return bands
+
+
+def solve_pentadiagonal(d0, d1, d2, rhs):
+    """
+    Solve a batch of symmetric positive definite pentadiagonal systems by LDL' factorization, the loops run along the
+    series and each step is vectorized over the batch
+    :param d0: main diagonals, numpy array of shape (n_series, length)
+    :param d1: first upper diagonals, numpy array of shape (n_series, length - 1)
+    :param d2: second upper diagonals, numpy array of shape (n_series, length - 2)
+    :param rhs: right hand sides, numpy array of shape (n_series, length)
+    :return: solutions, numpy array of shape (n_series, length)
+    """
+    n_series, length = rhs.shape
+    diag = np.zeros((n_series, length))
+    l1 = np.zeros((n_series, length + 1))      # l1[:, i] = L[i, i-1]
+    l2 = np.zeros((n_series, length + 2))      # l2[:, i] = L[i, i-2]
+    zero = np.zeros(n_series)
+    for i in range(length):
+        diag_1 = diag[:, i-1] if i >= 1 else zero
+        diag_2 = diag[:, i-2] if i >= 2 else zero
+        diag[:, i] = d0[:, i] - l1[:, i] ** 2 * diag_1 - l2[:, i] ** 2 * diag_2
+        if i + 2 < length:
+            l2[:, i+2] = d2[:, i] / diag[:, i]
+        if i + 1 < length:
+            l1[:, i+1] = (d1[:, i] - l2[:, i+1] * diag_1 * l1[:, i]) / diag[:, i]
+
+    # Forward substitution L.z = rhs, then backward substitution L'.x = z / diag
+    z = np.empty((n_series, length))
+    for i in range(length):
+        z[:, i] = rhs[:, i]
+        if i >= 1:
+            z[:, i] -= l1[:, i] * z[:, i-1]
+        if i >= 2:
+            z[:, i] -= l2[:, i] * z[:, i-2]
+    x = z / diag
+    for i in range(length - 2, -1, -1):
+        x[:, i] -= l1[:, i+1] * x[:, i+1]
+        if i + 2 < length:
+            x[:, i] -= l2[:, i+2] * x[:, i+2]
+    return x
+
+
+def get_padded_bands(lengths, width):
+    """
+    Bands of D.dot(D.T) of series of different lengths padded to the same width, the padding being decoupled from
+    the series
+    :param lengths: int numpy array, length of each series
+    :param width: length of the padded series
+    :return: (main diagonals, first upper diagonals, second upper diagonals), numpy arrays of shape (n_series, width),
+             (n_series, width - 1) and (n_series, width - 2)
+    """
+    bands = [np.zeros((len(lengths), width - k)) for k in range(3)]
+    for length in np.unique(lengths):
+        if length < 3:
+            continue
+        rows = lengths == length
+        for band, values in zip(bands, get_second_difference_bands(length)):
+            band[rows, :len(values)] = values
+    return bands
+
+
+def baseline_als_batch(y, lam, p, niter=100, weights=None, lengths=None):
+    """
+    Asymmetric least squares smoothing of several series at once, see baseline_als
+
+    D.dot(D.T) is computed once per series length and shared by all the iterations, only the weights on the main
+    diagonal change. A series stops iterating once its weights are the same as in the previous iteration, its baseline
+    being then a fixed point.
+
+    input:
+        y: data, numpy array of shape (n_series, length)
+        lam: smoothness parameter (2nd derivative constraint)
+        p (asymmetry parameter): weighting of positive residuals (and 1-p for negative residuals)
+        niter: maximum number of iterations
+        weights: weights of the first iteration, numpy array of shape (n_series, length), ones if None
+        lengths: length of each series for series of different lengths padded at the end, the padding is ignored
+
+    output:
+        (baselines, weights of the last iteration), numpy arrays of shape (n_series, length), 0 on the padding
+    """
+    y = np.array(y, dtype=np.float64)
+    n_series, L = y.shape
+    lengths = np.full(n_series, L) if lengths is None else np.asarray(lengths)
+    valid = np.arange(L) < lengths[:, None]
+    y[~valid] = 0
+    w = np.ones((n_series, L)) if weights is None else np.array(weights, dtype=np.float64)
+    w[~valid] = 0
+    # No second derivative below 3 points, the weighted regression is the data itself
+    b = np.where(lengths[:, None] < 3, y, 0)
+    if L < 3:
+        return b, w
+
+    d0, d1, d2 = get_padded_bands(lengths, L)
+    active = np.flatnonzero(lengths >= 3)
+    for i in range(niter):
+        if len(active) == 0:
+            break
+        w_active = w[active]
+        b[active] = solve_pentadiagonal(np.where(valid[active], w_active + lam * d0[active], 1),
+                                        lam * d1[active], lam * d2[active], w_active * y[active])
+        new_w = np.where(valid[active], p * (y[active] > b[active]) + (1-p) * (y[active] < b[active]), 0)
+        converged = np.all(new_w == w_active, axis=1)
+        w[active] = new_w
+        active = active[~converged]
+    return b, w
+
+
+def baseline_als_series(series, lam, p, niter=100):
+    """
+    Asymmetric least squares smoothing of many series of any length in one batched call, the series being padded to
+    the longest one
+    :param series: list of 1d numpy arrays
+    :return: list of the baselines, in the order of series
+    """
+    if len(series) == 0:
+        return []
+    lengths = np.array([len(values) for values in series])
+    padded = np.zeros((len(series), lengths.max()))
+    for row, values in enumerate(series):
+        padded[row, :len(values)] = values
+    baselines, _ = baseline_als_batch(padded, lam, p, niter=niter, lengths=lengths)
+    return [baseline[:length] for baseline, length in zip(baselines, lengths)]
+
+
+def baseline_als(y, lam, p, niter=100):
+    """
+    Asymmetric least squares smoothing
+    https://pubs.rsc.org/en/content/articlehtml/2015/an/c4an01061b
+
+    Iterative algorithm applying 2nd derivative constraints,
+    Weights from previous iteration is p for positive residuals and 1-p for negative residuals
+
+    input:
+        y: data (matrix with spectra in rows)
+        lam: smoothness parameter (2nd derivative constraint)
+        p (asymmetry parameter): weighting of positive residuals (and 1-p for negative residuals)
+        niter: maximum number of iterations
+
+    output:
+        baseline
+    """
+    y = np.asarray(y, dtype=np.float64)
+    b, _ = baseline_als_batch(y.reshape(-1, y.shape[-1]), lam, p, niter=niter)
+    return b.reshape(y.shape)
+
+
+def interpolate_promos(values, promo):
+    """
+    Replace the values of the promo weeks, and the missing values, by a linear interpolation of the other weeks, the
+    first and last known values being repeated at the edges, like pandas interpolate(limit_direction='both')
+    :param values: float numpy array
+    :param promo: numpy array, promo flag of each week
+    :return: float numpy array
+    """
+    missing = (promo > 0) | np.isnan(values)
+    if not missing.any():
+        return np.array(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if missing.all():
+        return result
+    positions = np.arange(len(values))
+    result[~missing] = values[~missing]
+    result[missing] = np.interp(positions[missing], positions[~missing], values[~missing])
+    return result
+
+
+def get_baseline_pool():
+    """
+    Get the process pool shared by all the sessions of the process to compute the baselines of many series
+    return: executor
+    """
+    global _baseline_pool
+    if _baseline_pool is None:
+        with _baseline_pool_lock:
+            if _baseline_pool is None:
+                # spawn rather than fork, the server process runs threads. The workers only import this module
+                _baseline_pool = ProcessPoolExecutor(max_workers=BASELINE_PROCESS_POOL_MAX_WORKERS,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+    return _baseline_pool
+
+
+def fit_baseline_chunk(input_name, output_name, n_values, offsets, lam, p, niter):
+    """
+    Fit the sales and quantity baselines of consecutive series of the shared memory arrays, run by the pool workers
+    :param input_name: name of the shared memory holding the float array of shape (3, n_values) : sales, quantity
+                       and promo flag of all the series, one after the other
+    :param output_name: name of the shared memory of the float array of shape (2, n_values) receiving the sales and
+                        quantity baselines
+    :param n_values: total number of values of all the series
+    :param offsets: numpy array, the series of the chunk are the values between two consecutive offsets
+    """
+    input_memory = SharedMemory(name=input_name)
+    output_memory = SharedMemory(name=output_name)
+    try:
+        values = np.ndarray((3, n_values), dtype=np.float64, buffer=input_memory.buf)
+        baselines = np.ndarray((2, n_values), dtype=np.float64, buffer=output_memory.buf)
+        bounds = list(zip(offsets[:-1], offsets[1:]))
+        series = []
+        for start, stop in bounds:
+            promo = values[2, start:stop]
+            series.append(interpolate_promos(values[0, start:stop], promo))
+            series.append(interpolate_promos(values[1, start:stop], promo))
+        fitted = baseline_als_series(series, lam, p, niter=niter)
+        for i, (start, stop) in enumerate(bounds):
+            baselines[0, start:stop] = fitted[2 * i]
+            baselines[1, start:stop] = fitted[2 * i + 1]
+        # The views must be released before closing the shared memory
+        del values, baselines
+    finally:
+        input_memory.close()
+        output_memory.close()
+
+
+def fit_baselines(values, offsets, lam, p, niter=100, series_per_task=BASELINE_SERIES_PER_TASK):
+    """
+    Fit the sales and quantity baselines of many series on the baseline process pool. The series are shared with the
+    workers through shared memory, and the workers write the baselines in place, so only offsets are pickled
+    :param values: float numpy array of shape (3, n_values), sales, quantity and promo flag of the series one after
+                   the other
+    :param offsets: int numpy array of length n_series + 1, bounds of the series in values
+    :param series_per_task: number of series fitted by each task of the pool
+    :return: float numpy array of shape (2, n_values), sales and quantity baselines
+    """
+    n_values = values.shape[1]
+    n_series = len(offsets) - 1
+    if n_values == 0 or n_series == 0:
+        return np.zeros((2, n_values))
+
+    input_memory = SharedMemory(create=True, size=values.nbytes)
+    output_memory = SharedMemory(create=True, size=2 * n_values * 8)
+    try:
+        shared_values = np.ndarray(values.shape, dtype=np.float64, buffer=input_memory.buf)
+        shared_values[:] = values
+        del shared_values
+
+        pool = get_baseline_pool()
+        futures = []
+        for start in range(0, n_series, series_per_task):
+            futures.append(pool.submit(fit_baseline_chunk, input_memory.name, output_memory.name, n_values,
+                                       offsets[start:start + series_per_task + 1], lam, p, niter))
+        for future in futures:
+            future.result()
+
+        shared_baselines = np.ndarray((2, n_values), dtype=np.float64, buffer=output_memory.buf)
+        baselines = shared_baselines.copy()
+        del shared_baselines
+        return baselines
+    finally:
+        input_memory.close()
+        input_memory.unlink()
+        output_memory.close()
+        output_memory.unlink()
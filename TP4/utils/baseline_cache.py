@@ -0,0 +1,147 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from TP4.constants.constants import BASELINE_CACHE_MAX_ENTRIES
+from TP4.utils.als import baseline_als_batch
+
+
+class BaselineFit(object):
+    """
+    Last ALS fit of a series : its dates, the fitted values (sales and quantity with the promo weeks interpolated),
+    their baselines and the weights of the last iteration
+    """
+
+    def __init__(self, dates, values, baselines, weights):
+        self.dates = dates
+        self.values = values
+        self.baselines = baselines
+        self.weights = weights
+        for array in (self.dates, self.values, self.baselines, self.weights):
+            # The fits are shared, they are never modified in place
+            array.setflags(write=False)
+
+    def is_same(self, dates, values):
+        return np.array_equal(self.dates, dates) and np.array_equal(self.values, values, equal_nan=True)
+
+    def is_prefix_of(self, dates, values):
+        """
+        :return: whether or not dates and values only append weeks to the ones of the fit
+        """
+        n = len(self.dates)
+        return (n < len(dates) and np.array_equal(self.dates, dates[:n])
+                and np.array_equal(self.values, values[:, :n], equal_nan=True))
+
+
+class BaselineCache(object):
+    """
+    Cache of the baselines of the series, shared by all the sessions of the process
+
+    A fit is identified by the series id, its last date and the ALS parameters. When weeks are appended to a series,
+    its previous fit is not thrown away : its weights, extended with ones for the new weeks, warm start the ALS
+    iteration, which then converges in a few iterations. Series whose history changed are fitted from scratch.
+    """
+
+    def __init__(self, max_entries=BASELINE_CACHE_MAX_ENTRIES):
+        """
+        :param max_entries: maximum number of series kept in memory
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # (series_id, lam, p) -> key of the last fit of the series
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(series_id, dates, lam, p):
+        return series_id, dates[-1] if len(dates) > 0 else None, lam, p
+
+    def get_latest(self, series_id, lam, p):
+        with self._lock:
+            key = self._latest.get((series_id, lam, p))
+            fit = self._entries.get(key)
+            if fit is not None:
+                self._entries.move_to_end(key)
+        return fit
+
+    def set(self, series_id, lam, p, fit):
+        key = self.get_key(series_id, fit.dates, lam, p)
+        with self._lock:
+            # Only the last fit of a series is kept, it is the one warm starting the next week
+            previous = self._latest.get((series_id, lam, p))
+            if previous is not None and previous != key:
+                self._entries.pop(previous, None)
+            self._entries[key] = fit
+            self._entries.move_to_end(key)
+            self._latest[(series_id, lam, p)] = key
+            while len(self._entries) > self.max_entries:
+                (evicted_id, _, evicted_lam, evicted_p), _ = self._entries.popitem(last=False)
+                self._latest.pop((evicted_id, evicted_lam, evicted_p), None)
+
+    def fit(self, items, lam, p, niter=100, fit_cold=None):
+        """
+        Baselines of series, reusing or warm starting from their cached fits
+        :param items: list of (series_id, dates, values), values being a float numpy array of shape (2, length)
+        :param lam: smoothness parameter of the ALS
+        :param p: asymmetry parameter of the ALS
+        :param niter: maximum number of iterations
+        :param fit_cold: function(list of values) -> list of baselines fitting the series without a usable previous
+                         fit, e.g. on the baseline process pool. They are fitted with the warm started ones if None
+        :return: list of float numpy arrays of shape (2, length), in the order of items
+        """
+        baselines = [None] * len(items)
+        warm, weights, cold = [], [], []
+        for position, (series_id, dates, values) in enumerate(items):
+            fit = self.get_latest(series_id, lam, p)
+            if fit is not None and fit.is_same(dates, values):
+                baselines[position] = fit.baselines
+            elif fit is not None and fit.is_prefix_of(dates, values):
+                warm.append(position)
+                weights.append(np.hstack([fit.weights, np.ones((2, values.shape[1] - len(fit.dates)))]))
+            elif fit_cold is None:
+                warm.append(position)
+                weights.append(np.ones(values.shape))
+            else:
+                cold.append(position)
+
+        if len(warm) > 0:
+            lengths = np.repeat([items[position][2].shape[1] for position in warm], 2)
+            width = lengths.max()
+            y = np.zeros((len(lengths), width))
+            w = np.zeros((len(lengths), width))
+            for row, (position, warm_weights) in enumerate(zip(warm, weights)):
+                y[2 * row:2 * row + 2, :lengths[2 * row]] = items[position][2]
+                w[2 * row:2 * row + 2, :lengths[2 * row]] = warm_weights
+            fitted, _ = baseline_als_batch(y, lam, p, niter=niter, weights=w, lengths=lengths)
+            for row, position in enumerate(warm):
+                baselines[position] = fitted[2 * row:2 * row + 2, :lengths[2 * row]]
+        if len(cold) > 0:
+            for position, baseline in zip(cold, fit_cold([items[position][2] for position in cold])):
+                baselines[position] = baseline
+
+        for position in warm + cold:
+            series_id, dates, values = items[position]
+            baseline = np.array(baselines[position], dtype=np.float64)
+            # Weights of the fixed point, the ones the last iteration would give
+            last_weights = p * (values > baseline) + (1 - p) * (values < baseline)
+            self.set(series_id, lam, p, BaselineFit(np.array(dates), np.array(values, dtype=np.float64), baseline,
+                                                   last_weights))
+            baselines[position] = baseline
+        return baselines
+
+    def invalidate(self, series_id=None):
+        """
+        Drop the fits of a series, or all of them if series_id is None
+        """
+        with self._lock:
+            if series_id is None:
+                self._entries.clear()
+                self._latest.clear()
+                return
+            for key in [key for key in self._entries if key[0] == series_id]:
+                self._entries.pop(key)
+                self._latest.pop((series_id, key[2], key[3]), None)
+
+
+baseline_cache = BaselineCache()
@@ -0,0 +1,137 @@
+import struct
+
+import pandas as pd
+import pyarrow as pa
+
+from TP4.constants.constants import DATAFRAME_CACHE_CHUNK_BYTES, DATAFRAME_CACHE_COMPRESSION
+
+# Header layout : magic (5 bytes), codec version (1 byte), flags (1 byte), number of chunks (4 bytes)
+CODEC_MAGIC = b"TP4AR"
+CODEC_VERSION = 1
+HEADER_FORMAT = ">5sBBI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+FLAG_CHUNKED = 1
+
+
+class CodecError(Exception):
+    """
+    Raised when a cached payload was not written by the current version of the codec
+    """
+
+
+class ArrowIPCCodec(object):
+    """
+    Cache codec serializing pandas dataframes as Arrow IPC streams
+
+    Every payload starts with a header holding the codec version, so that entries written by an older codec (or by the
+    removed pyarrow serialization context) are rejected instead of being misread. Payloads bigger than chunk_bytes are
+    split: the main key only holds the header and the body is stored under "<key>:chunk:<index>" keys.
+    """
+
+    def __init__(self, compression=DATAFRAME_CACHE_COMPRESSION, chunk_bytes=DATAFRAME_CACHE_CHUNK_BYTES):
+        """
+        :param compression: "lz4", "zstd" or None, ignored if the codec is not available in the pyarrow build
+        :param chunk_bytes: maximum size of a single redis value
+        """
+        if compression and not pa.Codec.is_available(compression):
+            compression = None
+        self.compression = compression or None
+        self.chunk_bytes = chunk_bytes
+
+    @staticmethod
+    def get_chunk_key(key, index):
+        if isinstance(key, bytes):
+            key = key.decode("utf-8")
+        return f"{key}:chunk:{index}"
+
+    def serialize(self, df):
+        """
+        :param df: pandas dataframe
+        :return: Arrow IPC stream of the dataframe as a pyarrow buffer
+        """
+        table = pa.Table.from_pandas(df)
+        sink = pa.BufferOutputStream()
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        return sink.getvalue()
+
+    def deserialize(self, body):
+        """
+        :param body: Arrow IPC stream as bytes or buffer
+        :return: pandas dataframe, writable : the columns are copied out of the body rather than zero-copy views
+        """
+        with pa.ipc.open_stream(pa.py_buffer(body)) as reader:
+            table = reader.read_all()
+        return table.to_pandas()
+
+    def encode(self, key, df):
+        """
+        :param key: redis key of the entry
+        :param df: pandas dataframe to cache
+        :return: dict {redis key: value} to set
+        """
+        body = self.serialize(df)
+        if body.size <= self.chunk_bytes:
+            return {key: struct.pack(HEADER_FORMAT, CODEC_MAGIC, CODEC_VERSION, 0, 0) + body.to_pybytes()}
+
+        n_chunks = (body.size + self.chunk_bytes - 1) // self.chunk_bytes
+        values = {key: struct.pack(HEADER_FORMAT, CODEC_MAGIC, CODEC_VERSION, FLAG_CHUNKED, n_chunks)}
+        for index in range(n_chunks):
+            values[self.get_chunk_key(key, index)] = body[index * self.chunk_bytes:(index + 1) * self.chunk_bytes] \
+                .to_pybytes()
+        return values
+
+    def read_header(self, payload):
+        """
+        :param payload: value stored under the main key
+        :return: (flags, number of chunks)
+        """
+        if payload is None or len(payload) < HEADER_SIZE:
+            raise CodecError("Payload is empty or too short")
+        magic, version, flags, n_chunks = struct.unpack_from(HEADER_FORMAT, payload)
+        if magic != CODEC_MAGIC:
+            raise CodecError("Payload was not written by the Arrow IPC codec")
+        if version != CODEC_VERSION:
+            raise CodecError(f"Payload codec version {version} is not supported (expected {CODEC_VERSION})")
+        return flags, n_chunks
+
+    def get_chunk_keys(self, key, payload):
+        """
+        :param key: redis key of the entry
+        :param payload: value stored under the main key
+        :return: the redis keys of the chunks of the entry, empty if it is not chunked
+        """
+        flags, n_chunks = self.read_header(payload)
+        if not flags & FLAG_CHUNKED:
+            return []
+        return [self.get_chunk_key(key, index) for index in range(n_chunks)]
+
+    def decode(self, key, payload, redis_client=None, chunks=None):
+        """
+        :param key: redis key of the entry
+        :param payload: value stored under the main key
+        :param redis_client: redis client used to fetch the chunks of a chunked entry
+        :param chunks: already fetched chunks of a chunked entry
+        :return: pandas dataframe
+        """
+        chunk_keys = self.get_chunk_keys(key, payload)
+        if len(chunk_keys) == 0:
+            return self.deserialize(memoryview(payload)[HEADER_SIZE:])
+
+        if chunks is None:
+            chunks = redis_client.mget(chunk_keys)
+        if any(chunk is None for chunk in chunks):
+            raise CodecError("Some chunks of the payload have expired")
+        return self.deserialize(b"".join(chunks))
+
+
+def value_to_dataframe(value):
+    return pd.DataFrame({"value": [value]})
+
+
+def dataframe_to_value(df):
+    return df["value"].iloc[0]
+
+
+codec = ArrowIPCCodec()
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+from logzero import logger
+
+from TP4.constants.constants import DATASET_CACHE_DIR, DATASET_USE_FEATHER
+
+
+class DatasetRegistry(object):
+    """
+    Process-wide registry of read-only datasets loaded from files
+
+    Each source is parsed once per process. When DATASET_USE_FEATHER is set, the parsed frame is also written once per
+    host to a Feather file which is then memory-mapped, so that the numeric columns of every worker process share the
+    same pages of memory. The entries are invalidated when the modification time of the source file changes.
+    """
+
+    def __init__(self, cache_dir=DATASET_CACHE_DIR, use_feather=DATASET_USE_FEATHER):
+        """
+        :param cache_dir: directory storing the memory-mapped Feather files
+        :param use_feather: whether or not to go through a memory-mapped Feather file
+        """
+        self.cache_dir = cache_dir
+        self.use_feather = use_feather
+        self._datasets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(path, drop_columns, read_kwargs):
+        return json.dumps([os.path.abspath(path), sorted(drop_columns or []), read_kwargs], sort_keys=True,
+                          default=str)
+
+    def get(self, path, drop_columns=None, **read_kwargs):
+        """
+        Get a session view of a dataset, loading it only if it is not in the registry or if the file has changed
+
+        The returned frame is a shallow copy: it shares the data of the registry but adding or dropping columns
+        does not affect the other sessions. The data itself must not be modified in place.
+
+        :param path: path of the csv file
+        :param drop_columns: list of columns to drop after reading
+        :param read_kwargs: args given to pd.read_csv
+        :return: pandas dataframe
+        """
+        key = self.get_key(path, drop_columns, read_kwargs)
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            entry = self._datasets.get(key)
+            if entry is None or entry[0] != mtime:
+                logger.info(f"loading dataset {path}")
+                df = self.load(path, key, mtime, drop_columns, read_kwargs)
+                self._datasets[key] = (mtime, df)
+            else:
+                df = entry[1]
+        return df.copy(deep=False)
+
+    def load(self, path, key, mtime, drop_columns, read_kwargs):
+        df = pd.read_csv(path, **read_kwargs)
+        if drop_columns:
+            df = df.drop(drop_columns, axis=1)
+        if not self.use_feather:
+            return df
+
+        file_name = hashlib.sha1(f"{key}{mtime}".encode("utf-8")).hexdigest() + ".feather"
+        feather_path = os.path.join(self.cache_dir, file_name)
+        try:
+            if not os.path.exists(feather_path):
+                os.makedirs(self.cache_dir, exist_ok=True)
+                # Write under a temporary name first so that other processes never map a partial file
+                tmp_path = f"{feather_path}.{os.getpid()}.tmp"
+                feather.write_feather(df, tmp_path, compression="uncompressed")
+                os.replace(tmp_path, feather_path)
+            table = feather.read_table(feather_path, memory_map=True)
+            return table.to_pandas(split_blocks=True)
+        except (OSError, pa.ArrowException) as e:
+            logger.warning(f"could not memory-map dataset {path}, keeping it in process memory: {str(e)}")
+            return df
+
+    def invalidate(self, path=None):
+        """
+        :param path: path of the dataset to remove from the registry, all datasets are removed if None
+        """
+        with self._lock:
+            if path is None:
+                self._datasets = {}
+            else:
+                prefix = json.dumps([os.path.abspath(path)])[:-1]
+                self._datasets = {k: v for k, v in self._datasets.items() if not k.startswith(prefix)}
+
+
+dataset_registry = DatasetRegistry()
+
+
+def get_dataset(path, drop_columns=None, **read_kwargs):
+    """
+    Get a read-only view of a dataset shared by all the sessions of the process
+    :param path: path of the csv file
+    :param drop_columns: list of columns to drop after reading
+    :param read_kwargs: args given to pd.read_csv
+    :return: pandas dataframe
+    """
+    return dataset_registry.get(path, drop_columns=drop_columns, **read_kwargs)
@@ -0,0 +1,76 @@
+import asyncio
+from functools import partial
+
+import panel as pn
+
+from TP4.constants.constants import SELECTOR_DEBOUNCE_MILLISECONDS
+
+
+class Debouncer(object):
+    """
+    Coalesce rapid calls into a single one
+
+    Each call to trigger() restarts the timer, and the callback is run once, delay_ms after the last trigger, with the
+    union of all the triggered events. The callback is run on the next tick of the Bokeh document of the session, so
+    that it holds the document lock. Without a running event loop (notebook, scripts) the callback is run immediately.
+    """
+
+    def __init__(self, callback, delay_ms=SELECTOR_DEBOUNCE_MILLISECONDS):
+        """
+        :param callback: function called with the list of the coalesced events
+        :param delay_ms: time without new trigger before the callback is run
+        """
+        self.callback = callback
+        self.delay_ms = delay_ms
+        self.pending_events = []
+        self._handle = None
+        self._generation = 0
+
+    def trigger(self, *events):
+        """
+        :param events: events to give to the callback, e.g. the param events of a watcher
+        """
+        self.pending_events.extend(events)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        self.cancel_timer()
+        self._generation += 1
+        self._handle = loop.call_later(self.delay_ms / 1000, partial(self._fire, self._generation, pn.state.curdoc))
+
+    def _fire(self, generation, doc):
+        if generation != self._generation:
+            # A newer trigger superseded this one
+            return
+        self._handle = None
+        if doc is not None and doc.session_context:
+            doc.add_next_tick_callback(partial(self._flush_if_current, generation))
+        else:
+            self.flush()
+
+    def _flush_if_current(self, generation):
+        if generation == self._generation:
+            self.flush()
+
+    def flush(self):
+        """
+        Run the callback now with the pending events
+        """
+        self.cancel_timer()
+        events, self.pending_events = self.pending_events, []
+        self.callback(events)
+
+    def cancel_timer(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def cancel(self):
+        """
+        Drop the pending events without running the callback
+        """
+        self.cancel_timer()
+        self._generation += 1
+        self.pending_events = []
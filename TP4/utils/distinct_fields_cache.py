@@ -0,0 +1,133 @@
+import threading
+import time
+
+from logzero import logger
+
+from TP4.constants.constants import DISTINCT_FIELDS_VERSION_CHECK_SECONDS, FILTERS_EXPIRY_SECONDS
+from TP4.utils.cache_codec import codec
+from TP4.utils.gcp import get_df_from_redis, get_query_executor, set_values_to_redis
+from TP4.utils.result_cache import get_result_cache_key
+
+DISTINCT_FIELDS_CACHE_PREFIX = "distinct"
+
+
+class DistinctFieldsCache(object):
+    """
+    Cache of the distinct fields dataframes of the selectors, shared by all the sessions and tenants of the process and,
+    through redis, by all the processes
+
+    An entry is identified by the query (table, country, partition string, global/local, fields) and versioned with the
+    version of the table, which changes when the cached entries of the table are invalidated. Once an entry is in
+    memory it is served immediately; when it has not been checked for check_seconds, the version of the table is
+    checked in the background and the entry is reloaded only if the table has changed since.
+    """
+
+    def __init__(self, check_seconds=DISTINCT_FIELDS_VERSION_CHECK_SECONDS, expiry_seconds=FILTERS_EXPIRY_SECONDS):
+        """
+        :param check_seconds: minimum time between two checks of the version of an entry
+        :param expiry_seconds: expiry of the redis entries
+        """
+        self.check_seconds = check_seconds
+        self.expiry_seconds = expiry_seconds
+        # key -> [version, dataframe, time of the last version check, refresh running]
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(cpg_table, cpg_country, partition_string, global_local, fields):
+        return get_result_cache_key(cpg_table=cpg_table, cpg_country=cpg_country, partition_string=partition_string,
+                                    global_local=global_local, fields=list(fields)) \
+            .replace("result:", f"{DISTINCT_FIELDS_CACHE_PREFIX}:", 1)
+
+    def get_key_lock(self, key):
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def get(self, key, load, get_version, tags=None):
+        """
+        :param key: key given by get_key
+        :param load: function returning the distinct fields dataframe, i.e. running the query
+        :param get_version: function returning the version of the table, None if it is unknown, in which case the
+                            dataframe is loaded without being cached
+        :param tags: dict {tag: value} of the redis entry, e.g. {"table": cpg_table}
+        :return: pandas dataframe, shared by the sessions so it must not be modified in place
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            # Only one session runs the query of a given key, the others wait for its result
+            with self.get_key_lock(key):
+                entry = self._entries.get(key)
+                if entry is None:
+                    version = self.get_version(get_version)
+                    if version is None:
+                        # An entry without version could never be invalidated when the table changes
+                        return load()
+                    df = self.load(key, version, load, tags)
+                    entry = [version, df, time.time(), False]
+                    self._entries[key] = entry
+        elif time.time() - entry[2] > self.check_seconds and not entry[3]:
+            entry[3] = True
+            get_query_executor().submit(self.refresh, key, load, get_version, tags)
+        return entry[1].copy(deep=False)
+
+    @staticmethod
+    def get_version(get_version):
+        try:
+            version = get_version()
+            return None if version is None else str(version)
+        except Exception as e:
+            logger.warning(f"could not get the version of the distinct fields: {str(e)}")
+            return None
+
+    def load(self, key, version, load, tags=None):
+        versioned_key = f"{key}:{version}"
+        try:
+            df, redis_client, context = get_df_from_redis(versioned_key)
+        except Exception as e:
+            logger.warning(f"distinct fields cache unavailable: {str(e)}")
+            df, redis_client = "Empty", None
+        if not isinstance(df, str):
+            logger.info("distinct fields retrieved from redis")
+            return df
+
+        df = load()
+        if redis_client is not None:
+            try:
+                set_values_to_redis(codec.encode(versioned_key, df), redis_client, self.expiry_seconds, tags=tags)
+            except Exception as e:
+                logger.warning(f"could not cache distinct fields in redis: {str(e)}")
+        return df
+
+    def refresh(self, key, load, get_version, tags=None):
+        """
+        Reload the entry if the version of the table has changed, run in the background by get
+        """
+        entry = self._entries[key]
+        try:
+            version = self.get_version(get_version)
+            if version is not None and version != entry[0]:
+                logger.info(f"distinct fields {key} changed from version {entry[0]} to {version}, reloading")
+                df = self.load(key, version, load, tags)
+                self._entries[key] = [version, df, time.time(), False]
+                return
+            entry[2] = time.time()
+        except Exception as e:
+            logger.warning(f"could not refresh the distinct fields {key}: {str(e)}")
+        finally:
+            entry[3] = False
+
+    def invalidate(self, key=None):
+        """
+        :param key: key of the entry to drop from memory, every entry if None
+        """
+        with self._lock:
+            if key is None:
+                self._entries = {}
+            else:
+                self._entries.pop(key, None)
+
+
+distinct_fields_cache = DistinctFieldsCache()
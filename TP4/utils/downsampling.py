@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+
+def is_date_x(x):
+    """
+    :param x: numpy array of numbers or dates
+    :return: whether or not to_numeric_x converts x from dates
+    """
+    return np.issubdtype(x.dtype, np.datetime64) or x.dtype.kind in ("O", "U", "S")
+
+
+def to_numeric_x(x):
+    """
+    :param x: numpy array, pandas series or list of numbers or dates
+    :return: float numpy array, the dates as milliseconds since epoch like the Bokeh datetime axes
+    """
+    if isinstance(x, (pd.Series, pd.Index)):
+        x = x.to_numpy()
+    x = np.asarray(x)
+    if is_date_x(x):
+        x = pd.to_datetime(x).to_numpy(dtype="datetime64[ns]")
+        return x.astype(np.int64) / 1e6
+    return x.astype(np.float64)
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and last points and, in each of the n_out - 2 buckets in between,
+    the point making the largest triangle with the point kept in the previous bucket and the mean of the next bucket
+    :param x: sorted float numpy array
+    :param y: float numpy array
+    :param n_out: number of points to keep
+    :return: sorted numpy array of the indices of the points to keep
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    bounds = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Means of each bucket, used as the third point of the triangles of the previous bucket
+    sizes = np.diff(bounds)
+    mean_x = np.add.reduceat(x[1:n - 1], bounds[:-1] - 1) / sizes
+    mean_y = np.add.reduceat(y[1:n - 1], bounds[:-1] - 1) / sizes
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = bounds[bucket], bounds[bucket + 1]
+        areas = np.abs((x[previous] - mean_x[bucket]) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (mean_y[bucket] - y[previous]))
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+    return indices
+
+
+def min_max(x, y, n_out):
+    """
+    Keeps the first and last points of each bucket and its minimum and maximum, so that the peaks are never dropped
+    :param x: sorted float numpy array
+    :param y: float numpy array
+    :param n_out: maximum number of points to keep
+    :return: sorted numpy array of the indices of the points to keep
+    """
+    n = len(x)
+    n_buckets = n_out // 4
+    if n_out >= n or n_buckets < 1:
+        return np.arange(n)
+
+    bounds = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    bucket_ids = np.repeat(np.arange(n_buckets), np.diff(bounds))
+    order = np.lexsort((y, bucket_ids))
+    first_of_bucket = bounds[:-1]
+    last_of_bucket = bounds[1:] - 1
+    # Inside each bucket the points are sorted by y, the first one is the minimum and the last one the maximum
+    minimums = order[first_of_bucket]
+    maximums = order[last_of_bucket]
+    return np.unique(np.concatenate([first_of_bucket, last_of_bucket, minimums, maximums]))
+
+
+def downsample(x, y, n_out, method="lttb", start=None, end=None):
+    """
+    Select the points to draw for a plot n_out pixels wide
+    :param x: sorted float numpy array, see to_numeric_x
+    :param y: float numpy array
+    :param n_out: maximum number of points to keep, e.g. the width of the plot in pixels
+    :param method: "lttb" or "minmax"
+    :param start: start of the visible range, the points before are dropped except the last one
+    :param end: end of the visible range, the points after are dropped except the first one
+    :return: sorted numpy array of the indices of the points to keep
+    """
+    first = 0 if start is None else max(int(np.searchsorted(x, start, side="left")) - 1, 0)
+    last = len(x) if end is None else min(int(np.searchsorted(x, end, side="right")) + 1, len(x))
+    y_visible = np.nan_to_num(np.asarray(y[first:last], dtype=np.float64))
+    if method == "minmax":
+        indices = min_max(x[first:last], y_visible, n_out)
+    else:
+        indices = lttb(x[first:last], y_visible, n_out)
+    return indices + first
@@ -87,6 +87,65 @@ def format_label_euro(val):
     return "%.1f%s" % (val, ["€", "K€", "M€", "B€"][magnitude])
 
 
+MAGNITUDE_SUFFIXES = ["", "K", "M", "B"]
+MAGNITUDE_SUFFIXES_EURO = ["€", "K€", "M€", "B€"]
+
+
+def get_magnitudes(values):
+    """
+    Array version of the "while abs(num) >= 1000" loop of format_label : the magnitude of each value is bucketed from
+    its log10, and the values are divided by 1000 the same number of times as the loop does, so that the rounding is
+    the same. The values of 1000B and more, which make the loop fail, are kept in B
+    :param values: numpy array, pandas series or list of numbers
+    :return: (numpy array of the scaled values, numpy array of the magnitudes, index in MAGNITUDE_SUFFIXES)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    max_magnitude = len(MAGNITUDE_SUFFIXES) - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitudes = np.floor(np.log10(np.abs(values)) / 3)
+    magnitudes = np.clip(np.nan_to_num(magnitudes, nan=0, posinf=max_magnitude, neginf=0), 0, max_magnitude) \
+        .astype(np.int64)
+
+    # log10 can be off by one at the exact powers of 1000, the loop condition is checked on the divided values
+    scaled = divide_by_thousands(values, magnitudes)
+    too_big = (np.abs(scaled) >= 1000) & (magnitudes < max_magnitude)
+    too_small = (magnitudes > 0) & (np.abs(divide_by_thousands(values, magnitudes - 1)) < 1000)
+    magnitudes = magnitudes + too_big - too_small
+    return divide_by_thousands(values, magnitudes), magnitudes
+
+
+def divide_by_thousands(values, magnitudes):
+    # Divided step by step like the scalar loop, dividing by 1000 ** magnitude can round differently
+    scaled = values
+    for step in range(1, magnitudes.max(initial=0) + 1):
+        scaled = np.where(magnitudes >= step, scaled / 1000.0, scaled)
+    return scaled
+
+
+def format_with_magnitudes(values, value_format, suffixes, separator=""):
+    scaled, magnitudes = get_magnitudes(values)
+    numbers = np.char.mod(value_format, scaled)
+    return np.char.add(np.char.add(numbers, separator), np.asarray(suffixes)[magnitudes]).astype(object)
+
+
+def format_labels(values):
+    """
+    Array version of format_label
+    :param values: numpy array, pandas series or list of numbers
+    :return: numpy array of labels
+    """
+    return format_with_magnitudes(values, "%.1f", MAGNITUDE_SUFFIXES)
+
+
+def format_labels_euro(values):
+    """
+    Array version of format_label_euro
+    :param values: numpy array, pandas series or list of numbers
+    :return: numpy array of labels
+    """
+    return format_with_magnitudes(values, "%.1f", MAGNITUDE_SUFFIXES_EURO)
+
+
 def override_numerize(n, decimals=2):
     if np.isnan(n):
         return str(n)
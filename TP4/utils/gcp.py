@@ -2,6 +2,8 @@ import asyncio
 import json
 import os
 import re
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import timedelta
 
@@ -9,7 +11,6 @@ import aiohttp
 import async_timeout
 import pandas as pd
 import panel as pn
-import pyarrow as pa
 import redis
 from logzero import logger
 
@@ -28,42 +29,66 @@ from TP4.constants.constants import (
     FILTERS_EXPIRY_SECONDS,
     METRICS_SERVICE_API_KEY,
     METRICS_SERVICE_HOST,
+    QUERY_EXECUTOR_MAX_WORKERS,
+    REDIS_DELETE_BATCH_SIZE,
+    REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
     REDIS_HOST,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_NAMESPACE,
+    REDIS_POOL_TIMEOUT_SECONDS,
     REDIS_PORT,
 )
+from TP4.utils.cache_codec import codec, dataframe_to_value, value_to_dataframe
 
 DASHBOARD_USAGE_URL_TIMEOUT = 60
 DASHBOARD_USAGE_LIMIT_PER_HOST = 5
 
 
+_query_executor = None
+_query_executor_lock = threading.Lock()
+
+
+def get_query_executor():
+    """
+    Get the bounded thread pool shared by all the sessions of the process to run queries.
+    Functions running on it must not wait on other futures of the same pool
+    return: executor
+    """
+    global _query_executor
+    if _query_executor is None:
+        with _query_executor_lock:
+            if _query_executor is None:
+                _query_executor = ThreadPoolExecutor(max_workers=QUERY_EXECUTOR_MAX_WORKERS,
+                                                     thread_name_prefix="query")
+    return _query_executor
+
+
+def get_results_sorted_by_index(futures):
+    all_results = []
+    for future in as_completed(futures):
+        result, index = future.result()
+        all_results.append([result, index])
+    all_results = sorted(all_results, key=lambda x: x[-1])
+    return [result[0] for result in all_results]
+
+
 def execute_multiple_queries_at_once(list_functions, filters):
-    with ThreadPoolExecutor() as executor:
-        if isinstance(filters, list):
-            if len(list_functions == len(filters)):
-                futures = [executor.submit(f, filter) for f, filter in zip(list_functions, filters)]
-        else:
-            futures = [executor.submit(f, filters) for f in list_functions]
-        all_results = []
-        for idx, future in enumerate(as_completed(futures)):
-            result, index = future.result()
-            all_results.append([result, index])
-        all_results = sorted(all_results, key=lambda x: x[-1])
-    all_dataframe = [result[0] for result in all_results]
-    return all_dataframe
+    executor = get_query_executor()
+    if isinstance(filters, list):
+        if len(list_functions) != len(filters):
+            raise ValueError(f"Got {len(list_functions)} functions for {len(filters)} filters")
+        futures = [executor.submit(f, filter) for f, filter in zip(list_functions, filters)]
+    else:
+        futures = [executor.submit(f, filters) for f in list_functions]
+    return get_results_sorted_by_index(futures)
 
 
 def multithread_queries_execution_for_monitoring(list_functions, table_names, countries, time_period_types, positions):
-    with ThreadPoolExecutor() as executor:
-        futures = [executor.submit(f, table_name, country, time_period_type, position) for
-                   f, table_name, country, time_period_type, position in zip(list_functions, table_names, countries,
-                                                                             time_period_types, positions)]
-        all_results = []
-        for idx, future in enumerate(as_completed(futures)):
-            result, index = future.result()
-            all_results.append([result, index])
-        all_results = sorted(all_results, key=lambda x: x[-1])
-    all_dataframe = [result[0] for result in all_results]
-    return all_dataframe
+    executor = get_query_executor()
+    futures = [executor.submit(f, table_name, country, time_period_type, position) for
+               f, table_name, country, time_period_type, position in zip(list_functions, table_names, countries,
+                                                                         time_period_types, positions)]
+    return get_results_sorted_by_index(futures)
 
 
 def get_dashboard_identifier_from_session() -> str:
@@ -78,44 +103,181 @@ def get_dashboard_identifier_from_session() -> str:
         return "No ID"
 
 
+_redis_pool = None
+_redis_pool_lock = threading.Lock()
+
+
+def get_redis_pool():
+    """
+    Get the connection pool shared by all the redis clients of the process, created at first use
+    return: redis connection pool
+    """
+    global _redis_pool
+    if _redis_pool is None:
+        with _redis_pool_lock:
+            if _redis_pool is None:
+                _redis_pool = redis.BlockingConnectionPool(
+                    host=REDIS_HOST,
+                    port=REDIS_PORT,
+                    max_connections=REDIS_MAX_CONNECTIONS,
+                    timeout=REDIS_POOL_TIMEOUT_SECONDS,
+                    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+                    socket_keepalive=True,
+                )
+    return _redis_pool
+
+
 def get_redis():
-    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+    """
+    Get a redis client borrowing its connections from the process-wide pool
+    return: redis client
+    """
+    return redis.Redis(connection_pool=get_redis_pool())
 
 
 def get_df_from_redis(query):
     r = get_redis()
-    context = pa.default_serialization_context()
     try:
-        df_from_redis = context.deserialize(r.get(query))
-        df = df_from_redis.copy()
-        del df_from_redis
-    except:
+        df = codec.decode(query, r.get(query), r)
+    except Exception:
         df = "Empty"
-    return df, r, context
+    return df, r, codec
+
+
+def get_dfs_from_redis(queries):
+    """
+    Get several cached dataframes in at most two round trips (one for the entries, one for all their chunks)
+    return: list of dataframes, "Empty" for the missing or invalid entries
+    """
+    r = get_redis()
+    payloads = r.mget(queries)
+    chunk_keys = {}
+    for query, payload in zip(queries, payloads):
+        try:
+            chunk_keys[query] = codec.get_chunk_keys(query, payload)
+        except Exception:
+            chunk_keys[query] = []
+    all_chunk_keys = [key for keys in chunk_keys.values() for key in keys]
+    chunks = dict(zip(all_chunk_keys, r.mget(all_chunk_keys))) if len(all_chunk_keys) > 0 else {}
+
+    all_df = []
+    for query, payload in zip(queries, payloads):
+        try:
+            all_df.append(codec.decode(query, payload, chunks=[chunks[key] for key in chunk_keys[query]]))
+        except Exception:
+            all_df.append("Empty")
+    return all_df
 
 
 def get_date_from_redis(table_name):
     r = get_redis()
-    context = pa.default_serialization_context()
     try:
-        date = context.deserialize(r.get(table_name))
-    except:
+        date = dataframe_to_value(codec.decode(table_name, r.get(table_name), r))
+    except Exception:
         date = "Empty"
-    return date, r, context
+    return date, r, codec
+
+
+def get_table_version_key(table_name):
+    return f"{REDIS_NAMESPACE}:version:table:{table_name}"
+
+
+def get_table_version_from_redis(table_name):
+    """
+    Get the version of the cached data of a table, created on the first call and changed by invalidate_redis_tags
+    each time the entries tagged with the table are invalidated
+    return: version, None if redis is unavailable
+    """
+    key = get_table_version_key(table_name)
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.set(key, 1, nx=True)
+        pipeline.sadd(get_namespace_versions_set(), key)
+        pipeline.get(key)
+        version = pipeline.execute()[-1]
+    except Exception as e:
+        logger.warning(f"could not get the version of table {table_name}: {str(e)}")
+        return None
+    return version.decode("utf-8") if isinstance(version, bytes) else version
+
+
+def get_namespace_versions_set():
+    return f"{REDIS_NAMESPACE}:versions"
 
 
-def set_df_to_redis(query, df, redis_client, context):
+def get_namespace_keys_set():
+    return f"{REDIS_NAMESPACE}:keys"
+
+
+def get_namespace_tags_set():
+    return f"{REDIS_NAMESPACE}:tags"
+
+
+def get_tag_set(tag, value):
+    return f"{REDIS_NAMESPACE}:tag:{tag}:{value}"
+
+
+def register_redis_keys_tags(pipeline, keys, tags, expiry_seconds):
+    """
+    Add the keys to the secondary index of the application: the namespace set and one set per tag.
+    The sets are sorted sets scored by the expiry timestamp of their members, the expired members of the written
+    sets are pruned in the same pipeline so that the index only grows with the live keys
+    :param pipeline: redis pipeline the commands are queued on
+    :param keys: list of redis keys
+    :param tags: dict {tag: value}, e.g. {"tenant": "101015", "table": "ABT_FLAT"}, None values are ignored
+    :param expiry_seconds: expiry of the keys
+    """
+    now = time.time()
+    expires_at = now + expiry_seconds
+    members = {key: expires_at for key in keys}
+    pipeline.zadd(get_namespace_keys_set(), members)
+    pipeline.zremrangebyscore(get_namespace_keys_set(), "-inf", now)
+    for tag, value in (tags or {}).items():
+        if value is None:
+            continue
+        tag_set = get_tag_set(tag, value)
+        pipeline.zadd(tag_set, members)
+        pipeline.zremrangebyscore(tag_set, "-inf", now)
+        # A tag set is scored by its last expiring member, it is swept once they have all expired
+        pipeline.zadd(get_namespace_tags_set(), {tag_set: expires_at}, gt=True)
+
+
+def prune_redis_index(redis_client):
+    """
+    Remove the expired members of the tag sets which are not written anymore, run on invalidation. The sets emptied
+    this way are deleted by redis, only the expired members are removed so that a concurrent write is never lost
+    """
+    now = time.time()
+    expired_tag_sets = redis_client.zrangebyscore(get_namespace_tags_set(), "-inf", now)
+    if len(expired_tag_sets) == 0:
+        return
+    pipeline = redis_client.pipeline(transaction=False)
+    for tag_set in expired_tag_sets:
+        pipeline.zremrangebyscore(tag_set, "-inf", now)
+    pipeline.zremrangebyscore(get_namespace_tags_set(), "-inf", now)
+    pipeline.execute()
+
+
+def set_values_to_redis(values, redis_client, expiry_seconds, tags=None):
+    pipeline = redis_client.pipeline(transaction=False)
+    for key, value in values.items():
+        pipeline.set(key, value, ex=timedelta(seconds=expiry_seconds))
+    if len(values) > 0:
+        register_redis_keys_tags(pipeline, list(values.keys()), tags, expiry_seconds)
+    pipeline.execute()
+
+
+def set_df_to_redis(query, df, redis_client, context=codec, tags=None):
     try:
-        redis_client.set(query, context.serialize(df).to_buffer().to_pybytes(),
-                         ex=timedelta(seconds=DATAFRAME_EXPIRY_SECONDS))
+        set_values_to_redis(context.encode(query, df), redis_client, DATAFRAME_EXPIRY_SECONDS, tags=tags)
     except:
         return None
 
 
-def set_last_date_to_redis(table_name, last_modification_date, redis_client, context):
+def set_last_date_to_redis(table_name, last_modification_date, redis_client, context=codec):
     try:
-        redis_client.set(table_name, context.serialize(last_modification_date).to_buffer().to_pybytes(),
-                         ex=timedelta(seconds=FILTERS_EXPIRY_SECONDS))
+        set_values_to_redis(context.encode(table_name, value_to_dataframe(last_modification_date)), redis_client,
+                            FILTERS_EXPIRY_SECONDS)
     except:
         return None
 
@@ -164,8 +326,7 @@ def replace_invalid_characters_in_labels(labels):
 
 
 def flushall():
-    redis_client = get_redis()
-    redis_client.flushall()
+    flush_namespace()
 
 
 def check_emptiness_of_dataframes(list_of_dfs):
@@ -209,34 +370,91 @@ async def send_dashboard_usage_async(url: str, headers: dict, dashboard_identifi
                      f"error: {str(e)}")
 
 
-def get_all_redis_keys_from_string(string):
+def get_redis_keys_from_tags(tags):
+    """
+    Get the keys registered with all the given tags, using the secondary index instead of scanning the keyspace.
+    The expired members are skipped with their score, the read does not write to the index
+    :param tags: dict {tag: value}
+    return: list of keys
+    """
+    tag_sets = [get_tag_set(tag, value) for tag, value in tags.items() if value is not None]
+    if len(tag_sets) == 0:
+        return []
+    now = time.time()
+    members = get_redis().zinter(tag_sets, aggregate="MIN", withscores=True)
+    return [key for key, expires_at in members if expires_at > now]
+
+
+def delete_redis_keys(keys):
+    """
+    Delete the keys by batches and remove them from the namespace set
+    """
+    r = get_redis()
+    keys = list(keys)
+    for index in range(0, len(keys), REDIS_DELETE_BATCH_SIZE):
+        batch = keys[index:index + REDIS_DELETE_BATCH_SIZE]
+        pipeline = r.pipeline(transaction=False)
+        pipeline.unlink(*batch)
+        pipeline.zrem(get_namespace_keys_set(), *batch)
+        pipeline.execute()
+
+
+def invalidate_redis_tags(tags):
+    """
+    Delete every cached entry registered with all the given tags, e.g. {"tenant": "101015", "country": "FRA"}
+    return: number of deleted keys
+    """
+    keys = get_redis_keys_from_tags(tags)
+    delete_redis_keys(keys)
+    prune_redis_index(get_redis())
+    if tags.get("table") is not None:
+        # The processes keeping the data of the table in memory reload it on their next version check
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.incr(get_table_version_key(tags["table"]))
+        pipeline.sadd(get_namespace_versions_set(), get_table_version_key(tags["table"]))
+        pipeline.execute()
+    if len(keys) > 0:
+        pipeline = get_redis().pipeline(transaction=False)
+        for tag, value in tags.items():
+            if value is not None:
+                pipeline.zrem(get_tag_set(tag, value), *keys)
+        pipeline.execute()
+    return len(keys)
+
+
+def flush_namespace():
+    """
+    Delete all the keys registered by this application, leaving the rest of a shared redis untouched
+    """
     r = get_redis()
-    list_key = []
-    for key in r.scan_iter(f"*{string}*"):
-        list_key.append(key)
-    return list_key
+    for set_name in [get_namespace_keys_set(), get_namespace_tags_set()]:
+        keys = [key for key, _ in r.zscan_iter(set_name, count=REDIS_DELETE_BATCH_SIZE)]
+        delete_redis_keys(keys)
+    delete_redis_keys(list(r.sscan_iter(get_namespace_versions_set(), count=REDIS_DELETE_BATCH_SIZE)))
+    r.unlink(get_namespace_keys_set(), get_namespace_tags_set(), get_namespace_versions_set())
+
+
+def get_all_redis_keys_from_string(string):
+    return get_all_redis_keys_from_list_of_string([string]) or []
 
 
 def get_all_redis_keys_from_list_of_string(list_of_string):
-    list_complete = []
-    for string in list_of_string:
-        if isinstance(string, str):
-            list_keys = get_all_redis_keys_from_string(string)
-            list_complete.append(list_keys)
-    if len(list_complete) > 0:
-        list_right = list_complete[0]
-    else:
+    """
+    Legacy lookup of the keys containing all the given strings, for keys which are not registered with tags.
+    The keyspace is scanned once for all the strings, prefer get_redis_keys_from_tags
+    """
+    list_of_string = [string for string in list_of_string if isinstance(string, str)]
+    if len(list_of_string) == 0:
         return None
-    for i in range(1, len(list_complete)):
-        list_right = list(set(list_right) & set(list_complete[i]))
-    return list_right
+    r = get_redis()
+    encoded_strings = [string.encode("utf-8") for string in list_of_string]
+    return [key for key in r.scan_iter(f"*{list_of_string[0]}*", count=REDIS_DELETE_BATCH_SIZE)
+            if all(string in key for string in encoded_strings[1:])]
 
 
 def delete_redis_key_from_cache(key):
-    r = get_redis()
-    r.delete(key)
+    delete_redis_keys([key])
 
 
 def delete_all_redis():
-    r = get_redis()
-    r.flushall()
+    flush_namespace()
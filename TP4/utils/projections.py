@@ -0,0 +1,355 @@
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import umap
+from logzero import logger
+from sklearn import decomposition, manifold
+
+from TP4.constants.constants import (
+    PROJECTION_CACHE_MAX_ENTRIES,
+    PROJECTION_MODEL_CACHE_MAX_ENTRIES,
+    PROJECTION_PROCESS_POOL_MAX_WORKERS,
+    PROJECTION_REFIT_APPENDED_RATIO,
+    PROJECTION_REFIT_DRIFT,
+)
+from TP4.utils.gcp import get_query_executor
+
+PROJECTION_METHODS = ["PCA", "T-SNE", "UMAP"]
+# Methods too slow to run in a session callback, they are run on the projection process pool
+PROCESS_POOL_METHODS = ["T-SNE", "UMAP"]
+# Methods whose fitted model can place new rows in an existing projection
+TRANSFORM_METHODS = ["UMAP"]
+DEFAULT_PROJECTION_PARAMS = {"UMAP": {"n_neighbors": 30, "min_dist": 0.1}}
+
+
+def get_dataset_fingerprint(df):
+    """
+    :param df: pandas dataframe
+    :return: hash of the columns and of the values of the dataframe
+    """
+    fingerprint = hashlib.sha1(str(list(df.columns)).encode("utf-8"))
+    fingerprint.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return fingerprint.hexdigest()
+
+
+def get_row_hashes(df):
+    return pd.util.hash_pandas_object(df, index=False).values
+
+
+def get_projection_params(method, n_neighbors=None, min_dist=None):
+    """
+    :return: hyperparameters of the projection method, only the ones the method depends on
+    """
+    if method == "UMAP":
+        return {"n_neighbors": n_neighbors, "min_dist": min_dist}
+    return {}
+
+
+def compute_projection(values, method, params):
+    """
+    :param values: numpy array (n_samples, n_features)
+    :param method: "PCA", "T-SNE" or "UMAP"
+    :param params: hyperparameters given by get_projection_params
+    :return: numpy array (n_samples, 2)
+    """
+    if method == "PCA":
+        return decomposition.PCA(n_components=2).fit_transform(values)
+    if method == "T-SNE":
+        return manifold.TSNE(n_components=2, init='random', random_state=42, perplexity=30).fit_transform(values)
+    if method == "UMAP":
+        return umap.UMAP(n_neighbors=params["n_neighbors"], min_dist=params["min_dist"],
+                         metric="euclidean").fit_transform(values)
+    raise ValueError(f"Unknown projection method {method}")
+
+
+def fit_projection(values, method, params):
+    """
+    Same as compute_projection, but also returns the fitted model of the methods able to transform new rows
+    :return: (fitted model or None, numpy array (n_samples, 2))
+    """
+    if method == "UMAP":
+        model = umap.UMAP(n_neighbors=params["n_neighbors"], min_dist=params["min_dist"], metric="euclidean")
+        return model, model.fit_transform(values)
+    return None, compute_projection(values, method, params)
+
+
+class ProjectionModel(object):
+    """
+    A fitted projection of a dataset, extended with the rows appended to the dataset since the fit
+    """
+
+    def __init__(self, model, row_hashes, embedding, mean, std, n_fitted):
+        self.model = model
+        self.row_hashes = row_hashes
+        self.embedding = embedding
+        self.mean = mean
+        self.std = std
+        self.n_fitted = n_fitted
+
+    @classmethod
+    def from_fit(cls, model, data, embedding):
+        values = data.values.astype(np.float64)
+        return cls(model, get_row_hashes(data), embedding, values.mean(axis=0), values.std(axis=0) + 1e-12, len(data))
+
+    def get_n_existing_rows(self, row_hashes):
+        """
+        :param row_hashes: row hashes of the new version of the dataset
+        :return: number of rows already projected if the dataset is the projected one with rows appended, else None
+        """
+        n_rows = len(self.row_hashes)
+        if len(row_hashes) <= n_rows or not np.array_equal(row_hashes[:n_rows], self.row_hashes):
+            return None
+        return n_rows
+
+    def needs_refit(self, new_values):
+        """
+        :param new_values: numpy array of the appended rows
+        :return: whether or not the appended rows are too many or too different from the fitted ones to be transformed
+        """
+        n_appended = len(self.embedding) - self.n_fitted + len(new_values)
+        if n_appended > PROJECTION_REFIT_APPENDED_RATIO * self.n_fitted:
+            return True
+        drift = np.max(np.abs(new_values.mean(axis=0) - self.mean) / self.std)
+        return drift > PROJECTION_REFIT_DRIFT
+
+    def extend(self, data, n_existing):
+        """
+        :param data: new version of the dataset, the projected rows followed by the appended ones
+        :param n_existing: number of rows already projected
+        :return: ProjectionModel including the appended rows, the embedding of the existing rows is unchanged
+        """
+        new_embedding = np.asarray(self.model.transform(data.values[n_existing:]), dtype=np.float64)
+        return ProjectionModel(self.model, get_row_hashes(data), np.vstack([self.embedding, new_embedding]),
+                               self.mean, self.std, self.n_fitted)
+
+
+_projection_pool = None
+_projection_pool_lock = threading.Lock()
+
+
+def get_projection_pool():
+    """
+    Get the process pool shared by all the sessions of the process to compute the slow projections
+    return: executor
+    """
+    global _projection_pool
+    if _projection_pool is None:
+        with _projection_pool_lock:
+            if _projection_pool is None:
+                # spawn rather than fork, the server process runs threads. The workers only import this module
+                _projection_pool = ProcessPoolExecutor(max_workers=PROJECTION_PROCESS_POOL_MAX_WORKERS,
+                                                       mp_context=multiprocessing.get_context("spawn"))
+    return _projection_pool
+
+
+class ProjectionCache(object):
+    """
+    Cache of the 2D projections of the datasets, shared by all the sessions of the process
+
+    A projection is identified by the fingerprint of the dataset, the method and its hyperparameters, so switching
+    back to an already computed method or dataset is instant.
+    """
+
+    def __init__(self, max_entries=PROJECTION_CACHE_MAX_ENTRIES, max_models=PROJECTION_MODEL_CACHE_MAX_ENTRIES):
+        """
+        :param max_entries: maximum number of projections kept in memory
+        :param max_models: maximum number of fitted models kept in memory
+        """
+        self.max_entries = max_entries
+        self.max_models = max_models
+        self._entries = OrderedDict()
+        # key -> [job, future given to the sessions, number of sessions waiting for it] of the running projections
+        self._pending = {}
+        # (dataset_id, method) -> (params, ProjectionModel) of the last fit of the dataset, the one the next version
+        # of the dataset is extended from
+        self._models = OrderedDict()
+        # Reentrant, cancelling a job runs its callback on the calling thread
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def get_key(fingerprint, method, params):
+        return fingerprint, method, tuple(sorted(params.items()))
+
+    def get(self, key):
+        with self._lock:
+            projection = self._entries.get(key)
+            if projection is not None:
+                self._entries.move_to_end(key)
+        return projection
+
+    def set(self, key, projection):
+        # The projections are shared, they are never modified in place
+        projection.setflags(write=False)
+        with self._lock:
+            self._entries[key] = projection
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_model(self, model_key):
+        """
+        :param model_key: (dataset_id, method, params)
+        :return: ProjectionModel of the last fit of the dataset with these params, None if there is none
+        """
+        with self._lock:
+            entry = self._models.get(model_key[:2])
+            if entry is None or entry[0] != model_key[2]:
+                return None
+            self._models.move_to_end(model_key[:2])
+        return entry[1]
+
+    def set_model(self, model_key, projection_model):
+        with self._lock:
+            # Only the last fit of a dataset and method is kept, whatever its params
+            self._models[model_key[:2]] = (model_key[2], projection_model)
+            self._models.move_to_end(model_key[:2])
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+
+    def get_projection(self, data, method, params):
+        """
+        :param data: pandas dataframe of the features
+        :param method: "PCA", "T-SNE" or "UMAP"
+        :param params: hyperparameters given by get_projection_params
+        :return: read-only numpy array (n_samples, 2)
+        """
+        key = self.get_key(get_dataset_fingerprint(data), method, params)
+        projection = self.get(key)
+        if projection is None:
+            logger.info(f"computing {method} projection {params}")
+            projection = np.asarray(compute_projection(data.values, method, params), dtype=np.float64)
+            self.set(key, projection)
+        return projection
+
+    def submit_projection(self, data, method, params, dataset_id=None):
+        """
+        Same as get_projection, but the slow methods are computed on the process pool. Sessions asking for a projection
+        already running wait for the same job. Each call must be matched by a call to release
+
+        With a dataset_id, the fitted model of the transform methods is kept, and when rows are appended to the
+        dataset they are transformed instead of refitting everything, unless there are too many of them or their
+        distribution has drifted. The existing rows then keep their position in the projection.
+
+        :param data: pandas dataframe of the features
+        :param method: "PCA", "T-SNE" or "UMAP"
+        :param params: hyperparameters given by get_projection_params
+        :param dataset_id: name of the dataset, whose successive versions share a fitted model
+        :return: (key, future of the read-only numpy array (n_samples, 2))
+        """
+        key = self.get_key(get_dataset_fingerprint(data), method, params)
+        projection = self.get(key)
+        if projection is None and method not in PROCESS_POOL_METHODS:
+            projection = self.get_projection(data, method, params)
+        if projection is not None:
+            future = Future()
+            future.set_result(projection)
+            return key, future
+
+        model_key = (dataset_id, method, tuple(sorted(params.items()))) if dataset_id is not None else None
+        with self._lock:
+            if key in self._pending:
+                self._pending[key][2] += 1
+                return key, self._pending[key][1]
+            result = Future()
+            job = self.submit_transform(model_key, data) if method in TRANSFORM_METHODS else None
+            if job is not None:
+                on_done = partial(self.on_transform_done, key, model_key)
+            else:
+                logger.info(f"submitting {method} projection {params}")
+                job = get_projection_pool().submit(fit_projection, data.values, method, params)
+                on_done = partial(self.on_projection_done, key, model_key, data)
+            self._pending[key] = [job, result, 1]
+        job.add_done_callback(on_done)
+        return key, result
+
+    def submit_transform(self, model_key, data):
+        """
+        :return: future of the transform of the appended rows on the query executor, None if a full fit is needed
+        """
+        projection_model = self.get_model(model_key)
+        if projection_model is None:
+            return None
+        n_existing = projection_model.get_n_existing_rows(get_row_hashes(data))
+        if n_existing is None or projection_model.needs_refit(data.values[n_existing:].astype(np.float64)):
+            return None
+        logger.info(f"transforming {len(data) - n_existing} new rows with the {model_key[1]} projection")
+        return get_query_executor().submit(projection_model.extend, data, n_existing)
+
+    def pop_pending(self, key):
+        with self._lock:
+            entry = self._pending.pop(key, None)
+        return entry[1] if entry is not None else Future()
+
+    def on_projection_done(self, key, model_key, data, future):
+        result = self.pop_pending(key)
+        if future.cancelled():
+            result.cancel()
+            return
+        if future.exception() is not None:
+            logger.error(f"projection {key[1:]} failed: {str(future.exception())}")
+            result.set_exception(future.exception())
+            return
+        model, projection = future.result()
+        projection = np.asarray(projection, dtype=np.float64)
+        if model is not None and model_key is not None:
+            self.set_model(model_key, ProjectionModel.from_fit(model, data, projection))
+        # Cached even if the sessions waiting for it have moved on, switching back to it is then instant
+        self.set(key, projection)
+        result.set_result(projection)
+
+    def on_transform_done(self, key, model_key, future):
+        result = self.pop_pending(key)
+        if future.cancelled():
+            result.cancel()
+            return
+        if future.exception() is not None:
+            logger.error(f"transform {key[1:]} failed: {str(future.exception())}")
+            result.set_exception(future.exception())
+            return
+        projection_model = future.result()
+        self.set_model(model_key, projection_model)
+        self.set(key, projection_model.embedding)
+        result.set_result(projection_model.embedding)
+
+    def release(self, key):
+        """
+        Stop waiting for a projection given by submit_projection. The job is cancelled if no other session waits for it
+        and it has not started yet, a running job is left to complete and cached
+        """
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                return
+            entry[2] -= 1
+            if entry[2] <= 0:
+                # The job callback then cancels the future given to the sessions
+                entry[0].cancel()
+
+    def precompute(self, datasets, methods=PROJECTION_METHODS):
+        """
+        Compute the projections of the datasets with the default hyperparameters, the slow methods in the background
+        on the process pool
+        :param datasets: list of pandas dataframes of the features
+        :param methods: projection methods to compute
+        """
+        for data in datasets:
+            for method in methods:
+                params = get_projection_params(method, **DEFAULT_PROJECTION_PARAMS.get(method, {}))
+                try:
+                    self.submit_projection(data, method, params)
+                except Exception as e:
+                    logger.warning(f"could not precompute the {method} projection: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self._models = OrderedDict()
+
+
+projection_cache = ProjectionCache()
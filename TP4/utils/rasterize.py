@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+from bokeh.colors import named
+
+# Alpha of the pixels holding a single point, the most crowded pixel is opaque
+RASTER_MIN_ALPHA = 80
+
+
+def color_to_rgb(color):
+    """
+    :param color: "#RRGGBB" string or named CSS color
+    :return: (red, green, blue) integers
+    """
+    if color.startswith("#"):
+        return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+    rgb = getattr(named, color.lower()).to_rgb()
+    return rgb.r, rgb.g, rgb.b
+
+
+def get_pixel_indices(x, y, x_range, y_range, width, height):
+    """
+    :return: (flat pixel index of each point inside the ranges, boolean mask of those points)
+    """
+    x_start, x_end = x_range
+    y_start, y_end = y_range
+    x_scale = width / (x_end - x_start) if x_end > x_start else 0
+    y_scale = height / (y_end - y_start) if y_end > y_start else 0
+    columns = np.floor((x - x_start) * x_scale)
+    rows = np.floor((y - y_start) * y_scale)
+    # Points on the end of the ranges are drawn on the last pixel
+    columns[x == x_end] = width - 1
+    rows[y == y_end] = height - 1
+    # Compared as floats, NaN and infinite coordinates are outside and never cast to integers
+    inside = (columns >= 0) & (columns < width) & (rows >= 0) & (rows < height)
+    return rows[inside].astype(np.int64) * width + columns[inside].astype(np.int64), inside
+
+
+def rasterize_points(x, y, colors, x_range, y_range, width, height):
+    """
+    Aggregate points into an image, like datashader does for categorical data : the color of a pixel is the mean of
+    the colors of its points, and its opacity grows with the log of their number
+    :param x: float numpy array
+    :param y: float numpy array
+    :param colors: numpy array of the color of each point, see color_to_rgb
+    :param x_range: (start, end) of the x axis covered by the image
+    :param y_range: (start, end) of the y axis covered by the image
+    :param width: number of columns of the image
+    :param height: number of rows of the image, the first one being the bottom like in bokeh image_rgba
+    :return: uint32 numpy array of shape (height, width), RGBA pixels for bokeh image_rgba
+    """
+    n_pixels = width * height
+    pixels, inside = get_pixel_indices(x, y, x_range, y_range, width, height)
+
+    codes, uniques = pd.factorize(colors[inside])
+    palette = np.array([color_to_rgb(color) for color in uniques], dtype=np.float64).reshape(-1, 3)
+    counts = np.bincount(pixels, minlength=n_pixels).astype(np.float64)
+
+    image = np.zeros((n_pixels, 4), dtype=np.uint8)
+    filled = counts > 0
+    if filled.any():
+        for channel in range(3):
+            sums = np.bincount(pixels, weights=palette[codes, channel], minlength=n_pixels)
+            image[filled, channel] = np.round(sums[filled] / counts[filled])
+        alpha = np.log1p(counts[filled]) / np.log1p(counts.max())
+        image[filled, 3] = np.round(RASTER_MIN_ALPHA + (255 - RASTER_MIN_ALPHA) * alpha)
+    return image.view(np.uint32).reshape(height, width)
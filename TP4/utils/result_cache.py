@@ -0,0 +1,166 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from logzero import logger
+
+from TP4.constants.constants import RESULT_CACHE_EXPIRY_SECONDS, RESULT_CACHE_MAX_BYTES
+from TP4.utils.cache_codec import codec
+from TP4.utils.gcp import get_dfs_from_redis, get_redis, set_values_to_redis
+
+RESULT_CACHE_PREFIX = "result"
+
+
+def normalize_filters(filters):
+    """
+    Put the filters in a canonical form, so that the same selection always gives the same cache key
+    whatever the order of the keys or of the selected values
+    :param filters: dict of selector filters
+    :return: normalized dict of filters
+    """
+    normalized = {}
+    for key in sorted(filters):
+        value = filters[key]
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(value, key=str)
+        normalized[key] = value
+    return normalized
+
+
+def get_result_cache_key(**key_parts):
+    """
+    :param key_parts: everything the result of a query depends on (dashboard, tenant, currency, filters, ...)
+    :return: redis key of the result
+    """
+    for key, value in key_parts.items():
+        if isinstance(value, dict):
+            key_parts[key] = normalize_filters(value)
+    string_key = json.dumps(key_parts, sort_keys=True, default=str)
+    return f"{RESULT_CACHE_PREFIX}:{hashlib.sha256(string_key.encode('utf-8')).hexdigest()}"
+
+
+def get_frames(data):
+    """
+    :param data: result of a get_data function, a dataframe or a list / dict of dataframes
+    :return: (structure, dict {name: dataframe}), structure is None if the data can not be cached
+    """
+    if isinstance(data, pd.DataFrame):
+        return {"type": "df", "keys": ["0"]}, {"0": data}
+    if isinstance(data, list) and all(isinstance(df, pd.DataFrame) for df in data):
+        keys = [str(index) for index in range(len(data))]
+        return {"type": "list", "keys": keys}, dict(zip(keys, data))
+    if isinstance(data, dict) and all(isinstance(k, str) and isinstance(df, pd.DataFrame) for k, df in data.items()):
+        return {"type": "dict", "keys": list(data.keys())}, dict(data)
+    return None, {}
+
+
+def build_data(structure, frames):
+    """
+    Inverse of get_frames
+    """
+    if structure["type"] == "df":
+        return frames[0]
+    if structure["type"] == "list":
+        return list(frames)
+    return dict(zip(structure["keys"], frames))
+
+
+def get_size(frames):
+    return sum(int(df.memory_usage(index=True, deep=True).sum()) for df in frames)
+
+
+class ResultCache(object):
+    """
+    Two tier cache of query results : an in-process LRU capped in bytes, then redis shared by all the processes
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, expiry_seconds=RESULT_CACHE_EXPIRY_SECONDS):
+        """
+        :param max_bytes: maximum size of the in-process tier
+        :param expiry_seconds: expiry of the redis tier
+        """
+        self.max_bytes = max_bytes
+        self.expiry_seconds = expiry_seconds
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :param key: result cache key
+        :return: cached data, None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            entry = self.get_from_redis(key)
+            if entry is None:
+                return None
+            self.put_in_memory(key, *entry)
+        structure, frames = entry[0], entry[1]
+        # Deep copies, the cached frames are shared by all the sessions and get_data results are modified in place
+        return build_data(structure, [df.copy() for df in frames])
+
+    def set(self, key, data, tags=None):
+        """
+        :param key: result cache key
+        :param data: result of a get_data function
+        :param tags: dict {tag: value} used to invalidate the redis entry, e.g. {"tenant": "101015"}
+        """
+        structure, frames = get_frames(data)
+        if structure is None:
+            return
+        # Copied so that the caller can go on modifying its data without altering the cached one
+        frames = [frames[name].copy() for name in structure["keys"]]
+        self.put_in_memory(key, structure, frames)
+        self.set_to_redis(key, structure, frames, tags)
+
+    def put_in_memory(self, key, structure, frames):
+        size = get_size(frames)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[2]
+            self._entries[key] = (structure, frames, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def get_from_redis(self, key):
+        try:
+            structure = get_redis().get(key)
+            if structure is None:
+                return None
+            structure = json.loads(structure)
+            frames = get_dfs_from_redis([f"{key}:{name}" for name in structure["keys"]])
+        except Exception as e:
+            logger.warning(f"result cache unavailable: {str(e)}")
+            return None
+        if any(isinstance(df, str) for df in frames):
+            return None
+        return structure, frames
+
+    def set_to_redis(self, key, structure, frames, tags=None):
+        try:
+            values = {}
+            for name, df in zip(structure["keys"], frames):
+                values.update(codec.encode(f"{key}:{name}", df))
+            # The structure is written last so that it is never visible without its frames
+            values[key] = json.dumps(structure)
+            set_values_to_redis(values, get_redis(), self.expiry_seconds, tags=tags)
+        except Exception as e:
+            logger.warning(f"could not cache result in redis: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self._size = 0
+
+
+result_cache = ResultCache()
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+from TP4.modules.baseline import Baseline
+from TP4.utils.baseline_cache import BaselineCache, baseline_cache
+
+ARGS = {"als_lambda": 1e4, "als_weighting": 0.05}
+
+
+def get_sales(n_items=20, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for item in range(n_items):
+        length = int(rng.integers(1, 60))
+        frames.append(pd.DataFrame({
+            "ITEM": float(item),
+            "DATE": pd.date_range("2020-01-05", periods=length, freq="W"),
+            "SALES": np.where(rng.random(length) > 0.05, rng.gamma(2, 100, length), 0),
+            "QUANTITY": rng.gamma(2, 10, length),
+            "PROMOS": (rng.random(length) > 0.8).astype(int),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def assert_same_as_single_series(df, result):
+    for item, series in df.groupby("ITEM", dropna=False):
+        expected = Baseline(series.copy(), args=ARGS).result
+        rows = result[result["ITEM"].isna()] if pd.isna(item) else result[result["ITEM"] == item]
+        assert len(rows) == len(expected)
+        for column in ["sales", "quantity", "promo", "baseline", "baseline_quantity"]:
+            np.testing.assert_allclose(rows[column].to_numpy(), expected[column].to_numpy(), rtol=1e-9, atol=1e-9)
+
+
+def test_batch_is_the_same_as_single_series():
+    df = get_sales().sample(frac=1, random_state=0)
+    assert_same_as_single_series(df, Baseline.baselinedetection_batch(df, "ITEM", ARGS))
+
+
+def test_batch_interpolates_missing_sales():
+    df = get_sales()
+    df.loc[df["ITEM"] == 3, "PROMOS"] = 0
+    df.loc[df.index[df["ITEM"] == 3][5], "SALES"] = np.nan
+    result = Baseline.baselinedetection_batch(df, "ITEM", ARGS)
+    assert not result.loc[result["ITEM"] == 3, "baseline"].isna().any()
+    assert_same_as_single_series(df, result)
+
+
+def test_batch_keeps_missing_keys():
+    df = get_sales()
+    df.loc[df["ITEM"] == 2, "ITEM"] = np.nan
+    assert_same_as_single_series(df, Baseline.baselinedetection_batch(df, "ITEM", ARGS))
+
+
+def get_series(length, seed=1):
+    rng = np.random.default_rng(seed)
+    dates = np.asarray(pd.date_range("2020-01-05", periods=length, freq="W"))
+    return dates, np.vstack([rng.gamma(2, 100, length), rng.gamma(2, 10, length)])
+
+
+def fit_cold_counter(calls):
+    def fit_cold(cold_values):
+        calls.append(len(cold_values))
+        return BaselineCache().fit([(None, np.arange(values.shape[1]), values) for values in cold_values],
+                                   ARGS["als_lambda"], ARGS["als_weighting"])
+    return fit_cold
+
+
+def test_cache_warm_start_matches_a_cold_fit():
+    dates, values = get_series(120)
+    cache = BaselineCache()
+    cache.fit([("item", dates[:100], values[:, :100])], ARGS["als_lambda"], ARGS["als_weighting"])
+    calls = []
+    warm = cache.fit([("item", dates, values)], ARGS["als_lambda"], ARGS["als_weighting"],
+                     fit_cold=fit_cold_counter(calls))[0]
+    # Warm started from the fit of the first 100 weeks, not refitted from scratch
+    assert calls == []
+    cold = BaselineCache().fit([("item", dates, values)], ARGS["als_lambda"], ARGS["als_weighting"])[0]
+    np.testing.assert_allclose(warm, cold, rtol=1e-6, atol=1e-6)
+
+
+def test_cache_returns_the_fit_of_an_unchanged_series_and_refits_a_changed_one():
+    dates, values = get_series(60)
+    cache = BaselineCache()
+    first = cache.fit([("item", dates, values)], ARGS["als_lambda"], ARGS["als_weighting"])[0]
+    calls = []
+    fit_cold = fit_cold_counter(calls)
+    assert cache.fit([("item", dates, values.copy())], ARGS["als_lambda"], ARGS["als_weighting"],
+                     fit_cold=fit_cold)[0] is first
+    assert calls == []
+
+    changed = values.copy()
+    changed[0, 10] *= 2
+    refitted = cache.fit([("item", dates, changed)], ARGS["als_lambda"], ARGS["als_weighting"], fit_cold=fit_cold)[0]
+    assert calls == [1]
+    expected = BaselineCache().fit([("item", dates, changed)], ARGS["als_lambda"], ARGS["als_weighting"])[0]
+    np.testing.assert_allclose(refitted, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_cache_eviction_and_invalidate_keep_the_latest_fits_consistent():
+    cache = BaselineCache(max_entries=2)
+    for series_id in ["a", "b", "c"]:
+        dates, values = get_series(30, seed=len(series_id) + ord(series_id))
+        cache.fit([(series_id, dates, values)], ARGS["als_lambda"], ARGS["als_weighting"])
+    assert cache.get_latest("a", ARGS["als_lambda"], ARGS["als_weighting"]) is None
+    assert set(cache._latest.values()) == set(cache._entries)
+    assert len(cache._entries) == 2
+
+    cache.invalidate("b")
+    assert cache.get_latest("b", ARGS["als_lambda"], ARGS["als_weighting"]) is None
+    assert cache.get_latest("c", ARGS["als_lambda"], ARGS["als_weighting"]) is not None
+    assert set(cache._latest.values()) == set(cache._entries)
+    cache.invalidate()
+    assert len(cache._entries) == 0 and len(cache._latest) == 0
+
+
+def test_incremental_batch_and_series_id_match_the_uncached_baselines():
+    baseline_cache.invalidate()
+    df = get_sales(n_items=8)
+    first_weeks = df.groupby("ITEM", group_keys=False).apply(lambda series: series.iloc[:-3])
+    Baseline.baselinedetection_batch(first_weeks, "ITEM", ARGS, incremental=True)
+    # Warm started from the first weeks, then returned from the cache
+    for _ in range(2):
+        result = Baseline.baselinedetection_batch(df, "ITEM", ARGS, incremental=True)
+        expected = Baseline.baselinedetection_batch(df, "ITEM", ARGS)
+        for column in ["baseline", "baseline_quantity"]:
+            np.testing.assert_allclose(result[column].to_numpy(), expected[column].to_numpy(), rtol=1e-6, atol=1e-6)
+
+    series = df[df["ITEM"] == 1].copy()
+    cached = Baseline(series.copy(), args=ARGS, series_id="item-1").result
+    np.testing.assert_allclose(cached["baseline"], Baseline(series.copy(), args=ARGS).result["baseline"],
+                               rtol=1e-6, atol=1e-6)
+    baseline_cache.invalidate()
@@ -0,0 +1,41 @@
+import pandas as pd
+
+from TP4.constants.constants import DATATABLE_PAGE_SIZE
+from TP4.modules.datatable import DataTablePlot
+
+
+def get_table():
+    table = DataTablePlot({"name": [None], "sales": ["number"]}, "Table", page_size=2)
+    table.update_data(pd.DataFrame({"name": ["a", "b", "ab", "c", "abc"], "sales": [5, 1, 4, 3, 2]}))
+    return table
+
+
+def test_remote_pagination_defaults_to_the_page_size_setting():
+    assert DataTablePlot({"sales": ["number"]}, "Table", pagination="remote").page_size == DATATABLE_PAGE_SIZE
+    assert DataTablePlot({"sales": ["number"]}, "Table").page_size is None
+
+
+def test_sort_filter_and_page_clamping():
+    table = get_table()
+    table.set_filter("name", "A")
+    table.set_sort("sales", ascending=False)
+    assert list(table.source.data["name"]) == ["a", "ab"]
+    table.set_page(10)
+    assert table.page == 1
+    assert list(table.source.data["name"]) == ["abc"]
+
+    table.set_filter("sales", ">=4")
+    assert table.page == 0
+    assert list(table.source.data["sales"]) == [5, 4]
+    table.set_filter("sales", "<bad")
+    assert list(table.source.data["sales"]) == []
+    assert table.page_text.object == "Page 1 / 1 (0 rows)"
+
+
+def test_filter_value_follows_the_filtered_column():
+    table = get_table()
+    table.filter_input.value = "3"
+    assert list(table.source.data["name"]) == []
+    table.filter_select.value = "sales"
+    assert table.filters == {"sales": "3"}
+    assert list(table.source.data["name"]) == ["c"]
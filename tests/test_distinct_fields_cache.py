@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+from TP4.utils import distinct_fields_cache as distinct_fields_cache_module
+from TP4.utils import gcp
+from TP4.utils.distinct_fields_cache import DistinctFieldsCache
+
+
+def test_unknown_version_is_not_cached(monkeypatch):
+    monkeypatch.setattr(distinct_fields_cache_module, "get_df_from_redis", lambda key: ("Empty", None, None))
+    cache = DistinctFieldsCache()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return pd.DataFrame({"brand": ["a"]})
+
+    cache.get("key", load, lambda: None)
+    cache.get("key", load, lambda: None)
+    assert len(loads) == 2
+    cache.get("key", load, lambda: "2024-01-01")
+    cache.get("key", load, lambda: "2024-01-01")
+    assert len(loads) == 3
+
+
+def test_table_version_is_resolved_and_changed_by_invalidation(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(gcp, "get_redis", lambda: client)
+    cache = DistinctFieldsCache(check_seconds=0)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return pd.DataFrame({"brand": ["a"]})
+
+    def get_version():
+        return gcp.get_table_version_from_redis("ABT_FLAT")
+
+    tags = {"table": "ABT_FLAT", "country": "FRA"}
+    key = DistinctFieldsCache.get_key("ABT_FLAT", "FRA", "", "Global", ["brand"])
+    version = get_version()
+    assert version is not None
+    cache.get(key, load, get_version, tags=tags)
+    cache.refresh(key, load, get_version, tags=tags)
+    assert len(loads) == 1
+
+    gcp.invalidate_redis_tags({"table": "ABT_FLAT"})
+    assert get_version() != version
+    cache.refresh(key, load, get_version, tags=tags)
+    assert len(loads) == 2
@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+from bokeh.models import DatetimeTickFormatter, HoverTool, Range1d
+
+from TP4.modules.lineplot import LinePlot
+
+
+def test_dates_are_shown_on_a_datetime_axis():
+    plot = LinePlot(None, "Sales", ["pan"], "red", 1, 2, tooltips=[("Week", "@x"), ("Sales", "@y")], max_points=50)
+    dates = pd.date_range("2020-01-05", periods=1000, freq="D")
+    plot.update_data(dates.astype(str).tolist(), np.arange(1000))
+
+    assert isinstance(plot.figure.x_range, Range1d)
+    assert all(isinstance(axis.formatter, DatetimeTickFormatter) for axis in plot.figure.xaxis)
+    assert np.issubdtype(np.asarray(plot.source.data["x"]).dtype, np.datetime64)
+    for hover in plot.figure.select(HoverTool):
+        assert hover.tooltips[0] == ("Week", "@x{%F}")
+        assert hover.formatters["@x"] == "datetime"
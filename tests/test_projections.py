@@ -0,0 +1,14 @@
+from TP4.utils.projections import ProjectionCache
+
+
+def test_models_keep_the_last_fit_of_each_dataset():
+    cache = ProjectionCache(max_models=2)
+    cache.set_model(("sales", "UMAP", (("n_neighbors", 15),)), "first")
+    cache.set_model(("sales", "UMAP", (("n_neighbors", 30),)), "second")
+    assert cache.get_model(("sales", "UMAP", (("n_neighbors", 15),))) is None
+    assert cache.get_model(("sales", "UMAP", (("n_neighbors", 30),))) == "second"
+
+    cache.set_model(("stores", "UMAP", ()), "stores")
+    cache.set_model(("items", "UMAP", ()), "items")
+    assert cache.get_model(("sales", "UMAP", (("n_neighbors", 30),))) is None
+    assert len(cache._models) == 2
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from TP4.modules.base import query_plan as query_plan_module
+from TP4.modules.base.query_plan import QueryPlan
+
+
+class State(object):
+    """
+    Runs the scheduled callbacks at once, as a panel server would on its next tick
+    """
+
+    @staticmethod
+    def execute(callback, schedule=False):
+        callback()
+
+
+@pytest.fixture(autouse=True)
+def panel_state(monkeypatch):
+    monkeypatch.setattr(query_plan_module.pn, "state", State())
+
+
+def fail(filters):
+    raise RuntimeError("query failed")
+
+
+def get_plan(updated):
+    plan = QueryPlan()
+    ok = plan.query(lambda filters: filters["value"])
+    failed = plan.query(fail)
+    dependent = plan.query(lambda filters, value: value + 1, depends_on=[failed])
+    plan.panel(lambda value: updated.append(("ok", value)), ok)
+    plan.panel(lambda value: updated.append(("failed", value)), failed)
+    plan.panel(lambda value, other: updated.append(("dependent", value)), dependent, ok)
+    return plan, ok
+
+
+@pytest.mark.parametrize("run", [
+    lambda plan, on_error: plan.execute({"value": 1}, on_error=on_error),
+    lambda plan, on_error: asyncio.run(plan.execute_async({"value": 1}, on_error=on_error)),
+])
+def test_failed_query_only_fails_its_panels(run):
+    updated, errors = [], []
+    plan, ok = get_plan(updated)
+    results = run(plan, lambda panel, e: errors.append(str(e)))
+    assert results == {ok: 1}
+    assert updated == [("ok", 1)]
+    assert errors == ["query failed", "query failed"]
+
+
+def test_failed_query_raises_without_on_error():
+    plan, _ = get_plan([])
+    with pytest.raises(RuntimeError):
+        plan.execute({"value": 1})
+
+
+class Queries(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def query_value(self, filters):
+        self.calls += 1
+        return filters["value"]
+
+
+def test_cache_key_is_stable_across_instances():
+    first, second = QueryPlan(), QueryPlan()
+    first_node = first.query(Queries().query_value, 1)
+    second_node = second.query(Queries().query_value, 1)
+    assert first_node.key != second_node.key
+    assert first_node.get_cache_key() == second_node.get_cache_key()
+    assert first.query(lambda filters: None).get_cache_key() is None
+
+
+def test_execute_runs_the_queries_with_run():
+    queries = Queries()
+    plan = QueryPlan()
+    node = plan.query(queries.query_value)
+    cache = {}
+
+    def run(node, filters, dependency_results):
+        if node.get_cache_key() not in cache:
+            cache[node.get_cache_key()] = node.run(filters, dependency_results)
+        return cache[node.get_cache_key()]
+
+    assert plan.execute({"value": 1}, run=run) == {node: 1}
+    assert plan.execute({"value": 1}, run=run) == {node: 1}
+    assert queries.calls == 1
@@ -0,0 +1,15 @@
+import warnings
+
+import numpy as np
+
+from TP4.utils.rasterize import rasterize_points
+
+
+def test_non_finite_points_are_skipped_without_warnings():
+    x = np.array([0.5, np.nan, np.inf, 1.0, -np.inf, 1e300])
+    y = np.array([0.5, 0.2, 0.3, np.nan, 0.1, 0.5])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        image = rasterize_points(x, y, np.array(["red"] * len(x), dtype=object), (0, 1), (0, 1), 4, 4)
+    assert (image > 0).sum() == 1
+    assert image[2, 2] > 0
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from TP4.utils import gcp
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(gcp, "get_redis", lambda: client)
+    return client
+
+
+def test_expired_members_are_pruned(redis_client, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(gcp.time, "time", lambda: now)
+    gcp.set_values_to_redis({"old": b"1"}, redis_client, 10, tags={"tenant": "a"})
+    gcp.set_values_to_redis({"other": b"1"}, redis_client, 10, tags={"tenant": "b"})
+    assert sorted(gcp.get_redis_keys_from_tags({"tenant": "a"})) == [b"old"]
+
+    monkeypatch.setattr(gcp.time, "time", lambda: now + 20)
+    assert gcp.get_redis_keys_from_tags({"tenant": "a"}) == []
+    gcp.set_values_to_redis({"new": b"1"}, redis_client, 10, tags={"tenant": "a"})
+    assert gcp.get_redis_keys_from_tags({"tenant": "a"}) == [b"new"]
+    assert [key for key, _ in redis_client.zscan_iter(gcp.get_namespace_keys_set())] == [b"new"]
+    # The tag set which is not written anymore is only swept on invalidation, not on the write and read paths
+    assert redis_client.exists(gcp.get_tag_set("tenant", "b"))
+    assert gcp.invalidate_redis_tags({"tenant": "c"}) == 0
+    assert not redis_client.exists(gcp.get_tag_set("tenant", "b"))
+    assert [key for key, _ in redis_client.zscan_iter(gcp.get_namespace_tags_set())] == [
+        gcp.get_tag_set("tenant", "a").encode()]
+
+
+def test_invalidate_and_flush(redis_client):
+    gcp.set_values_to_redis({"k1": b"1", "k2": b"2"}, redis_client, 60, tags={"tenant": "a", "table": "t"})
+    gcp.set_values_to_redis({"k3": b"3"}, redis_client, 60, tags={"tenant": "a", "table": "u"})
+    assert gcp.invalidate_redis_tags({"tenant": "a", "table": "t"}) == 2
+    assert redis_client.get("k1") is None and redis_client.get("k3") == b"3"
+    assert gcp.get_redis_keys_from_tags({"tenant": "a"}) == [b"k3"]
+
+    gcp.flush_namespace()
+    assert redis_client.keys("*") == []
@@ -0,0 +1,16 @@
+import pandas as pd
+
+from TP4.utils.result_cache import ResultCache
+
+
+def test_cached_frames_are_not_shared(monkeypatch):
+    cache = ResultCache()
+    monkeypatch.setattr(cache, "set_to_redis", lambda *args, **kwargs: None)
+    df = pd.DataFrame({"a": [1, 2]})
+    cache.set("key", [df])
+    df.loc[0, "a"] = 10
+
+    first = cache.get("key")[0]
+    first.loc[1, "a"] = 20
+    first["b"] = 0
+    assert cache.get("key")[0].equals(pd.DataFrame({"a": [1, 2]}))
@@ -0,0 +1,36 @@
+import asyncio
+
+import param
+
+from TP4.modules.base.base_selector import BaseDynamicSelector
+
+
+class Selector(BaseDynamicSelector):
+    cascade_fields = [["classes", "category", "brand"]]
+
+    def __init__(self):
+        param.Parameterized.__init__(self)
+        self.selection_fields = {field: {"type": "mono"} for field in ["classes", "category", "brand"]}
+        self._cascade_debouncers = {}
+        self._cascading = False
+        self.updates = []
+
+    def update_field(self, list_field_to_update, list_field_parent):
+        self.updates.append((list_field_to_update, list_field_parent))
+        # Setting the updated fields does not start another cascade
+        self.param.update(brand="b")
+
+
+def test_cascade_runs_once_for_the_first_changed_field():
+    async def change_fields():
+        selector = Selector()
+        selector.watch_cascades()
+        selector.watch_cascades()
+        for debouncer in selector._cascade_debouncers.values():
+            debouncer.delay_ms = 10
+        selector.param.update(category="c")
+        selector.param.update(classes="a")
+        await asyncio.sleep(0.1)
+        return selector.updates
+
+    assert asyncio.run(change_fields()) == [(["category", "brand"], ["classes"])]
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from TP4.modules.datatable_plots.tabulator import TabulatorPlot
+
+
+def get_remote_table():
+    table = TabulatorPlot({"a": ["number"]}, "Table", pagination="remote")
+    return table, table.figure.get_root()
+
+
+def test_remote_update_data_renders_each_value():
+    table, model = get_remote_table()
+
+    table.update_data(pd.DataFrame({"a": [1, 2, 3, 4]}))
+    assert list(model.source.data["a"]) == [1, 2, 3, 4]
+
+    # Patched cell
+    table.update_data(pd.DataFrame({"a": [1, 99, 3, 4]}))
+    assert list(model.source.data["a"]) == [1, 99, 3, 4]
+
+    # Replaced value
+    table.update_data(pd.DataFrame({"a": [5, 6]}))
+    assert list(model.source.data["a"]) == [5, 6]
+
+
+def test_remote_update_data_does_not_modify_the_given_frame():
+    table, _ = get_remote_table()
+    df = pd.DataFrame({"a": [1, 2, 3, 4]})
+    table.update_data(df)
+    table.update_data(pd.DataFrame({"a": [1, 99, 3, 4]}))
+    assert list(df["a"]) == [1, 2, 3, 4]
+
+
+def test_remote_appended_rows_are_paged_and_sorted():
+    table = TabulatorPlot({"a": ["number"]}, "Table", pagination="remote", page_size=3)
+    model = table.figure.get_root()
+    table.update_data(pd.DataFrame({"a": [1, 2]}))
+    table.update_data(pd.DataFrame({"a": [1, 2, 3, 4]}))
+    assert list(model.source.data["a"]) == [1, 2, 3]
+    assert model.max_page == 2
+
+    table.figure.sorters = [{"field": "a", "dir": "desc"}]
+    assert list(model.source.data["a"]) == [4, 3, 2]
+    table.update_data(pd.DataFrame({"a": [1, 2, 3, 4, 5]}))
+    assert list(model.source.data["a"]) == [5, 4, 3]